@@ -0,0 +1,69 @@
+from config.config_handler import config
+from loguru import logger
+from typing import Dict
+import aio_pika
+import asyncio
+import json
+import uuid
+
+
+class RpcClient:
+    """
+    Request/reply over RabbitMQ for the online (synchronous) endpoints.
+
+    One connection and one exclusive, auto-deleted callback queue are shared
+    by all calls; replies are matched to the waiting call by correlation_id.
+    A request that times out is given the same expiration in RabbitMQ, so
+    the engine drops it instead of working on an answer nobody waits for.
+    """
+
+    def __init__(self):
+        self._connection = None
+        self._channel = None
+        self._callback_queue = None
+        self._futures: Dict[str, asyncio.Future] = {}
+
+    async def connect(self):
+        self._connection = await aio_pika.connect_robust(config["QUEUE_CONNECTION"])
+        self._channel = await self._connection.channel()
+        self._callback_queue = await self._channel.declare_queue(
+            exclusive=True, auto_delete=True
+        )
+        await self._callback_queue.consume(self._on_reply, no_ack=True)
+
+    async def close(self):
+        for future in self._futures.values():
+            future.cancel()
+        if self._connection is not None:
+            await self._connection.close()
+
+    async def _on_reply(self, message: aio_pika.IncomingMessage):
+        future = self._futures.pop(message.correlation_id, None)
+        if future is None:
+            logger.debug("Late RPC reply", correlation_id=message.correlation_id)
+            return
+        if not future.done():
+            future.set_result(json.loads(message.body.decode()))
+
+    async def call(self, body: Dict, routing_key: str, timeout: float) -> Dict:
+        """Publish body and wait for the reply, raises asyncio.TimeoutError."""
+        correlation_id = str(uuid.uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self._futures[correlation_id] = future
+        try:
+            await self._channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=json.dumps(body).encode(),
+                    correlation_id=correlation_id,
+                    reply_to=self._callback_queue.name,
+                    expiration=timeout,
+                    headers={"request_id": body.get("request_id")},
+                ),
+                routing_key=routing_key,
+            )
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            self._futures.pop(correlation_id, None)
+
+
+rpc_client = RpcClient()
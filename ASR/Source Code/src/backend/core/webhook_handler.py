@@ -1,83 +1,76 @@
-import requests
+import httpx
 from dbutils.schemas import WebhookStatus
 from dbutils import crud
 from config.config_handler import config
 from loguru import logger
 import json
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 base_url = f"{config['AIHIVE_ADDR']}/api/Request"
 
 
-def set_inprogress(db: Session, request_id: str) -> bool:
+async def _put(
+    client: httpx.AsyncClient,
+    db: AsyncSession,
+    request_id: str,
+    name: str,
+    increase_retry: bool = True,
+    **kwargs,
+) -> bool:
     url = base_url + f"/{request_id}"
     headers = {"Accept": "*/*"}
-    params = {"status": WebhookStatus.in_progress.value, "output": "{}"}
-    response = requests.put(url, params=params, headers=headers)
-    crud.set_webhook_result(
+    try:
+        response = await client.put(url, headers=headers, **kwargs)
+    except httpx.HTTPError as e:
+        logger.warning(f"Webhook-{name}", request_id=request_id, error=repr(e))
+        await crud.set_webhook_result(
+            db=db,
+            request_id=request_id,
+            webhook_status_code=None,
+            increase_retry=increase_retry,
+        )
+        return False
+    await crud.set_webhook_result(
         db=db,
         request_id=request_id,
         webhook_status_code=response.status_code,
-        increase_retry=False,
+        increase_retry=increase_retry,
     )
-    # response.raise_for_status()
     if response.status_code == 200:
-        logger.info(
-            "Webhook-set_inprogress",
-            status_code=response.status_code,
-        )
+        logger.debug(f"Webhook-{name}", status_code=response.status_code)
         return True
     else:
         logger.warning(
-            "Webhook-set_inprogress",
+            f"Webhook-{name}",
             status_code=response.status_code,
             content=response.content,
         )
         return False
 
 
-def set_completed(db: Session, request_id: str, text: str) -> bool:
-    url = base_url + f"/{request_id}"
-    result = {"text": text}
-    headers = {"Accept": "*/*"}
-    params = {"status": WebhookStatus.completed.value, "output": json.dumps(result)}
-    response = requests.put(url, params=params, headers=headers)
-    crud.set_webhook_result(
-        db=db, request_id=request_id, webhook_status_code=response.status_code
+async def set_inprogress(
+    client: httpx.AsyncClient, db: AsyncSession, request_id: str
+) -> bool:
+    params = {"status": WebhookStatus.in_progress.value, "output": "{}"}
+    return await _put(
+        client, db, request_id, "set_inprogress", increase_retry=False, params=params
     )
-    # response.raise_for_status()
-    if response.status_code == 200:
-        logger.debug(
-            "Webhook-set_completed",
-            status_code=response.status_code,
-        )
-        return True
-    else:
-        logger.warning(
-            "Webhook-set_completed",
-            status_code=response.status_code,
-            content=response.content,
-        )
-        return False
 
 
-def set_failed(db: Session, request_id: str) -> bool:
-    url = base_url + f"/{request_id}"
-    headers = {"Accept": "*/*"}
+async def set_completed(
+    client: httpx.AsyncClient, db: AsyncSession, request_id: str
+) -> bool:
+    task = await crud.get_request(db=db, request_id=request_id)
+    result = {"text": task.result if task else None}
+    if task is not None and task.words is not None:
+        result["words"] = json.loads(task.words)
+    params = {"status": WebhookStatus.completed.value, "output": json.dumps(result)}
+    return await _put(client, db, request_id, "set_completed", params=params)
+
+
+async def set_failed(
+    client: httpx.AsyncClient, db: AsyncSession, request_id: str
+) -> bool:
     params = {"status": WebhookStatus.failed.value, "output": "{}"}
-    response = requests.put(url, params=params, headers=headers)
-    crud.set_webhook_result(
-        db=db, request_id=request_id, webhook_status_code=response.status_code
-    )
-    # response.raise_for_status()
-    if response.status_code == 200:
-        logger.debug("Webhook-set_failed", status_code=response.status_code)
-        return True
-    else:
-        logger.warning(
-            "Webhook-set_failed",
-            status_code=response.status_code,
-            content=response.content,
-        )
-        return False
+    return await _put(client, db, request_id, "set_failed", params=params)
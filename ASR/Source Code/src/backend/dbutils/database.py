@@ -1,31 +1,75 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from config.config_handler import config
 import os
 
 
-def _fk_pragma_on_connect(dbapi_con, con_record):
-    dbapi_con.execute("pragma foreign_keys=ON")
+def _sqlite_pragma_on_connect(dbapi_con, con_record):
+    # WAL lets status reads run while results are being written
+    cursor = dbapi_con.cursor()
+    cursor.execute("pragma foreign_keys=ON")
+    cursor.execute("pragma journal_mode=WAL")
+    cursor.execute("pragma synchronous=NORMAL")
+    cursor.execute(f"pragma busy_timeout={config.get('DB_BUSY_TIMEOUT_MS', 5000)}")
+    cursor.execute(f"pragma cache_size=-{config.get('DB_CACHE_SIZE_KB', 65536)}")
+    cursor.execute("pragma temp_store=MEMORY")
+    cursor.close()
 
 
+def _async_url(url: str) -> str:
+    """Same database through the asyncio driver of its dialect."""
+    for sync_driver, async_driver in [
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("mysql://", "mysql+aiomysql://"),
+        ("mysql+pymysql://", "mysql+aiomysql://"),
+        ("oracle://", "oracle+oracledb_async://"),
+        ("oracle+oracledb://", "oracle+oracledb_async://"),
+    ]:
+        if url.startswith(sync_driver):
+            return async_driver + url[len(sync_driver) :]
+    if "+aiosqlite" in url or "+aiomysql" in url or "+oracledb_async" in url:
+        return url
+    # e.g. oracle+cx_oracle has no asyncio driver
+    raise ValueError(f"No async driver for DB_CONNECTION {url.split(':')[0]}")
+
+
+pool_args = {
+    "pool_size": config.get("DB_POOL_SIZE", 5),
+    "max_overflow": config.get("DB_MAX_OVERFLOW", 10),
+    "pool_recycle": 3600,
+}
+
+# This called before engine creation so sqlite can create its file
+os.makedirs(config["DB_DIR"], exist_ok=True)
+
 if "sqlite" in config["DB_CONNECTION"]:
+    # Sync engine is only used to create the tables at startup
     engine = create_engine(
         config["DB_CONNECTION"],
         connect_args={"check_same_thread": False},
         pool_recycle=3600,
     )
-    from sqlalchemy import event
-
-    event.listen(engine, "connect", _fk_pragma_on_connect)
+    # aiosqlite defaults to NullPool, which takes no pool size
+    async_engine = create_async_engine(
+        _async_url(config["DB_CONNECTION"]),
+        poolclass=AsyncAdaptedQueuePool,
+        **pool_args,
+    )
+    event.listen(engine, "connect", _sqlite_pragma_on_connect)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragma_on_connect)
 elif "mysql" in config["DB_CONNECTION"]:
     engine = create_engine(config["DB_CONNECTION"], pool_recycle=3600)
+    async_engine = create_async_engine(_async_url(config["DB_CONNECTION"]), **pool_args)
 elif "oracle" in config["DB_CONNECTION"]:
     engine = create_engine(config["DB_CONNECTION"], pool_recycle=3600)
+    async_engine = create_async_engine(_async_url(config["DB_CONNECTION"]), **pool_args)
+else:
+    raise ValueError(f"Unsupported DB_CONNECTION: {config['DB_CONNECTION']}")
 
-# This called before base inialization
-os.makedirs(config["DB_DIR"], exist_ok=True)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
 
 Base = declarative_base()
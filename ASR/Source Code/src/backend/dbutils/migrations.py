@@ -0,0 +1,43 @@
+from sqlalchemy import Table, inspect, text
+from sqlalchemy.engine import Engine
+from dbutils import models
+from loguru import logger
+
+
+def _add_missing_columns(engine: Engine, table: Table, existing: dict):
+    """Nullable columns added to the models since the table was created."""
+    quote = engine.dialect.identifier_preparer.quote
+    for column in table.columns:
+        if column.name in existing or not column.nullable:
+            continue
+        logger.info("Adding column", table=table.name, column=column.name)
+        column_type = column.type.compile(dialect=engine.dialect)
+        with engine.begin() as connection:
+            connection.execute(
+                text(
+                    f"ALTER TABLE {quote(table.name)} "
+                    f"ADD {quote(column.name)} {column_type}"
+                )
+            )
+
+
+def migrate(engine: Engine):
+    """
+    Bring an existing database up to the current models.
+
+    create_all only creates missing tables, so nullable columns and indexes
+    added to a table that already exists are created here. Every step is
+    idempotent and runs at startup.
+    """
+    models.Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    for table in models.Base.metadata.sorted_tables:
+        columns = {
+            column["name"]: column for column in inspector.get_columns(table.name)
+        }
+        _add_missing_columns(engine, table, columns)
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info("Creating index", table=table.name, index=index.name)
+                index.create(bind=engine)
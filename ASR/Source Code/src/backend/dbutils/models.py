@@ -1,4 +1,13 @@
-from sqlalchemy import Column, String, DateTime, Integer, Enum, SmallInteger
+from sqlalchemy import (
+    Column,
+    String,
+    Text,
+    DateTime,
+    Integer,
+    Enum,
+    SmallInteger,
+    Index,
+)
 from dbutils.database import Base
 from core.utils import generate_uuid
 from dbutils.schemas import WebhookStatus
@@ -23,6 +32,14 @@ Base.items = items
 
 class Manager(Base):
     __tablename__ = "manager"
+    __table_args__ = (
+        # Nightly file cleanup: finished, webhook delivered, older than N days
+        Index(
+            "ix_manager_status_webhook_utime", "status", "webhook_status_code", "utime"
+        ),
+        # Retention: finished requests by age
+        Index("ix_manager_utime_status", "utime", "status"),
+    )
 
     id = Column(String(255), primary_key=True, default=generate_uuid)
     request_id = Column(String(255), nullable=False, unique=True)
@@ -32,9 +49,21 @@ class Manager(Base):
     lang = Column(String(255), nullable=True, default="fa")
     status = Column(Enum(WebhookStatus), nullable=False, default=WebhookStatus.pending)
     result = Column(String(4000), nullable=True)
+    # JSON [[word, start, end, confidence], ...] when word_timestamps was asked
+    words = Column(Text, nullable=True)
     error = Column(String(4000), nullable=True)
     webhook_retry_count = Column(SmallInteger, nullable=True)
     webhook_status_code = Column(SmallInteger, nullable=True)
     itime = Column(DateTime, nullable=False)
     utime = Column(DateTime, nullable=True)
     descr = Column(String(255), nullable=True)
+
+
+class WebhookOutbox(Base):
+    __tablename__ = "webhook_outbox"
+    __table_args__ = (Index("ix_webhook_outbox_next_attempt", "next_attempt"),)
+
+    request_id = Column(String(255), primary_key=True)
+    status = Column(Enum(WebhookStatus), nullable=False)
+    next_attempt = Column(DateTime, nullable=False)
+    itime = Column(DateTime, nullable=False)
@@ -1,23 +1,36 @@
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Depends, UploadFile
-from sqlalchemy.orm import Session
+from fastapi import (
+    BackgroundTasks,
+    FastAPI,
+    HTTPException,
+    Depends,
+    UploadFile,
+    WebSocket,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
 import aio_pika
 import uuid
 import json
 import asyncio
 from core.messages import Message
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 from loguru import logger
 import os
 from version import __version__
 from config.config_handler import config
 from core.queue_utils import consume_results, get_rabbitmq_connection
+from core.rpc import rpc_client
+from core.status_stream import broker, status_event
+from core.upload import UploadLimitMiddleware, save_upload
+from core.webhook_dispatcher import dispatcher
 from dbutils import crud
+from dbutils.schemas import WebhookStatus
 import sys
 from starlette.middleware.cors import CORSMiddleware
-from core import base
-from dbutils.database import SessionLocal
+from core import base, utils
+from dbutils.database import AsyncSessionLocal
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import pytz
@@ -58,32 +71,58 @@ logger.add(
 logger.info("Starting service", version=__version__)
 
 
+async def clean_unused_temp_files():
+    async with AsyncSessionLocal() as db:
+        await crud.clean_unused_temp_files(db)
+
+
+async def archive_old_requests():
+    async with AsyncSessionLocal() as db:
+        await crud.archive_old_requests(
+            db,
+            archive_dir=config["ARCHIVE_DIR"],
+            days=config.get("RETENTION_DAYS", 90),
+            batch_size=config.get("ARCHIVE_BATCH_SIZE", 5000),
+        )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan to start the result consumer."""
     try:
         # Result queue
         connection = await aio_pika.connect_robust(config["QUEUE_CONNECTION"])
-        db = SessionLocal()
-        asyncio.create_task(consume_results(connection, db))
+        asyncio.create_task(consume_results(connection))
+        # Request/reply channel of the online endpoint
+        await rpc_client.connect()
+        # Webhooks are sent from the outbox in the background
+        asyncio.create_task(dispatcher.run())
         # Delete unused temp files everyday at 2 AM
         scheduler = AsyncIOScheduler()
         scheduler.add_job(
-            crud.clean_unused_temp_files,
+            clean_unused_temp_files,
             trigger=CronTrigger(
                 hour=2, minute=0, timezone=pytz.timezone("Asia/Tehran")
             ),
-            args=(db,),
+        )
+        # Move old finished requests to the archive everyday at 3 AM
+        scheduler.add_job(
+            archive_old_requests,
+            trigger=CronTrigger(
+                hour=3, minute=0, timezone=pytz.timezone("Asia/Tehran")
+            ),
         )
         scheduler.start()
         yield
     finally:
         scheduler.shutdown()
-        db.close()
+        await rpc_client.close()
         await connection.close()
 
 
 app = FastAPI(lifespan=lifespan)
+# Inside CORS so a 413 still carries the CORS headers
+app.add_middleware(UploadLimitMiddleware, routes=app.routes)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -100,8 +139,9 @@ async def speech_to_text(
     lang: str = "fa",
     request_id: str = None,
     priority: int = 1,
+    word_timestamps: bool = False,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info("/asr/speech-to-text-offline", request_id=request_id, lang=lang)
     if request_id is None:
@@ -112,10 +152,9 @@ async def speech_to_text(
 
     # Save uploaded file
     input_path = f"{temp_voice_dir}/{request_id}_{audio_file.filename}"
-    with open(input_path, "wb") as f:
-        f.write(await audio_file.read())
+    await save_upload(audio_file, input_path, "speech_to_text")
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         input_path=input_path,
@@ -131,7 +170,12 @@ async def speech_to_text(
 
     # Prepare message with text, model, and request_id
     # TODO: change input_path to binary data (be aware of 16k frequency conversion!)
-    message_body = {"input_path": input_path, "request_id": request_id, "lang": lang}
+    message_body = {
+        "input_path": input_path,
+        "request_id": request_id,
+        "lang": lang,
+        "word_timestamps": word_timestamps,
+    }
 
     await channel.default_exchange.publish(
         aio_pika.Message(
@@ -147,16 +191,120 @@ async def speech_to_text(
     return msg
 
 
+async def audit_online_request(**kwargs):
+    """Audit row of an online request, written after the response is sent."""
+    async with AsyncSessionLocal() as db:
+        await crud.add_request(db=db, **kwargs)
+
+
+@app.post("/aihive-sptotxt/api/v1/speech-to-text-online")
+async def speech_to_text_online(
+    audio_file: UploadFile,
+    background_tasks: BackgroundTasks,
+    lang: str = "fa",
+    request_id: str = None,
+):
+    """
+    Transcribe a short clip (voice commands) and return the text directly.
+
+    The clip is sent to the engine's online_task_queue as an RPC request and
+    the reply is awaited for at most ONLINE_TIMEOUT_S. No request row is
+    created up front and no webhook is sent, only an audit row is written.
+    """
+    logger.info("/asr/speech-to-text-online", request_id=request_id, lang=lang)
+    if request_id is None:
+        request_id = str(uuid.uuid4())
+
+    if lang not in ["fa", "en", "ar"]:
+        return Message("en").ERR_LANG_NOT_SUPPORTED()
+
+    input_path = f"{temp_voice_dir}/{request_id}_{audio_file.filename}"
+    await save_upload(audio_file, input_path, "speech_to_text_online")
+    message_body = {"input_path": input_path, "request_id": request_id, "lang": lang}
+    try:
+        result = await rpc_client.call(
+            message_body,
+            routing_key="online_task_queue",
+            timeout=config.get("ONLINE_TIMEOUT_S", 10),
+        )
+    except asyncio.TimeoutError:
+        logger.warning("Online request timed out", request_id=request_id)
+        result = {"status": "failed", "error": "timeout"}
+    finally:
+        utils.delete_file(input_path)
+
+    background_tasks.add_task(
+        audit_online_request,
+        request_id=request_id,
+        input_path=input_path,
+        lang=lang,
+        status=WebhookStatus[result["status"]],
+        result=result.get("text"),
+        error=result.get("error"),
+        utime=datetime.now(tz=None),
+        descr="online",
+    )
+    if result["status"] != "completed":
+        if result.get("error") == "timeout":
+            return Message("en").ERR_SERVICE_UNAVAILABLE()
+        return Message("en").ERR_FAILED()
+    msg = Message("en").INF_SUCCESS()
+    msg["data"] = {
+        "request_id": request_id,
+        "text": result["text"],
+        "segments": result.get("segments"),
+    }
+    return msg
+
+
 @app.get("/aihive-sptotxt/api/v1/status/{request_id}")
-async def get_status(request_id: str, db: Session = Depends(base.get_db)):
+async def get_status(request_id: str, db: AsyncSession = Depends(base.get_db)):
     logger.info("/asr/status", request_id=request_id)
-    task = crud.get_request(db=db, request_id=request_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    task = broker.get_cached(request_id)
+    if task is None:
+        task = await crud.get_request(db=db, request_id=request_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        broker.cache(request_id, task)
     msg = Message("en").INF_SUCCESS()
     msg["data"] = task
     return msg
 
 
+async def subscribe_status(request_id: str):
+    """Subscribe to the events of a request, returns (queue, current status)."""
+    queue = broker.subscribe(request_id)
+    async with AsyncSessionLocal() as db:
+        task = await crud.get_request(db=db, request_id=request_id)
+    if not task:
+        broker.unsubscribe(request_id, queue)
+        return None, None
+    return queue, status_event(task)
+
+
+@app.get("/aihive-sptotxt/api/v1/status/{request_id}/stream")
+async def stream_status(request_id: str):
+    logger.info("/asr/status/stream", request_id=request_id)
+    queue, current = await subscribe_status(request_id)
+    if queue is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return StreamingResponse(
+        broker.sse(request_id, queue, current),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/aihive-sptotxt/api/v1/status/{request_id}/ws")
+async def status_websocket(websocket: WebSocket, request_id: str):
+    logger.info("/asr/status/ws", request_id=request_id)
+    queue, current = await subscribe_status(request_id)
+    if queue is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    await broker.websocket(websocket, request_id, queue, current)
+
+
 if __name__ == "__main__":
     uvicorn.run(app="mainapi:app", host="0.0.0.0", port=8001, reload=False)
@@ -0,0 +1,105 @@
+"""
+Result batching of core/queue_utils.py against an in-memory SQLite database.
+
+Run from the backend directory, the config is read relative to it:
+    python -m pytest tests
+"""
+
+from datetime import datetime
+import asyncio
+import json
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+from sqlalchemy import func, select  # noqa: E402
+from sqlalchemy.ext.asyncio import (  # noqa: E402
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from core import queue_utils  # noqa: E402
+from dbutils import models  # noqa: E402
+from dbutils.schemas import WebhookStatus  # noqa: E402
+
+
+class CountingSession(AsyncSession):
+    commits = 0
+
+    async def commit(self):
+        await super().commit()
+        CountingSession.commits += 1
+
+
+class FakeMessage:
+    def __init__(self, result: dict):
+        self.body = json.dumps(result).encode()
+        self.acked = False
+
+    async def ack(self):
+        self.acked = True
+
+
+class Recorder:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, result: dict):
+        self.published.append(result)
+
+    def notify(self):
+        pass
+
+
+async def _save_batch(monkeypatch, results):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(models.Base.metadata.create_all)
+    session_maker = async_sessionmaker(
+        bind=engine, class_=CountingSession, autoflush=False, expire_on_commit=False
+    )
+    async with session_maker() as db:
+        db.add(
+            models.Manager(
+                request_id="r1",
+                input_path="blob",
+                status=WebhookStatus.pending,
+                itime=datetime.now(),
+            )
+        )
+        await db.commit()
+    CountingSession.commits = 0
+    recorder = Recorder()
+    monkeypatch.setattr(queue_utils, "AsyncSessionLocal", session_maker)
+    monkeypatch.setattr(queue_utils, "broker", recorder)
+    monkeypatch.setattr(queue_utils, "dispatcher", recorder)
+    messages = [FakeMessage(result) for result in results]
+    await queue_utils._save_results(messages)
+    async with session_maker() as db:
+        outbox = (await db.scalars(select(models.WebhookOutbox))).all()
+        count = await db.scalar(select(func.count(models.WebhookOutbox.request_id)))
+        manager = await db.scalar(select(models.Manager))
+    await engine.dispose()
+    return messages, recorder, outbox, count, manager
+
+
+def test_same_request_twice_in_one_batch(monkeypatch):
+    messages, recorder, outbox, count, manager = asyncio.run(
+        _save_batch(
+            monkeypatch,
+            [
+                {"request_id": "r1", "status": "in_progress"},
+                {"request_id": "r1", "status": "completed", "text": "salam"},
+            ],
+        )
+    )
+    assert CountingSession.commits == 1
+    assert count == 1
+    assert outbox[0].status == WebhookStatus.completed
+    assert manager.status == WebhookStatus.completed
+    assert manager.result == "salam"
+    assert len(recorder.published) == 2
+    assert all(message.acked for message in messages)
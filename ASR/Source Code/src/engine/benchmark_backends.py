@@ -0,0 +1,133 @@
+"""
+Accuracy and latency of the wav2vec2 inference backends (torch, int8, onnx).
+
+Every file of --samples is transcribed with every backend. WER is computed
+against <name>.txt next to each audio file when it exists, otherwise against
+the transcript of the first backend (torch by default). The fastest backend
+whose WER is within --wer-budget of the first one is printed as the
+recommendation for the "backend" of the model entry (or MODEL_BACKENDS).
+
+Usage:
+    python3 benchmark_backends.py --samples ../../../Samples/wav --model-id SLPL/Sharif-wav2vec2
+    python3 benchmark_backends.py --samples ../../../Samples/wav --model-id SLPL/Sharif-wav2vec2 --backends torch,onnx --wer-budget 0.01
+"""
+
+import argparse
+import glob
+import os
+import time
+import librosa
+import numpy as np
+import torch
+from transformers import Wav2Vec2Processor
+from core.backends import load_wav2vec2
+from generators import models
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ASR inference backend benchmark")
+    parser.add_argument("--samples", required=True, help="Directory of audio files")
+    parser.add_argument("--model-id", required=True, help="Key of the models dict")
+    parser.add_argument("--backends", default="torch,int8,onnx")
+    parser.add_argument(
+        "--wer-budget",
+        type=float,
+        default=0.02,
+        help="Allowed absolute WER increase over the first backend",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per file")
+    return parser.parse_args()
+
+
+def word_errors(reference: str, hypothesis: str) -> int:
+    """Word level edit distance."""
+    ref, hyp = reference.split(), hypothesis.split()
+    distances = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        previous, distances[0] = distances[0], i
+        for j, hyp_word in enumerate(hyp, start=1):
+            previous, distances[j] = distances[j], min(
+                distances[j] + 1,
+                distances[j - 1] + 1,
+                previous + (ref_word != hyp_word),
+            )
+    return distances[-1]
+
+
+def transcribe(model, processor, audio: np.ndarray) -> str:
+    input_values = processor(
+        audio, sampling_rate=16000, return_tensors="pt"
+    ).input_values
+    with torch.no_grad():
+        logits = model(input_values).logits
+    return processor.decode(torch.argmax(logits, dim=-1)[0])
+
+
+def run(args):
+    sample_paths = sorted(
+        path
+        for path in glob.glob(os.path.join(args.samples, "*"))
+        if os.path.splitext(path)[1].lower() in [".wav", ".ogg", ".mp3", ".flac"]
+    )
+    if not sample_paths:
+        raise SystemExit(f"No audio files found in {args.samples}")
+    audios = [librosa.load(path, sr=16000)[0] for path in sample_paths]
+    audio_seconds = sum(len(audio) for audio in audios) / 16000
+    references = []
+    for path in sample_paths:
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(reference_path):
+            with open(reference_path, "r") as f:
+                references.append(f.read().strip())
+        else:
+            references.append(None)
+
+    model_path = models[args.model_id]["model_path"]
+    processor = Wav2Vec2Processor.from_pretrained(model_path)
+    device = torch.device("cpu")
+    rows = []
+    baseline = None
+    for backend in args.backends.split(","):
+        model = load_wav2vec2(model_path, backend, device)
+        # Warm up so the first file does not pay lazy initialization
+        transcribe(model, processor, audios[0])
+        latencies, hypotheses = [], []
+        for audio in audios:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                text = transcribe(model, processor, audio)
+                times.append(time.perf_counter() - start)
+            latencies.append(min(times))
+            hypotheses.append(text)
+        if baseline is None:
+            baseline = hypotheses
+        errors = words = 0
+        for reference, torch_text, text in zip(references, baseline, hypotheses):
+            reference = reference if reference is not None else torch_text
+            errors += word_errors(reference, text)
+            words += max(1, len(reference.split()))
+        rows.append(
+            {
+                "backend": backend,
+                "wer": errors / words,
+                "p50_ms": np.percentile(latencies, 50) * 1000,
+                "p95_ms": np.percentile(latencies, 95) * 1000,
+                "rtf": sum(latencies) / audio_seconds,
+            }
+        )
+        del model
+
+    print(f"{'backend':>8} {'wer':>7} {'p50_ms':>9} {'p95_ms':>9} {'rtf':>7}")
+    for row in rows:
+        print(
+            f"{row['backend']:>8} {row['wer']:>7.4f} {row['p50_ms']:>9.1f} "
+            f"{row['p95_ms']:>9.1f} {row['rtf']:>7.3f}"
+        )
+    allowed = [row for row in rows if row["wer"] <= rows[0]["wer"] + args.wer_budget]
+    best = min(allowed, key=lambda row: row["rtf"])
+    print(f"Fastest backend within WER budget: {best['backend']}")
+
+
+if __name__ == "__main__":
+    run(parse_args())
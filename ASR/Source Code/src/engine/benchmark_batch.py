@@ -0,0 +1,65 @@
+"""
+Throughput of batched wav2vec2 inference against batch size.
+
+Usage:
+    python3 benchmark_batch.py --samples ../../../Samples/wav --lang fa
+    python3 benchmark_batch.py --samples ../../../Samples/wav --lang fa --batch-sizes 1,4,16 --requests 64
+    python3 benchmark_batch.py --samples ../../../Samples/wav --lang fa --vad on,off
+"""
+
+import argparse
+import glob
+import os
+import time
+import librosa
+from config.config_handler import config
+from generators import ASRGenerator
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="ASR batch inference benchmark")
+    parser.add_argument("--samples", required=True, help="Directory of audio files")
+    parser.add_argument("--lang", default="fa", help="Language of the samples")
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16")
+    parser.add_argument(
+        "--requests", type=int, default=32, help="Number of requests per run"
+    )
+    parser.add_argument("--vad", default="on", help="VAD modes to compare (on,off)")
+    return parser.parse_args()
+
+
+def run(args):
+    sample_paths = sorted(
+        path
+        for path in glob.glob(os.path.join(args.samples, "*"))
+        if os.path.splitext(path)[1].lower() in [".wav", ".ogg", ".mp3", ".flac"]
+    )
+    if not sample_paths:
+        raise SystemExit(f"No audio files found in {args.samples}")
+    input_paths = [
+        sample_paths[i % len(sample_paths)] for i in range(args.requests)
+    ]
+    audio_seconds = sum(librosa.get_duration(path=path) for path in input_paths)
+
+    asr_generator = ASRGenerator()
+    # Warm up so the first run does not pay lazy initialization
+    asr_generator.do_asr_batch(input_paths=input_paths[:1], lang=args.lang)
+
+    print(f"{'vad':>4} {'batch':>6} {'seconds':>9} {'req/s':>8} {'audio_s/s':>10}")
+    for vad_mode in args.vad.split(","):
+        config._config["VAD_ENABLED"] = vad_mode == "on"
+        for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+            start = time.perf_counter()
+            for i in range(0, len(input_paths), batch_size):
+                asr_generator.do_asr_batch(
+                    input_paths=input_paths[i : i + batch_size], lang=args.lang
+                )
+            elapsed = time.perf_counter() - start
+            print(
+                f"{vad_mode:>4} {batch_size:>6} {elapsed:>9.2f} "
+                f"{len(input_paths) / elapsed:>8.2f} {audio_seconds / elapsed:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    run(parse_args())
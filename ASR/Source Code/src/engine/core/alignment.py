@@ -0,0 +1,67 @@
+from typing import List, Tuple
+import numpy as np
+
+
+def frame_scores(logits: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Greedy CTC id and its softmax probability for every frame of (T, V) logits."""
+    ids = np.argmax(logits, axis=-1)
+    best = np.take_along_axis(logits, ids[:, None], axis=-1)[:, 0]
+    # max softmax = 1 / sum(exp(logit - max logit))
+    probs = 1.0 / np.sum(np.exp(logits - best[:, None]), axis=-1)
+    return ids, probs.astype(np.float32)
+
+
+def word_alignments(
+    ids: np.ndarray,
+    probs: np.ndarray,
+    tokens: np.ndarray,
+    blank_id: int,
+    delimiter_id: int,
+    frame_s: float,
+    offset_s: float = 0.0,
+) -> List[list]:
+    """
+    Words of a greedy CTC path as [word, start, end, confidence] rows.
+
+    ids and probs come from frame_scores, tokens maps ids to their strings and
+    frame_s is the duration of one logits frame. A word spans from the first
+    to the last frame of its characters, its confidence is the mean
+    probability of those frames. Times are in seconds plus offset_s.
+    """
+    if len(ids) == 0:
+        return []
+    # Runs of equal ids; a run of a non-blank id is one CTC character
+    run_starts = np.flatnonzero(np.concatenate([[True], ids[1:] != ids[:-1]]))
+    run_ends = np.append(run_starts[1:], len(ids))
+    run_ids = ids[run_starts]
+    keep = run_ids != blank_id
+    run_starts, run_ends, run_ids = run_starts[keep], run_ends[keep], run_ids[keep]
+    is_delimiter = run_ids == delimiter_id
+    # Characters between two delimiters share a word number
+    word_of_run = np.cumsum(is_delimiter)[~is_delimiter]
+    run_starts, run_ends = run_starts[~is_delimiter], run_ends[~is_delimiter]
+    run_ids = run_ids[~is_delimiter]
+    if len(run_ids) == 0:
+        return []
+
+    words, first = np.unique(word_of_run, return_index=True)
+    last = np.append(first[1:], len(word_of_run)) - 1
+    starts = run_starts[first]
+    ends = run_ends[last]
+    # Mean frame probability of the characters of every word
+    cumulative = np.concatenate([[0.0], np.cumsum(probs, dtype=np.float64)])
+    run_sums = cumulative[run_ends] - cumulative[run_starts]
+    run_lengths = run_ends - run_starts
+    confidences = np.add.reduceat(run_sums, first) / np.add.reduceat(
+        run_lengths, first
+    )
+    chars = tokens[run_ids]
+    return [
+        [
+            "".join(chars[first[w] : last[w] + 1]),
+            round(offset_s + float(starts[w]) * frame_s, 2),
+            round(offset_s + float(ends[w]) * frame_s, 2),
+            round(float(confidences[w]), 3),
+        ]
+        for w in range(len(words))
+    ]
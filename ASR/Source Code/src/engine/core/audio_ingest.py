@@ -0,0 +1,197 @@
+from config.config_handler import config
+from functools import lru_cache
+from loguru import logger
+from math import gcd
+from scipy.signal import resample_poly
+from typing import Optional
+import asyncio
+import hashlib
+import numpy as np
+import os
+import soundfile as sf
+import subprocess
+import tempfile
+import time
+
+SAMPLE_RATE = 16000
+CHUNK_SIZE = 1024 * 1024
+# Blocks read from libsndfile at a time while decoding
+BLOCK_FRAMES = 1024 * 64
+
+if os.environ.get("MODE", "dev") == "prod":
+    default_cache_dir = "/approot/data/audio_cache"
+else:
+    default_cache_dir = "../../../Outputs/audio_cache"
+cache_dir = config.get("AUDIO_CACHE_DIR", default_cache_dir)
+
+
+def resample(audio: np.ndarray, sr: int) -> np.ndarray:
+    """Polyphase resampling of mono float32 audio to SAMPLE_RATE."""
+    if sr == SAMPLE_RATE:
+        return audio
+    divisor = gcd(SAMPLE_RATE, sr)
+    return resample_poly(audio, SAMPLE_RATE // divisor, sr // divisor).astype(
+        np.float32
+    )
+
+
+def _decode_soundfile(path: str) -> np.ndarray:
+    """Decode block by block with libsndfile, mixing down to mono on the way."""
+    blocks = []
+    with sf.SoundFile(path) as sound_file:
+        sr = sound_file.samplerate
+        for block in sound_file.blocks(
+            blocksize=BLOCK_FRAMES, dtype="float32", always_2d=True
+        ):
+            blocks.append(block.mean(axis=1))
+    audio = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+    return resample(audio, sr)
+
+
+def _decode_ffmpeg(path: str) -> np.ndarray:
+    """Formats libsndfile can't read: ffmpeg decodes and resamples to f32le."""
+    process = subprocess.run(
+        [
+            "ffmpeg",
+            "-nostdin",
+            "-v",
+            "error",
+            "-i",
+            path,
+            "-f",
+            "f32le",
+            "-ac",
+            "1",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-",
+        ],
+        capture_output=True,
+        check=True,
+    )
+    return np.frombuffer(process.stdout, dtype=np.float32).copy()
+
+
+def decode(path: str) -> np.ndarray:
+    """Mono float32 audio at SAMPLE_RATE, without the cache."""
+    try:
+        return _decode_soundfile(path)
+    except Exception:
+        logger.debug("libsndfile can't decode, using ffmpeg", path=path)
+    try:
+        return _decode_ffmpeg(path)
+    except (OSError, subprocess.CalledProcessError):
+        logger.opt(exception=True).warning("ffmpeg can't decode, using librosa")
+    import librosa
+
+    return librosa.load(path, sr=SAMPLE_RATE)[0]
+
+
+@lru_cache(maxsize=1024)
+def _file_digest(path: str, size: int, mtime_ns: int) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file, remembered while its size and mtime don't change."""
+    stat = os.stat(path)
+    return _file_digest(path, stat.st_size, stat.st_mtime_ns)
+
+
+def _cache_path(digest: str) -> str:
+    return os.path.join(cache_dir, digest[:2], f"{digest}.npy")
+
+
+def cached(path: str) -> Optional[np.ndarray]:
+    """Memory-mapped decoded audio of a file if it is in the cache."""
+    if not config.get("AUDIO_CACHE_ENABLED", True):
+        return None
+    cache_path = _cache_path(file_digest(path))
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        audio = np.load(cache_path, mmap_mode="r")
+    except Exception:
+        logger.opt(exception=True).warning("Broken audio cache entry", path=cache_path)
+        os.remove(cache_path)
+        return None
+    # Keep it alive for remove_expired
+    os.utime(cache_path)
+    return audio
+
+
+def load_audio(path: str) -> np.ndarray:
+    """
+    Mono float32 audio of a file at SAMPLE_RATE.
+
+    Decoded audio is cached as <cache_dir>/<hh>/<sha256>.npy, keyed by the
+    content of the file, and returned memory-mapped, so a retry or another
+    model reading the same upload skips decoding.
+    """
+    audio = cached(path)
+    if audio is not None:
+        return audio
+    audio = decode(path)
+    if not config.get("AUDIO_CACHE_ENABLED", True):
+        return audio
+    cache_path = _cache_path(file_digest(path))
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # Write next to the entry so the final rename is atomic
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            np.save(temp_file, audio)
+        os.replace(temp_path, cache_path)
+    except Exception:
+        logger.opt(exception=True).warning("Failed to cache audio", path=path)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return audio
+    return np.load(cache_path, mmap_mode="r")
+
+
+def get_duration(path: str) -> float:
+    """Duration in seconds, from the cache or the file header."""
+    audio = cached(path)
+    if audio is not None:
+        return len(audio) / SAMPLE_RATE
+    try:
+        return sf.info(path).duration
+    except Exception:
+        return len(load_audio(path)) / SAMPLE_RATE
+
+
+def remove_expired(max_age_hours: float) -> int:
+    """Remove cache entries not used for max_age_hours, returns the count."""
+    if not os.path.isdir(cache_dir):
+        return 0
+    deadline = time.time() - max_age_hours * 3600
+    removed = 0
+    for dirpath, _, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+async def clean_audio_cache():
+    """Remove expired cache entries every hour (AUDIO_CACHE_TTL_HOURS)."""
+    while True:
+        try:
+            removed = await asyncio.to_thread(
+                remove_expired, config.get("AUDIO_CACHE_TTL_HOURS", 24)
+            )
+            if removed:
+                logger.info("Audio cache cleaned", removed=removed)
+        except Exception:
+            logger.opt(exception=True).error("Failed to clean audio cache")
+        await asyncio.sleep(3600)
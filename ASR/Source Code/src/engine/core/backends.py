@@ -0,0 +1,107 @@
+from config.config_handler import config
+from loguru import logger
+from transformers import Wav2Vec2ForCTC
+from transformers.modeling_outputs import CausalLMOutput
+from typing import Optional
+import os
+import torch
+
+BACKENDS = ["torch", "int8", "onnx"]
+
+
+class OnnxWav2Vec2:
+    """
+    Wav2Vec2ForCTC exported to ONNX and run with onnxruntime.
+
+    Only the parts ASRGenerator uses are provided: calling it returns an
+    object with .logits, .config and _get_feat_extract_output_lengths work
+    like on the torch model.
+    """
+
+    def __init__(self, onnx_path: str, model_config):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = config.get("ONNX_INTRA_OP_THREADS", 0)
+        options.inter_op_num_threads = config.get("ONNX_INTER_OP_THREADS", 0)
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        self._session = onnxruntime.InferenceSession(
+            onnx_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self.config = model_config
+        # Resident size for the model registry, the weights dominate
+        self.size_bytes = os.path.getsize(onnx_path)
+
+    def eval(self):
+        return self
+
+    def __call__(
+        self, input_values: torch.Tensor, attention_mask: Optional[torch.Tensor] = None
+    ) -> CausalLMOutput:
+        inputs = {"input_values": input_values.cpu().numpy()}
+        if "attention_mask" in self._input_names:
+            if attention_mask is None:
+                attention_mask = torch.ones_like(input_values, dtype=torch.long)
+            inputs["attention_mask"] = attention_mask.cpu().numpy()
+        logits = self._session.run(["logits"], inputs)[0]
+        return CausalLMOutput(logits=torch.from_numpy(logits))
+
+    def _get_feat_extract_output_lengths(self, input_lengths: torch.Tensor):
+        # Same length arithmetic as the convolutional feature encoder
+        for kernel, stride in zip(self.config.conv_kernel, self.config.conv_stride):
+            input_lengths = (
+                torch.div(input_lengths - kernel, stride, rounding_mode="floor") + 1
+            )
+        return input_lengths
+
+
+def export_onnx(model: Wav2Vec2ForCTC, onnx_path: str):
+    """Export with dynamic batch and length axes (once, next to the model)."""
+    uses_mask = model.config.feat_extract_norm == "layer"
+    dummy = torch.zeros(1, 16000)
+    args = (dummy, torch.ones(1, 16000, dtype=torch.long)) if uses_mask else (dummy,)
+    input_names = ["input_values", "attention_mask"] if uses_mask else ["input_values"]
+    dynamic_axes = {name: {0: "batch", 1: "samples"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch", 1: "frames"}
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    logger.info("Exporting model to ONNX", onnx_path=onnx_path)
+    torch.onnx.export(
+        model,
+        args,
+        onnx_path,
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=17,
+    )
+
+
+def load_wav2vec2(model_path: str, backend: str, device: torch.device):
+    """
+    Load a wav2vec2 CTC model for one of BACKENDS.
+
+    - torch: fp32 eager PyTorch on device
+    - int8: dynamic int8 quantization of the Linear layers (CPU only)
+    - onnx: onnxruntime on CPU, exported to <model_path>/onnx/model.onnx on
+      first use
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+    model = Wav2Vec2ForCTC.from_pretrained(model_path)
+    model.eval()
+    if backend != "torch" and device.type != "cpu":
+        logger.warning("Backend is CPU only, using torch", backend=backend)
+        backend = "torch"
+    if backend == "torch":
+        return model.to(device)
+    if backend == "int8":
+        return torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    onnx_path = os.path.join(model_path, "onnx", "model.onnx")
+    if not os.path.exists(onnx_path):
+        export_onnx(model, onnx_path)
+    return OnnxWav2Vec2(onnx_path, model.config)
@@ -0,0 +1,88 @@
+from generators import ASRGenerator
+from core.executor import executor
+from loguru import logger
+from typing import Dict, List, Tuple
+import asyncio
+
+
+class ASRBatcher:
+    """
+    Collects pending requests per language and transcribes them in micro-batches.
+
+    A batch is flushed when it reaches max_batch_size or when its oldest
+    request has waited max_wait_ms, whichever comes first.
+    """
+
+    def __init__(
+        self, asr_generator: ASRGenerator, max_batch_size: int, max_wait_ms: int
+    ):
+        self._asr_generator = asr_generator
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max_wait_ms / 1000
+        self._pending: Dict[str, List[Tuple[str, bool, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    async def submit(
+        self, input_path: str, lang: str, word_timestamps: bool = False
+    ) -> Dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(lang, [])
+        pending.append((input_path, word_timestamps, future))
+        if len(pending) >= self._max_batch_size:
+            self._flush(lang)
+        elif lang not in self._timers:
+            self._timers[lang] = loop.call_later(self._max_wait, self._flush, lang)
+        return await future
+
+    def _flush(self, lang: str):
+        timer = self._timers.pop(lang, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(lang, [])
+        if not batch:
+            return
+        task = asyncio.create_task(self._run_batch(lang, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(
+        self, lang: str, batch: List[Tuple[str, bool, asyncio.Future]]
+    ):
+        input_paths = [input_path for input_path, _, _ in batch]
+        logger.debug("Running batch", lang=lang, size=len(batch))
+        try:
+            # Words are aligned for the whole batch if any request wants them
+            transcripts = await executor.run_in_thread(
+                lang,
+                self._asr_generator.do_asr_batch,
+                input_paths=input_paths,
+                lang=lang,
+                word_timestamps=any(words for _, words, _ in batch),
+            )
+        except Exception:
+            # One broken file must not fail the whole batch
+            logger.opt(exception=True).warning(
+                "Batch failed, retrying requests one by one", lang=lang
+            )
+            for input_path, word_timestamps, future in batch:
+                if future.done():
+                    continue
+                try:
+                    transcript = await executor.run_in_thread(
+                        lang,
+                        self._asr_generator.do_asr,
+                        input_path=input_path,
+                        lang=lang,
+                        word_timestamps=word_timestamps,
+                    )
+                    future.set_result(transcript)
+                except Exception as e:
+                    future.set_exception(e)
+            return
+        for (_, word_timestamps, future), transcript in zip(batch, transcripts):
+            if not word_timestamps:
+                transcript.pop("words", None)
+            if not future.done():
+                future.set_result(transcript)
@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from config.config_handler import config
+from loguru import logger
+from typing import Callable, Dict
+import asyncio
+import functools
+import multiprocessing
+
+
+class InferenceExecutor:
+    """
+    Runs blocking inference off the event loop.
+
+    - run_in_thread: torch/onnx/opencv calls, which release the GIL
+    - run_in_process: Python-heavy steps that hold the GIL
+
+    Every call is made under a model key. MODEL_CONCURRENCY limits how many
+    calls of one key run at the same time (MODEL_CONCURRENCY_DEFAULT for keys
+    not listed), so a single model can't occupy every worker.
+
+    run_in_online_thread uses its own EXECUTOR_ONLINE_THREAD_WORKERS threads,
+    so latency-bound requests never queue behind offline inference.
+    """
+
+    def __init__(self):
+        self._thread_workers = config.get("EXECUTOR_THREAD_WORKERS", 2)
+        self._process_workers = config.get("EXECUTOR_PROCESS_WORKERS", 1)
+        self._online_workers = config.get("EXECUTOR_ONLINE_THREAD_WORKERS", 1)
+        self._model_concurrency = config.get("MODEL_CONCURRENCY") or {}
+        self._default_concurrency = config.get("MODEL_CONCURRENCY_DEFAULT", 1)
+        self._thread_pool = None
+        self._online_pool = None
+        self._process_pool = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _get_semaphore(self, key: str) -> asyncio.Semaphore:
+        if key not in self._semaphores:
+            limit = self._model_concurrency.get(key, self._default_concurrency)
+            self._semaphores[key] = asyncio.Semaphore(limit)
+        return self._semaphores[key]
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            logger.info("Starting thread pool", workers=self._thread_workers)
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self._thread_workers, thread_name_prefix="inference"
+            )
+        return self._thread_pool
+
+    def _get_online_pool(self) -> ThreadPoolExecutor:
+        if self._online_pool is None:
+            logger.info("Starting online thread pool", workers=self._online_workers)
+            self._online_pool = ThreadPoolExecutor(
+                max_workers=self._online_workers, thread_name_prefix="online"
+            )
+        return self._online_pool
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            logger.info("Starting process pool", workers=self._process_workers)
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self._process_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._process_pool
+
+    async def run_in_thread(self, key: str, fn: Callable, *args, **kwargs):
+        async with self._get_semaphore(key):
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_thread_pool(), functools.partial(fn, *args, **kwargs)
+            )
+
+    async def run_in_online_thread(self, key: str, fn: Callable, *args, **kwargs):
+        async with self._get_semaphore(key):
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_online_pool(), functools.partial(fn, *args, **kwargs)
+            )
+
+    async def run_in_process(self, key: str, fn: Callable, *args, **kwargs):
+        """fn and its arguments must be picklable (module-level function)."""
+        async with self._get_semaphore(key):
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_process_pool(), functools.partial(fn, *args, **kwargs)
+            )
+
+    def shutdown(self):
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+        if self._online_pool is not None:
+            self._online_pool.shutdown(wait=False, cancel_futures=True)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+
+
+executor = InferenceExecutor()
@@ -1,4 +1,8 @@
 from generators import ASRGenerator
+from core.batcher import ASRBatcher
+from core.executor import executor
+from core import audio_ingest
+from config.config_handler import config
 import aio_pika
 import json
 from loguru import logger
@@ -8,6 +12,7 @@ async def process_message(
     message: aio_pika.IncomingMessage,
     result_channel: aio_pika.Channel,
     asr_generator: ASRGenerator,
+    batcher: ASRBatcher,
 ):
     async with message.process():
         try:
@@ -16,6 +21,7 @@ async def process_message(
             input_path = message_body["input_path"]
             request_id = message_body["request_id"]
             lang = message_body["lang"]
+            word_timestamps = message_body.get("word_timestamps", False)
 
             logger.info(
                 "Processing task",
@@ -35,13 +41,47 @@ async def process_message(
                 routing_key="result_queue",
             )
 
-            text = await asr_generator.do_asr(input_path=input_path, lang=lang)
+            is_long_audio = await executor.run_in_thread(
+                "probe",
+                asr_generator.is_long_audio,
+                input_path=input_path,
+                lang=lang,
+            )
+            if is_long_audio:
+
+                async def publish_partial(text: str):
+                    partial = {
+                        "request_id": request_id,
+                        "status": "partial",
+                        "text": text,
+                    }
+                    await result_channel.default_exchange.publish(
+                        aio_pika.Message(
+                            body=json.dumps(partial).encode(),
+                            headers={"request_id": request_id},
+                        ),
+                        routing_key="result_queue",
+                    )
+
+                transcript = await asr_generator.do_asr_chunked(
+                    input_path=input_path,
+                    lang=lang,
+                    on_partial=publish_partial,
+                    word_timestamps=word_timestamps,
+                )
+            else:
+                transcript = await batcher.submit(
+                    input_path=input_path, lang=lang, word_timestamps=word_timestamps
+                )
 
             result = {
                 "request_id": request_id,
                 "status": "completed",
-                "text": text,
+                "text": transcript["text"],
+                "segments": transcript["segments"],
             }
+            if word_timestamps:
+                result["words"] = transcript.get("words")
             logger.debug(f"{result=}")
         except Exception as e:
             logger.exception(e)
@@ -53,3 +93,55 @@ async def process_message(
             ),
             routing_key="result_queue",
         )
+
+
+async def process_online_message(
+    message: aio_pika.IncomingMessage,
+    result_channel: aio_pika.Channel,
+    asr_generator: ASRGenerator,
+):
+    """
+    Online (RPC) request: reply to message.reply_to with the correlation_id.
+
+    Nothing goes to result_queue, the backend only waits for the reply.
+    Clips longer than ONLINE_MAX_DURATION_S are refused. The clip is not
+    batched: it runs at once on the executor's online threads, under its own
+    "online:<lang>" key, so it never waits for ASR_BATCH_MAX_WAIT_MS or for
+    the offline requests of the same language.
+    """
+    async with message.process():
+        request_id = None
+        try:
+            message_body = json.loads(message.body.decode())
+            input_path = message_body["input_path"]
+            request_id = message_body["request_id"]
+            lang = message_body["lang"]
+            logger.info("Processing online task", request_id=request_id, lang=lang)
+
+            max_duration = config.get("ONLINE_MAX_DURATION_S", 10)
+            duration = await executor.run_in_online_thread(
+                "online:probe", audio_ingest.get_duration, input_path
+            )
+            if duration > max_duration:
+                raise ValueError(f"Audio is longer than {max_duration} seconds")
+            transcript = await executor.run_in_online_thread(
+                f"online:{lang}", asr_generator.do_asr, input_path=input_path, lang=lang
+            )
+            result = {
+                "request_id": request_id,
+                "status": "completed",
+                "text": transcript["text"],
+                "segments": transcript["segments"],
+            }
+        except Exception as e:
+            logger.exception(e)
+            result = {"request_id": request_id, "status": "failed", "error": str(e)}
+
+        if message.reply_to:
+            await result_channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=json.dumps(result).encode(),
+                    correlation_id=message.correlation_id,
+                ),
+                routing_key=message.reply_to,
+            )
@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from loguru import logger
+from typing import Any, Callable, Dict, Optional, Tuple
+import threading
+import time
+
+
+def model_size_bytes(model) -> int:
+    """Resident size of a model: its size_bytes attribute or its state_dict."""
+    size = getattr(model, "size_bytes", None)
+    if size is not None:
+        return size
+    state_dict = getattr(model, "state_dict", None)
+    if state_dict is None:
+        return 0
+    return sum(
+        tensor.numel() * tensor.element_size()
+        for tensor in state_dict().values()
+        if hasattr(tensor, "element_size")
+    )
+
+
+class ModelRegistry:
+    """
+    Loads models on first use and keeps an LRU of them within a memory budget.
+
+    loader(key) returns (entry, size_bytes). When a load takes the resident
+    size over budget_mb, the least recently used entries are evicted (never the
+    one just loaded); 0 means no limit. An evicted entry stays alive until the
+    calls still using it return. get is thread safe and only one thread loads
+    a given key at a time.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Tuple[Any, int]],
+        budget_mb: int = 0,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        self._loader = loader
+        self._budget = budget_mb * 1024 * 1024
+        self._on_evict = on_evict
+        self._resident: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "load_failures": 0,
+            "evictions": 0,
+            "load_seconds": 0.0,
+        }
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            if key in self._resident:
+                self._resident.move_to_end(key)
+                self._metrics["hits"] += 1
+                return self._resident[key][0]
+            self._metrics["misses"] += 1
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                # Loaded by another thread while this one waited
+                if key in self._resident:
+                    self._resident.move_to_end(key)
+                    return self._resident[key][0]
+            start = time.perf_counter()
+            try:
+                entry, size = self._loader(key)
+            except Exception:
+                with self._lock:
+                    self._metrics["load_failures"] += 1
+                raise
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._resident[key] = (entry, size)
+                self._metrics["loads"] += 1
+                self._metrics["load_seconds"] += elapsed
+                evicted = self._evict(keep=key)
+        logger.info(
+            "Model loaded",
+            key=key,
+            size_mb=round(size / 1024 / 1024),
+            seconds=round(elapsed, 2),
+            **self.metrics(),
+        )
+        for evicted_key in evicted:
+            logger.info("Model evicted", key=evicted_key, **self.metrics())
+            if self._on_evict is not None:
+                self._on_evict(evicted_key)
+        return entry
+
+    def _evict(self, keep: str):
+        evicted = []
+        while self._budget and self._resident_bytes() > self._budget:
+            key = next(iter(self._resident))
+            if key == keep:
+                break
+            del self._resident[key]
+            self._metrics["evictions"] += 1
+            evicted.append(key)
+        return evicted
+
+    def _resident_bytes(self) -> int:
+        return sum(size for _, size in self._resident.values())
+
+    def is_resident(self, key: str) -> bool:
+        return key in self._resident
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                **self._metrics,
+                "load_seconds": round(self._metrics["load_seconds"], 2),
+                "resident": list(self._resident),
+                "resident_mb": round(self._resident_bytes() / 1024 / 1024),
+            }
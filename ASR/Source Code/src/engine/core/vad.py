@@ -0,0 +1,76 @@
+from config.config_handler import config
+from typing import List, Tuple
+import numpy as np
+
+FRAME_MS = 20
+
+
+def frame_energy_db(audio: np.ndarray, frame: int) -> np.ndarray:
+    """RMS energy in dB of consecutive non-overlapping frames."""
+    count = len(audio) // frame
+    if count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[: count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_regions(audio: np.ndarray, sr: int = 16000) -> List[Tuple[int, int]]:
+    """
+    Energy based voice activity detection.
+
+    Returns (start, end) sample offsets of the speech regions of audio. A frame
+    is speech when it is VAD_THRESHOLD_DB above the noise floor (the 10th
+    percentile of frame energies) and above VAD_MIN_ENERGY_DB. Regions closer
+    than VAD_MIN_SILENCE_MS are merged, regions shorter than VAD_MIN_SPEECH_MS
+    are dropped, the rest are padded by VAD_PAD_MS on both sides and split so
+    none is longer than VAD_MAX_SEGMENT_S.
+    """
+    frame = sr * FRAME_MS // 1000
+    energy = frame_energy_db(audio, frame)
+    if len(energy) == 0:
+        return []
+    noise_floor = np.percentile(energy, 10)
+    threshold = max(
+        noise_floor + config.get("VAD_THRESHOLD_DB", 12),
+        config.get("VAD_MIN_ENERGY_DB", -50),
+    )
+    is_speech = energy > threshold
+    # Frame indices where speech starts and stops
+    edges = np.diff(np.concatenate([[0], is_speech.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    min_silence = config.get("VAD_MIN_SILENCE_MS", 300) // FRAME_MS
+    min_speech = config.get("VAD_MIN_SPEECH_MS", 250) // FRAME_MS
+    pad = config.get("VAD_PAD_MS", 200) * sr // 1000
+    max_segment = int(config.get("VAD_MAX_SEGMENT_S", 20) * sr)
+
+    merged = []
+    for start, end in zip(starts, ends):
+        if merged and start - merged[-1][1] < min_silence:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    regions = []
+    for start, end in merged:
+        if end - start < min_speech:
+            continue
+        start = max(0, start * frame - pad)
+        end = min(len(audio), end * frame + pad)
+        if regions and start <= regions[-1][1]:
+            # Padding made two regions touch
+            start = regions.pop()[0]
+        regions.append((start, end))
+
+    split = []
+    for start, end in regions:
+        count = -(-(end - start) // max_segment)
+        bounds = np.linspace(start, end, count + 1).astype(int)
+        split.extend(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+    return split
+
+
+def has_speech(audio: np.ndarray, sr: int = 16000) -> bool:
+    return len(speech_regions(audio, sr)) > 0
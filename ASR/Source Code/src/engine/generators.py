@@ -1,15 +1,19 @@
 from loguru import logger
 from transformers import (
-    Wav2Vec2ForCTC,
     Wav2Vec2Processor,
     WhisperProcessor,
     WhisperForConditionalGeneration,
 )
+import gc
 import torch
-import librosa
+import soundfile as sf
 import os
-from typing import Dict
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 from config.config_handler import config
+from core import alignment, audio_ingest, vad
+from core.backends import load_wav2vec2
+from core.registry import ModelRegistry, model_size_bytes
+from core.executor import executor
 import numpy as np
 from speechbrain.inference.ASR import WhisperASR
 
@@ -35,6 +39,8 @@ models = {
         "model_path": f"{models_dir}/jonatasgrosman/wav2vec2-large-xlsr-53-english",
         "lang": "en",
         "type": "wav2vec2",
+        # Inference backend of wav2vec2 models: torch (default), int8 or onnx
+        "backend": "torch",
     },
     "facebook/wav2vec2-large-robust-ft-libri-960h": {
         "model_path": f"{models_dir}/facebook/wav2vec2-large-robust-ft-libri-960h",
@@ -54,84 +60,389 @@ models = {
 }
 
 
+def get_backend(model_id: str) -> str:
+    """Backend of a model, MODEL_BACKENDS in the config overrides models."""
+    overrides = config.get("MODEL_BACKENDS") or {}
+    return overrides.get(model_id, models[model_id].get("backend", "torch"))
+
+
 class ASRGenerator:
+    """
+    Transcribes audio with the model of MODEL_IDs serving each language.
+
+    Models are loaded on first use through a ModelRegistry that keeps the
+    recently used ones within MODEL_MEMORY_BUDGET_MB. Languages in
+    MODEL_PRELOAD are loaded here, before the engine forks its workers, so
+    their weights are shared; the others are loaded by each worker on demand.
+    """
+
     def __init__(self):
         model_ids = config.MODEL_IDs
         # Check if GPU is available and set device
         self._device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         logger.info(f"Device: {self._device}")
-        self._processor = {}
-        self._model = {}
+        self._model_ids = {}
         self._model_type = {}
+        self._alignment_args = {}
         for model_id in model_ids.split(","):
-            self._load_model(model_id)
+            model_lang = models[model_id]["lang"]
+            self._model_ids[model_lang] = model_id
+            self._model_type[model_lang] = models[model_id]["type"]
+            if not os.path.exists(models[model_id]["model_path"]):
+                logger.warning(
+                    "Model not found",
+                    model_path=models[model_id]["model_path"],
+                )
+        self._registry = ModelRegistry(
+            loader=self._load_model,
+            budget_mb=config.get("MODEL_MEMORY_BUDGET_MB", 0),
+            on_evict=self._release_memory,
+        )
+        preload = config.get("MODEL_PRELOAD", "all")
+        langs = self._model_ids if preload == "all" else preload.split(",")
+        for lang in langs:
+            if lang:
+                self._registry.get(lang)
 
-    def _load_model(self, model_id: str) -> Dict:
-        # Load model and processor
+    def _load_model(self, lang: str) -> Tuple[Dict, int]:
+        """Registry loader: the model and processor serving a language."""
+        model_id = self._model_ids[lang]
         model_path = models[model_id]["model_path"]
-        model_lang = models[model_id]["lang"]
         model_type = models[model_id]["type"]
-        self._model_type[model_lang] = model_type
-        if os.path.exists(model_path):
-            logger.info("Loading model...", model_id=model_id)
-            if model_type == "wav2vec2":
-                self._processor[model_lang] = Wav2Vec2Processor.from_pretrained(
-                    model_path
-                )
-                self._model[model_lang] = Wav2Vec2ForCTC.from_pretrained(model_path).to(
-                    self._device
-                )
-                self._model[model_lang].eval()  # Set model to evaluation mode
-            elif model_type == "whisper":
-                self._processor[model_lang] = WhisperProcessor.from_pretrained(
-                    model_path
-                )
-                self._model[model_lang] = (
-                    WhisperForConditionalGeneration.from_pretrained(model_path).to(
-                        self._device
-                    )
-                )
-                self._model[model_lang].eval()  # Set model to evaluation mode
-            elif model_type == "speechbrain_whisper":
-                self._model[model_lang] = WhisperASR.from_hparams(
-                    source=model_path,
-                    savedir=cache_dir,
-                    run_opts={"device": self._device},
-                )
-                self._model[model_lang].eval()
-            logger.info("Model loaded", model_id=model_id, model_path=model_path)
-        else:
-            logger.warning(
-                "Model not found",
-                model_path=model_path,
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found: {model_path}")
+        logger.info("Loading model...", model_id=model_id)
+        processor = None
+        if model_type == "wav2vec2":
+            processor = Wav2Vec2Processor.from_pretrained(model_path)
+            model = load_wav2vec2(model_path, get_backend(model_id), self._device)
+        elif model_type == "whisper":
+            processor = WhisperProcessor.from_pretrained(model_path)
+            model = WhisperForConditionalGeneration.from_pretrained(model_path).to(
+                self._device
             )
+            model.eval()  # Set model to evaluation mode
+        elif model_type == "speechbrain_whisper":
+            model = WhisperASR.from_hparams(
+                source=model_path,
+                savedir=cache_dir,
+                run_opts={"device": self._device},
+            )
+            model.eval()
+        logger.info("Model loaded", model_id=model_id, model_path=model_path)
+        return {"model": model, "processor": processor}, model_size_bytes(model)
+
+    def _release_memory(self, lang: str):
+        gc.collect()
+        if self._device.type == "cuda":
+            torch.cuda.empty_cache()
+
+    def _get(self, lang: str) -> Tuple:
+        """(model, processor) of a language, loading them if needed."""
+        entry = self._registry.get(lang)
+        return entry["model"], entry["processor"]
 
-    async def do_asr(self, input_path: str, lang: str):
+    def model_metrics(self) -> Dict:
+        """Load/evict counters and resident models of the registry."""
+        return self._registry.metrics()
+
+    def do_asr(self, input_path: str, lang: str, word_timestamps: bool = False) -> Dict:
+        """
+        Transcribe one file, returns {"text": str, "segments": list or None}.
+
+        segments are the speech regions found by the VAD with their start and
+        end in seconds of the original file. With word_timestamps the result
+        also has "words", [word, start, end, confidence] rows taken from the
+        CTC frames (wav2vec2 only, None otherwise).
+        """
         if self._model_type[lang] == "wav2vec2":
-            audio, sr = librosa.load(input_path, sr=16000)
-            input_values = self._processor[lang](
-                audio, sampling_rate=sr, return_tensors="pt", padding=True
-            ).input_values.to(self._device)
-            with torch.no_grad():
-                logits = self._model[lang](input_values).logits
-            predicted_ids = torch.argmax(logits, dim=-1)
-            transcription = self._processor[lang].batch_decode(predicted_ids)[0]
-        elif self._model_type[lang] == "whisper":
-            audio, sr = librosa.load(input_path, sr=16000)
-            audio = np.array(audio).astype(np.float32)
+            return self.do_asr_batch(
+                input_paths=[input_path], lang=lang, word_timestamps=word_timestamps
+            )[0]
+        model, processor = self._get(lang)
+        if self._model_type[lang] == "whisper":
+            audio = np.array(audio_ingest.load_audio(input_path), dtype=np.float32)
             # Process with Whisper processor
-            input_features = self._processor[lang](
+            input_features = processor(
                 audio, sampling_rate=16000, return_tensors="pt"
             ).input_features
             input_features = input_features.to(self._device)
             # Generate token ids
-            predicted_ids = self._model[lang].generate(input_features)
+            predicted_ids = model.generate(input_features)
             # Decode token ids to text
-            transcription = self._processor[lang].batch_decode(
+            transcription = processor.batch_decode(
                 predicted_ids, skip_special_tokens=True
             )[0]
         elif self._model_type[lang] == "speechbrain_whisper":
-            resp = self._model[lang].transcribe_file(input_path)
+            resp = model.transcribe_file(input_path)
             transcription = " ".join([item.words for item in resp])
         logger.debug(f"{transcription=}")
-        return transcription
+        result = {"text": transcription, "segments": None}
+        if word_timestamps:
+            result["words"] = None
+        return result
+
+    def do_asr_batch(
+        self, input_paths: List[str], lang: str, word_timestamps: bool = False
+    ) -> List[Dict]:
+        """Transcribe several files of one language with batched forward passes.
+
+        With VAD_ENABLED only the speech regions of the files go through the
+        model: the regions of all files are batched together and the text of
+        each file is the text of its regions joined in order. Only wav2vec2
+        models are batched; other model types are transcribed one by one.
+        """
+        if self._model_type[lang] != "wav2vec2":
+            return [
+                self.do_asr(
+                    input_path=input_path, lang=lang, word_timestamps=word_timestamps
+                )
+                for input_path in input_paths
+            ]
+        audios = [audio_ingest.load_audio(input_path) for input_path in input_paths]
+        if config.get("VAD_ENABLED", True):
+            regions = [vad.speech_regions(audio) for audio in audios]
+        else:
+            regions = [[(0, len(audio))] if len(audio) else [] for audio in audios]
+        segments = [
+            (i, start, end)
+            for i, file_regions in enumerate(regions)
+            for start, end in file_regions
+        ]
+        audio_samples = sum(len(audio) for audio in audios)
+        speech_samples = sum(end - start for _, start, end in segments)
+        logger.debug(
+            "Speech regions",
+            audio_s=round(audio_samples / 16000, 2),
+            speech_s=round(speech_samples / 16000, 2),
+        )
+        # Similar lengths share a batch to keep padding low
+        order = sorted(
+            range(len(segments)), key=lambda k: segments[k][2] - segments[k][1]
+        )
+        batch_size = config.get("VAD_SEGMENT_BATCH_SIZE", 16)
+        texts = [None] * len(segments)
+        for b in range(0, len(order), batch_size):
+            batch = order[b : b + batch_size]
+            clips = [
+                audios[segments[k][0]][segments[k][1] : segments[k][2]] for k in batch
+            ]
+            offsets = [segments[k][1] / 16000 for k in batch]
+            batch_texts = self._transcribe_audios(
+                clips, lang=lang, word_timestamps=word_timestamps, offsets=offsets
+            )
+            for k, text in zip(batch, batch_texts):
+                texts[k] = text
+        results = [{"text": "", "segments": []} for _ in input_paths]
+        if word_timestamps:
+            for result in results:
+                result["words"] = []
+        for (i, start, end), (text, words) in zip(segments, texts):
+            text = text.strip()
+            if not text:
+                continue
+            result = results[i]
+            if word_timestamps:
+                result["words"].extend(words)
+            result["text"] = f"{result['text']} {text}" if result["text"] else text
+            result["segments"].append(
+                {
+                    "start": round(start / 16000, 2),
+                    "end": round(end / 16000, 2),
+                    "text": text,
+                }
+            )
+        logger.debug(f"{results=}")
+        return results
+
+    def _transcribe_audios(
+        self,
+        audios: List[np.ndarray],
+        lang: str,
+        word_timestamps: bool = False,
+        offsets: Optional[List[float]] = None,
+    ) -> List[Tuple[str, Optional[list]]]:
+        """
+        CTC transcription of 16 kHz clips in a single forward pass.
+
+        Returns (text, words) per clip; words is None unless word_timestamps,
+        their times are shifted by the clip offsets (seconds).
+        """
+        model, processor = self._get(lang)
+        inputs = processor(
+            audios, sampling_rate=16000, return_tensors="pt", padding=True
+        )
+        input_values = inputs.input_values.to(self._device)
+        # Only models trained with attention mask return one (e.g. xlsr-53)
+        attention_mask = inputs.get("attention_mask")
+        if attention_mask is not None:
+            attention_mask = attention_mask.to(self._device)
+        with torch.no_grad():
+            logits = model(input_values, attention_mask=attention_mask).logits
+        predicted_ids = torch.argmax(logits, dim=-1)
+        # Drop frames that belong to padding before decoding
+        output_lengths = model._get_feat_extract_output_lengths(
+            torch.tensor([len(audio) for audio in audios])
+        )
+        texts = [
+            processor.decode(predicted_ids[i, : output_lengths[i]])
+            for i in range(len(audios))
+        ]
+        if not word_timestamps:
+            return [(text, None) for text in texts]
+        logits = logits.float().cpu().numpy()
+        results = []
+        for i, text in enumerate(texts):
+            ids, probs = alignment.frame_scores(logits[i, : output_lengths[i]])
+            words = alignment.word_alignments(
+                ids,
+                probs,
+                offset_s=offsets[i] if offsets else 0.0,
+                **self._get_alignment_args(lang),
+            )
+            results.append((text, words))
+        return results
+
+    def _get_alignment_args(self, lang: str) -> Dict:
+        """Vocabulary and frame duration of a wav2vec2 model for alignment."""
+        if lang not in self._alignment_args:
+            model, processor = self._get(lang)
+            tokenizer = processor.tokenizer
+            vocab_size = model.config.vocab_size
+            tokens = tokenizer.convert_ids_to_tokens(list(range(vocab_size)))
+            self._alignment_args[lang] = {
+                # Ids past the tokenizer vocabulary never appear in greedy paths
+                "tokens": np.array([token or "" for token in tokens], dtype=object),
+                "blank_id": tokenizer.pad_token_id,
+                "delimiter_id": tokenizer.word_delimiter_token_id,
+                "frame_s": model.config.inputs_to_logits_ratio / 16000,
+            }
+        return self._alignment_args[lang]
+
+    def is_long_audio(self, input_path: str, lang: str) -> bool:
+        """Whether the file should be transcribed with do_asr_chunked."""
+        if self._model_type[lang] != "wav2vec2":
+            return False
+        threshold = config.get("ASR_CHUNK_THRESHOLD_S", 60)
+        return audio_ingest.get_duration(input_path) > threshold
+
+    def _iter_windows(
+        self, input_path: str, window_s: float, stride_s: float
+    ) -> Iterator[Tuple[np.ndarray, int, int]]:
+        """
+        Yield overlapping 16 kHz windows of the file as (audio, left, right).
+
+        left and right are the number of context samples at each side of the
+        window that belong to the neighbouring windows. Windows are sliced from
+        the audio cache when the file is there; otherwise only one window is
+        decoded at a time, so memory does not depend on the file length.
+        """
+        audio = audio_ingest.cached(input_path)
+        sound_file = None
+        if audio is None:
+            try:
+                sound_file = sf.SoundFile(input_path)
+            except Exception:
+                # Formats libsndfile can't read are decoded in one go
+                audio = audio_ingest.load_audio(input_path)
+        if sound_file is not None:
+            sr, frames = sound_file.samplerate, sound_file.frames
+        else:
+            sr, frames = 16000, len(audio)
+        window = int(window_s * sr)
+        stride = int(stride_s * sr)
+        step = window - 2 * stride
+        pos = 0
+        try:
+            while True:
+                is_last = pos + window >= frames
+                if sound_file is not None:
+                    sound_file.seek(pos)
+                    block = sound_file.read(window, dtype="float32", always_2d=True)
+                    block = block.mean(axis=1)
+                    block = audio_ingest.resample(block, sr)
+                else:
+                    block = audio[pos : pos + window]
+                left = 0 if pos == 0 else int(stride * 16000 / sr)
+                right = 0 if is_last else int(stride * 16000 / sr)
+                yield block, left, right
+                if is_last:
+                    break
+                pos += step
+        finally:
+            if sound_file is not None:
+                sound_file.close()
+
+    async def do_asr_chunked(
+        self,
+        input_path: str,
+        lang: str,
+        on_partial: Optional[Callable[[str], Awaitable]] = None,
+        word_timestamps: bool = False,
+    ) -> Dict:
+        """
+        Transcribe long audio in fixed windows that overlap by ASR_CHUNK_STRIDE_S.
+
+        CTC runs per window and the logits of the overlapping context are
+        dropped, so every frame is taken from the window where it had full
+        context. Token ids are concatenated before decoding, so repeated
+        tokens across a boundary are merged by the usual CTC collapse.
+        on_partial is awaited with the text decoded so far after every window.
+        Returns the same dict as do_asr, without segments.
+        """
+        window_s = config.get("ASR_CHUNK_LENGTH_S", 30)
+        stride_s = config.get("ASR_CHUNK_STRIDE_S", 5)
+        windows = self._iter_windows(input_path, window_s, stride_s)
+        predicted_ids, frame_probs = [], []
+        while True:
+            # Every window runs separately so other requests can interleave
+            frames = await executor.run_in_thread(
+                lang, self._next_window_frames, windows=windows, lang=lang
+            )
+            if frames is None:
+                break
+            # Resident now, the first window has loaded it
+            _, processor = self._get(lang)
+            predicted_ids.append(frames[0])
+            frame_probs.append(frames[1])
+            if on_partial is not None:
+                ids = np.concatenate(predicted_ids)
+                await on_partial(processor.decode(ids.tolist()))
+        ids = np.concatenate(predicted_ids)
+        transcription = processor.decode(ids.tolist())
+        logger.debug(f"{transcription=}")
+        result = {"text": transcription, "segments": None}
+        if word_timestamps:
+            # Kept frames tile the file, so frame index maps to file time
+            result["words"] = alignment.word_alignments(
+                ids, np.concatenate(frame_probs), **self._get_alignment_args(lang)
+            )
+        return result
+
+    def _next_window_frames(
+        self, windows: Iterator[Tuple[np.ndarray, int, int]], lang: str
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """CTC ids and probabilities of the next window without its context frames."""
+        window = next(windows, None)
+        if window is None:
+            return None
+        audio, left, right = window
+        model, processor = self._get(lang)
+        ratio = model.config.inputs_to_logits_ratio
+        if config.get("VAD_ENABLED", True) and not vad.has_speech(audio):
+            # Silent window: CTC blanks, no forward pass
+            length = model._get_feat_extract_output_lengths(
+                torch.tensor(len(audio))
+            )
+            blank = processor.tokenizer.pad_token_id
+            ids = np.full(int(length), blank, dtype=np.int64)
+            probs = np.ones(int(length), dtype=np.float32)
+        else:
+            input_values = processor(
+                audio, sampling_rate=16000, return_tensors="pt"
+            ).input_values.to(self._device)
+            with torch.no_grad():
+                logits = model(input_values).logits[0]
+            ids, probs = alignment.frame_scores(logits.float().cpu().numpy())
+        keep = slice(round(left / ratio), len(ids) - round(right / ratio))
+        return ids[keep], probs[keep]
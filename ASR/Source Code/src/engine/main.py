@@ -41,31 +41,84 @@ logger.info("Starting service...", version=__version__)
 from generators import ASRGenerator
 import aio_pika
 import asyncio
-from core.queue_utils import process_message
+import torch
+from core.queue_utils import process_message, process_online_message
+from core.batcher import ASRBatcher
+from core.audio_ingest import clean_audio_cache
+from core.executor import executor
+from core.launcher import run_workers
 
 
-async def main():
-    asr_generator = ASRGenerator()
+async def log_model_metrics(asr_generator: ASRGenerator, interval_s: float):
+    """Log the model registry counters every interval_s (MODEL_METRICS_LOG_S)."""
+    while True:
+        await asyncio.sleep(interval_s)
+        logger.info("Model metrics", pid=os.getpid(), **asr_generator.model_metrics())
+
+
+async def main(asr_generator: ASRGenerator):
+    batcher = ASRBatcher(
+        asr_generator,
+        max_batch_size=config.get("ASR_BATCH_MAX_SIZE", 1),
+        max_wait_ms=config.get("ASR_BATCH_MAX_WAIT_MS", 0),
+    )
     connection = await aio_pika.connect_robust(config["QUEUE_CONNECTION"])
 
     # Create separate channels for consuming and publishing
     task_channel = await connection.channel()
     result_channel = await connection.channel()
 
+    # Unacked messages RabbitMQ delivers to this process
+    await task_channel.set_qos(prefetch_count=config.get("PREFETCH_COUNT", 1))
+    # Handlers running at the same time in this process
+    semaphore = asyncio.Semaphore(config.get("CONSUMER_CONCURRENCY", 1))
+
     # Configure task queue
     task_queue = await task_channel.declare_queue("task_queue", durable=True)
+    # Online requests have their own queue and handlers, so an offline backlog
+    # doesn't delay them
+    online_queue = await task_channel.declare_queue("online_task_queue")
+    online_semaphore = asyncio.Semaphore(config.get("ONLINE_CONCURRENCY", 4))
+
+    async def on_message(message: aio_pika.IncomingMessage):
+        async with semaphore:
+            await process_message(message, result_channel, asr_generator, batcher)
+
+    async def on_online_message(message: aio_pika.IncomingMessage):
+        async with online_semaphore:
+            await process_online_message(message, result_channel, asr_generator)
 
     # Start consuming tasks
-    await task_queue.consume(
-        lambda message: process_message(message, result_channel, asr_generator)
-    )
+    await task_queue.consume(on_message)
+    await online_queue.consume(on_online_message)
+    cleanup_task = asyncio.create_task(clean_audio_cache())
+    metrics_task = None
+    if config.get("MODEL_METRICS_LOG_S", 300):
+        metrics_task = asyncio.create_task(
+            log_model_metrics(asr_generator, config["MODEL_METRICS_LOG_S"])
+        )
 
     # Keep connection alive
     try:
         await asyncio.Future()
     finally:
+        cleanup_task.cancel()
+        if metrics_task is not None:
+            metrics_task.cancel()
         await connection.close()
+        executor.shutdown()
+
+
+def run_worker(asr_generator: ASRGenerator):
+    if config.get("TORCH_NUM_THREADS"):
+        torch.set_num_threads(config["TORCH_NUM_THREADS"])
+    asyncio.run(main(asr_generator))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Models are loaded before forking so workers share the weights
+    asr_generator = ASRGenerator()
+    run_workers(
+        lambda: run_worker(asr_generator),
+        num_workers=config.get("WORKER_PROCESSES", 1),
+    )
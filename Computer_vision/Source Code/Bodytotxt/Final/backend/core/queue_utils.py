@@ -1,65 +1,93 @@
 import aio_pika
+import asyncio
 import json
 from loguru import logger
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List
 from config.config_handler import config
-from core import webhook_handler
-from sqlalchemy.orm import Session
+from core.status_stream import broker
+from core.webhook_dispatcher import dispatcher
+from sqlalchemy.ext.asyncio import AsyncSession
 from dbutils import crud
+from dbutils.database import AsyncSessionLocal
 from dbutils.schemas import WebhookStatus
 
+# Map status string to WebhookStatus enum
+status_map = {
+    "pending": WebhookStatus.pending,
+    "in_progress": WebhookStatus.in_progress,
+    "completed": WebhookStatus.completed,
+    "failed": WebhookStatus.failed,
+}
 
-async def consume_results(connection: aio_pika.RobustConnection, db: Session):
-    """Consume results from the body posture result queue and update the database."""
+
+async def consume_results(connection: aio_pika.RobustConnection):
+    """Consume results from the body posture queue into the database."""
+    batch_size = config.get("RESULT_BATCH_SIZE", 64)
     async with connection:
         channel = await connection.channel()
+        await channel.set_qos(prefetch_count=batch_size)
         queue = await channel.declare_queue("body_posture_result_queue", durable=True)
 
-        async for message in queue:
-            async with message.process():
-                try:
-                    result = json.loads(message.body.decode())
-                    request_id = result["request_id"]
-
-                    logger.info(f"Processing result for request_id: {request_id}, status: {result['status']}")
-
-                    # Map status string to WebhookStatus enum
-                    status_map = {
-                        "pending": WebhookStatus.pending,
-                        "in_progress": WebhookStatus.in_progress,
-                        "completed": WebhookStatus.completed,
-                        "failed": WebhookStatus.failed
-                    }
+        # Results that arrive together are written in one transaction
+        messages: asyncio.Queue = asyncio.Queue()
+        await queue.consume(messages.put)
+        while True:
+            batch = [await messages.get()]
+            while len(batch) < batch_size and not messages.empty():
+                batch.append(messages.get_nowait())
+            await _save_results(batch)
 
-                    status = status_map.get(result["status"], WebhookStatus.failed)
 
-                    # Update database
-                    update_success = crud.update_request(
-                        db=db,
-                        request_id=request_id,
-                        status=status,
-                        result=result.get("results"),
-                        error=result.get("error"),
-                    )
-
-                    if not update_success:
-                        logger.error(f"Failed to update database for request_id: {request_id}")
-                        continue
+async def _save_results(batch: List[aio_pika.IncomingMessage]):
+    results = []
+    for message in batch:
+        try:
+            result = json.loads(message.body.decode())
+            result["status"] = status_map.get(result["status"], WebhookStatus.failed)
+            results.append(result)
+        except Exception as e:
+            logger.exception(f"Error consuming result: {e}")
+    try:
+        async with AsyncSessionLocal() as db:
+            saved = [result for result in results if await _save_result(db, result)]
+            await db.commit()
+    except Exception:
+        logger.opt(exception=True).warning(
+            "Failed to save results, retrying one by one", count=len(results)
+        )
+        saved = []
+        for result in results:
+            try:
+                async with AsyncSessionLocal() as db:
+                    if await _save_result(db, result):
+                        saved.append(result)
+                    await db.commit()
+            except Exception as e:
+                logger.exception(f"Error consuming result: {e}")
+    # Only committed results are pushed, a stream never runs ahead of the DB
+    for result in saved:
+        broker.publish(result)
+    dispatcher.notify()
+    for message in batch:
+        await message.ack()
 
-                    # Call appropriate webhook based on status
-                    if status == WebhookStatus.in_progress:
-                        webhook_success = webhook_handler.set_inprogress(request_id=request_id)
-                        logger.info(
-                            f"In-progress webhook for {request_id}: {'Success' if webhook_success else 'Failed'}")
-                    elif status == WebhookStatus.completed:
-                        webhook_success = webhook_handler.set_completed(request_id=request_id, db=db)
-                        logger.info(f"Completed webhook for {request_id}: {'Success' if webhook_success else 'Failed'}")
-                    elif status == WebhookStatus.failed:
-                        webhook_success = webhook_handler.set_failed(request_id=request_id)
-                        logger.info(f"Failed webhook for {request_id}: {'Success' if webhook_success else 'Failed'}")
 
-                except Exception as e:
-                    logger.exception(f"Error consuming result: {e}")
+async def _save_result(db: AsyncSession, result: dict) -> bool:
+    request_id = result["request_id"]
+    update_success = await crud.update_request(
+        db=db,
+        request_id=request_id,
+        status=result["status"],
+        result=result.get("results"),
+        error=result.get("error"),
+    )
+    if not update_success:
+        logger.error(f"Failed to update database for request_id: {request_id}")
+        return False
+    # Sent by the webhook dispatcher once this transaction is committed
+    if result["status"].name in ["in_progress", "completed", "failed"]:
+        await crud.add_webhook(db=db, request_id=request_id, status=result["status"])
+    return True
 
 
 async def get_rabbitmq_connection() -> AsyncGenerator[aio_pika.RobustConnection, None]:
@@ -68,4 +96,4 @@ async def get_rabbitmq_connection() -> AsyncGenerator[aio_pika.RobustConnection,
     try:
         yield connection
     finally:
-        await connection.close()
\ No newline at end of file
+        await connection.close()
@@ -1,44 +1,45 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from dbutils import models
 from loguru import logger
-from core.messages import Message  # Fixed import
+from core.messages import Message
 from datetime import datetime
 from dbutils.schemas import WebhookStatus
-from typing import Dict
+from typing import Dict, List, Set
 from sqlalchemy.exc import IntegrityError
 
 
-
-def clear_database(db: Session):
+async def clear_database(db: AsyncSession):
     try:
-        db.query(models.Manager).delete()
-        db.commit()
+        await db.execute(delete(models.Manager))
+        await db.commit()
         return True
     except Exception as exp:
         logger.opt(exception=False, colors=True).warning(f"Failed: {exp.args}")
-        db.rollback()
+        await db.rollback()
         return False
 
 
-def get_request(
-    db: Session,
+async def get_request(
+    db: AsyncSession,
     request_id: str,
 ):
-    item = (
-        db.query(models.Manager).filter(models.Manager.request_id == request_id).first()
+    item = await db.scalar(
+        select(models.Manager).where(models.Manager.request_id == request_id)
     )
     return item
 
 
-def add_request(db: Session, **kwargs):
+async def add_request(db: AsyncSession, **kwargs):
     kwargs["itime"] = datetime.now(tz=None)
     item = models.Manager(**kwargs)
     try:
         db.add(item)
-        db.commit()
+        await db.commit()
         return Message("en").INF_SUCCESS()
     except IntegrityError as e:
-        if "UNIQUE constraint failed: facetotxt_manager.request_id" in str(e.args):
+        await db.rollback()
+        if "UNIQUE constraint failed: bodytotxt_manager.request_id" in str(e.args):
             msg = Message("fa").ERR_DUPLICATE_REQUEST_ID()
             return msg
         else:
@@ -46,27 +47,151 @@ def add_request(db: Session, **kwargs):
             msg = Message("en").ERR_FAILED_TO_ADD_TO_DB()
             return msg
     except Exception:
+        await db.rollback()
         logger.opt(exception=True).error("Failed to add_request")
         msg = Message("en").ERR_FAILED_TO_ADD_TO_DB()
         return msg
 
 
-def update_request(
-    db: Session, request_id: str, status: WebhookStatus, result: Dict, error: str = None
-):
-    item = (
-        db.query(models.Manager).filter(models.Manager.request_id == request_id).first()
+async def update_request(
+    db: AsyncSession,
+    request_id: str,
+    status: WebhookStatus,
+    result: Dict,
+    error: str = None,
+) -> bool:
+    """Single UPDATE of a request; the caller commits (results are batched)."""
+    values = {"utime": datetime.now(tz=None), "status": status, "result": result}
+    if error is not None:
+        values["error"] = error
+    response = await db.execute(
+        update(models.Manager)
+        .where(models.Manager.request_id == request_id)
+        .values(**values)
     )
+    return response.rowcount > 0
+
+
+async def set_webhook_result(
+    db: AsyncSession,
+    request_id: str,
+    webhook_status_code: int,
+    increase_retry: bool = True,
+) -> bool:
+    values = {
+        "utime": datetime.now(tz=None),
+        "webhook_status_code": webhook_status_code,
+    }
+    if increase_retry:
+        values["webhook_retry_count"] = case(
+            (models.Manager.webhook_retry_count.is_(None), 0),
+            else_=models.Manager.webhook_retry_count + 1,
+        )
+    try:
+        response = await db.execute(
+            update(models.Manager)
+            .where(models.Manager.request_id == request_id)
+            .values(**values)
+        )
+        await db.commit()
+        return response.rowcount > 0
+    except Exception:
+        logger.opt(exception=True, colors=True).error("Failed to set_webhook_result")
+        await db.rollback()
+        return False
+
+
+async def get_active_blob_refs(db: AsyncSession) -> Set[str]:
+    """Blob references of the requests still pending or in progress."""
+    refs = await db.scalars(
+        select(models.Manager.image_path)
+        .where(
+            models.Manager.status.in_(
+                [WebhookStatus.pending, WebhookStatus.in_progress]
+            )
+        )
+        .where(models.Manager.image_path.is_not(None))
+    )
+    return set(refs)
+
+
+async def add_webhook(
+    db: AsyncSession, request_id: str, status: WebhookStatus
+) -> bool:
+    """
+    Queue a webhook, replacing an in_progress one that has not been sent yet.
+    The caller commits (results are batched).
+    """
+    item = await db.get(models.WebhookOutbox, request_id)
+    now = datetime.now(tz=None)
     if item is None:
+        item = models.WebhookOutbox(
+            request_id=request_id, status=status, next_attempt=now, itime=now
+        )
+        db.add(item)
+        # The session doesn't autoflush: without this, a second result of the
+        # same request in the batch wouldn't find the row and add it again
+        await db.flush()
+    elif (
+        item.status == WebhookStatus.in_progress
+        or status != WebhookStatus.in_progress
+    ):
+        item.status = status
+        item.next_attempt = now
+    else:
+        # A late in_progress must not replace a final status
         return False
-    item.utime = datetime.now(tz=None)
-    item.status = status
-    item.result = result
-    if error is not None:
-        item.error = error
+    return True
+
+
+async def get_due_webhooks(
+    db: AsyncSession, limit: int, exclude: List[str]
+) -> List[tuple]:
+    items = await db.execute(
+        select(models.WebhookOutbox.request_id, models.WebhookOutbox.status)
+        .where(models.WebhookOutbox.next_attempt <= datetime.now(tz=None))
+        .where(models.WebhookOutbox.request_id.notin_(exclude))
+        .order_by(models.WebhookOutbox.next_attempt)
+        .limit(limit)
+    )
+    return [(item.request_id, item.status) for item in items]
+
+
+async def delete_webhook(
+    db: AsyncSession, request_id: str, status: WebhookStatus
+) -> bool:
+    """Remove a sent webhook unless a newer status replaced it meanwhile."""
     try:
-        db.commit()
+        await db.execute(
+            delete(models.WebhookOutbox).where(
+                models.WebhookOutbox.request_id == request_id,
+                models.WebhookOutbox.status == status,
+            )
+        )
+        await db.commit()
         return True
     except Exception:
-        logger.opt(exception=True, colors=True).error("Failed to update_request")
-        return False
\ No newline at end of file
+        logger.opt(exception=True, colors=True).error("Failed to delete_webhook")
+        await db.rollback()
+        return False
+
+
+async def retry_webhook(
+    db: AsyncSession, request_id: str, status: WebhookStatus, next_attempt: datetime
+) -> bool:
+    try:
+        await db.execute(
+            update(models.WebhookOutbox)
+            .where(
+                models.WebhookOutbox.request_id == request_id,
+                models.WebhookOutbox.status == status,
+            )
+            .values(next_attempt=next_attempt)
+        )
+        await db.commit()
+        return True
+    except Exception:
+        logger.opt(exception=True, colors=True).error("Failed to retry_webhook")
+        await db.rollback()
+        return False
+
@@ -1,25 +1,28 @@
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, WebSocket
+from sqlalchemy.ext.asyncio import AsyncSession
 import aio_pika
 import uuid
 import json
 import asyncio
-import base64
 from core.messages import Message
 from datetime import datetime
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from loguru import logger
 import os
 from version import __version__
 from config.config_handler import config
 from core.queue_utils import consume_results, get_rabbitmq_connection
+from core.webhook_dispatcher import dispatcher
+from core.status_stream import broker, status_event
+from core.blobstore import clean_expired_blobs
+from core.upload import UploadLimitMiddleware, store_upload
 from dbutils import schemas, crud
 import sys
 from starlette.middleware.cors import CORSMiddleware
 from core import base
-from dbutils.database import SessionLocal
+from dbutils.database import AsyncSessionLocal
 
 
 if os.environ.get("MODE", "dev") == "prod":
@@ -54,20 +57,27 @@ logger.add(
 logger.info("Starting Body Posture Detection Service", version=__version__)
 
 
+async def active_blob_refs():
+    async with AsyncSessionLocal() as db:
+        return await crud.get_active_blob_refs(db=db)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan to start the result consumer."""
     try:
         connection = await aio_pika.connect_robust(config["QUEUE_CONNECTION"])
-        db = SessionLocal()
-        asyncio.create_task(consume_results(connection, db))
+        asyncio.create_task(consume_results(connection))
+        asyncio.create_task(dispatcher.run())
+        asyncio.create_task(clean_expired_blobs(active_blob_refs))
         yield
     finally:
-        db.close()
         await connection.close()
 
 
 app = FastAPI(lifespan=lifespan)
+# Inside CORS so a 413 still carries the CORS headers
+app.add_middleware(UploadLimitMiddleware, routes=app.routes)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -84,7 +94,7 @@ async def process_image(
         request_id: str = Form(None),
         priority: int = Form(1),
         connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-        db: Session = Depends(base.get_db),
+        db: AsyncSession = Depends(base.get_db),
 ):
     logger.info("/bodytotxt/image-to-txt-offline", image=image.filename, request_id=request_id)
 
@@ -93,16 +103,19 @@ async def process_image(
         request_id = str(uuid.uuid4())
 
     try:
-        # Read the image
-        image_data = await image.read()
+        # Stream the image into the blob store
+        blob_ref = await store_upload(image, "process_image")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to read image: {e}")
         return Message("fa").ERR_INVALID_INPUT()
 
     # Add request to database
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
+        image_path=blob_ref,
         status=schemas.WebhookStatus.pending,
         itime=datetime.now(tz=None),
     )
@@ -113,12 +126,9 @@ async def process_image(
     # Create channel
     channel = await connection.channel()
 
-    # Convert image to base64
-    base64_image = base64.b64encode(image_data).decode('utf-8')
-
     # Prepare message
     message_body = {
-        "image": base64_image,
+        "blob": blob_ref,
         "request_id": request_id,
         "priority": priority,
     }
@@ -140,16 +150,54 @@ async def process_image(
 
 
 @app.get("/aihive-bodytotxt/api/v1/status/{request_id}")
-async def get_status(request_id: str, db: Session = Depends(base.get_db)):
+async def get_status(request_id: str, db: AsyncSession = Depends(base.get_db)):
     logger.info("/bodytotxt/status", request_id=request_id)
-    task = crud.get_request(db=db, request_id=request_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    task = broker.get_cached(request_id)
+    if task is None:
+        task = await crud.get_request(db=db, request_id=request_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        broker.cache(request_id, task)
     msg = Message("fa").INF_SUCCESS()
     msg["data"] = task
     return msg
 
 
+async def subscribe_status(request_id: str):
+    """Subscribe to the events of a request, returns (queue, current status)."""
+    queue = broker.subscribe(request_id)
+    async with AsyncSessionLocal() as db:
+        task = await crud.get_request(db=db, request_id=request_id)
+    if not task:
+        broker.unsubscribe(request_id, queue)
+        return None, None
+    return queue, status_event(task)
+
+
+@app.get("/aihive-bodytotxt/api/v1/status/{request_id}/stream")
+async def stream_status(request_id: str):
+    logger.info("/bodytotxt/status/stream", request_id=request_id)
+    queue, current = await subscribe_status(request_id)
+    if queue is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return StreamingResponse(
+        broker.sse(request_id, queue, current),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/aihive-bodytotxt/api/v1/status/{request_id}/ws")
+async def status_websocket(websocket: WebSocket, request_id: str):
+    logger.info("/bodytotxt/status/ws", request_id=request_id)
+    queue, current = await subscribe_status(request_id)
+    if queue is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    await broker.websocket(websocket, request_id, queue, current)
+
+
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
 from utils import PoseDetector, FallDetector
+from core.executor import executor
+from core.blobstore import blob_store
 import aio_pika
 import json
-import base64
 import numpy as np
 import cv2
 from loguru import logger
@@ -32,11 +33,11 @@ else:
     logger.info("Using CPU for processing")
 
 
-async def process_image(encoded_image):
+def process_image(blob_ref):
     logger.info("Starting body posture image processing")
     try:
-        # Decode base64 image
-        image_data = base64.b64decode(encoded_image)
+        # Map the image from the blob store without copying it
+        image_data = blob_store.open_memmap(blob_ref)
 
         # Process image with pose detection
         logger.info("Starting pose detection")
@@ -88,7 +89,7 @@ async def process_message(
         try:
             # Parse the message body
             message_body = json.loads(message.body.decode())
-            encoded_image = message_body["image"]
+            blob_ref = message_body["blob"]
             request_id = message_body["request_id"]
             priority = message_body.get("priority", 1)
 
@@ -109,7 +110,9 @@ async def process_message(
             )
 
             # Process the image
-            results = await process_image(encoded_image)
+            results = await executor.run_in_thread(
+                "body", process_image, blob_ref
+            )
 
             if results:
                 # Successful processing
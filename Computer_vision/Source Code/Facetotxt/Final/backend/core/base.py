@@ -1,21 +1,18 @@
 import os
-from dbutils import models
-from dbutils.database import SessionLocal, engine
+from dbutils.migrations import migrate
+from dbutils.database import AsyncSessionLocal, engine
 from config.config_handler import config
 
 
-models.Base.metadata.create_all(bind=engine)
+migrate(engine)
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 class Base:
     def __init__(self):
         if not os.path.exists(config["DB_DIR"]):
-            os.makedirs(config["DB_DIR"])
\ No newline at end of file
+            os.makedirs(config["DB_DIR"])
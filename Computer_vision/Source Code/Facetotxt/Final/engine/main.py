@@ -5,6 +5,7 @@ import sys
 from loguru import logger
 from config.config_handler import config
 from core.queue_utils import process_message
+from core.executor import executor
 
 # Set up logging directories
 if os.environ.get("MODE", "dev") == "prod":
@@ -88,6 +89,7 @@ async def main():
                 logger.info("RabbitMQ connection closed")
         except Exception as e:
             logger.error(f"Error closing connection: {e}")
+        executor.shutdown()
 
 
 if __name__ == "__main__":
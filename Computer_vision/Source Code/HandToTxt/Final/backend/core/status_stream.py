@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from config.config_handler import config
+from enum import Enum
+from fastapi import WebSocket, WebSocketDisconnect
+from loguru import logger
+from typing import AsyncIterator, Dict, Optional, Set
+import asyncio
+import json
+
+FINAL_STATUSES = ["completed", "failed"]
+
+
+def status_event(task) -> dict:
+    """Current status of a request (Manager row) as a stream event."""
+    status = task.status.name if isinstance(task.status, Enum) else task.status
+    return {"request_id": task.request_id, "status": status}
+
+
+class StatusBroker:
+    """
+    In-process pub/sub of request status events, fed by consume_results.
+
+    Also keeps the last STATUS_CACHE_SIZE Manager rows read by the status
+    endpoint. A cached row is dropped as soon as an event for its request is
+    published, so polling a request only reaches the database after it changed.
+    """
+
+    def __init__(self):
+        self._cache_size = config.get("STATUS_CACHE_SIZE", 10000)
+        self._keepalive = config.get("STATUS_STREAM_KEEPALIVE_S", 15)
+        self._cache: OrderedDict = OrderedDict()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def get_cached(self, request_id: str):
+        task = self._cache.get(request_id)
+        if task is not None:
+            self._cache.move_to_end(request_id)
+        return task
+
+    def cache(self, request_id: str, task):
+        self._cache[request_id] = task
+        self._cache.move_to_end(request_id)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, request_id: str):
+        self._cache.pop(request_id, None)
+
+    def publish(self, result: dict):
+        request_id = result["request_id"]
+        self.invalidate(request_id)
+        event = dict(result)
+        if isinstance(event.get("status"), Enum):
+            event["status"] = event["status"].name
+        for queue in self._subscribers.get(request_id, ()):
+            if queue.full():
+                # A slow client only misses intermediate events
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def subscribe(self, request_id: str) -> asyncio.Queue:
+        """Subscribe before reading the current status so no event is missed."""
+        queue = asyncio.Queue(maxsize=100)
+        self._subscribers.setdefault(request_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, request_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(request_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[request_id]
+
+    async def events(
+        self, request_id: str, queue: asyncio.Queue, current: dict
+    ) -> AsyncIterator[Optional[dict]]:
+        """
+        Yield the current status, then every new event until the request
+        finishes. None is yielded when nothing happened for a keepalive period.
+        """
+        try:
+            yield current
+            if current["status"] in FINAL_STATUSES:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self._keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+                if event["status"] in FINAL_STATUSES:
+                    return
+        finally:
+            self.unsubscribe(request_id, queue)
+
+    async def sse(
+        self, request_id: str, queue: asyncio.Queue, current: dict
+    ) -> AsyncIterator[str]:
+        try:
+            async for event in self.events(request_id, queue, current):
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    data = json.dumps(event, default=str)
+                    yield f"event: status\ndata: {data}\n\n"
+        finally:
+            # The client may disconnect while events() is suspended
+            self.unsubscribe(request_id, queue)
+
+    async def websocket(
+        self,
+        websocket: WebSocket,
+        request_id: str,
+        queue: asyncio.Queue,
+        current: dict,
+    ):
+        try:
+            async for event in self.events(request_id, queue, current):
+                if event is not None:
+                    await websocket.send_text(json.dumps(event, default=str))
+            await websocket.close()
+        except WebSocketDisconnect:
+            logger.debug("Status websocket closed by client", request_id=request_id)
+        finally:
+            self.unsubscribe(request_id, queue)
+
+
+broker = StatusBroker()
@@ -1,44 +1,82 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from config.config_handler import config
 import os
 from loguru import logger
 
 
-def _fk_pragma_on_connect(dbapi_con, con_record):
-    """Enable foreign key support for SQLite"""
-    dbapi_con.execute("pragma foreign_keys=ON")
+def _sqlite_pragma_on_connect(dbapi_con, con_record):
+    # WAL lets status reads run while results are being written
+    cursor = dbapi_con.cursor()
+    cursor.execute("pragma foreign_keys=ON")
+    cursor.execute("pragma journal_mode=WAL")
+    cursor.execute("pragma synchronous=NORMAL")
+    cursor.execute(f"pragma busy_timeout={config.get('DB_BUSY_TIMEOUT_MS', 5000)}")
+    cursor.execute(f"pragma cache_size=-{config.get('DB_CACHE_SIZE_KB', 65536)}")
+    cursor.execute("pragma temp_store=MEMORY")
+    cursor.close()
 
 
+def _async_url(url: str) -> str:
+    """Same database through the asyncio driver of its dialect."""
+    for sync_driver, async_driver in [
+        ("sqlite://", "sqlite+aiosqlite://"),
+        ("mysql://", "mysql+aiomysql://"),
+        ("mysql+pymysql://", "mysql+aiomysql://"),
+        ("oracle://", "oracle+oracledb_async://"),
+        ("oracle+oracledb://", "oracle+oracledb_async://"),
+    ]:
+        if url.startswith(sync_driver):
+            return async_driver + url[len(sync_driver) :]
+    if "+aiosqlite" in url or "+aiomysql" in url or "+oracledb_async" in url:
+        return url
+    # e.g. oracle+cx_oracle has no asyncio driver
+    raise ValueError(f"No async driver for DB_CONNECTION {url.split(':')[0]}")
+
+
+pool_args = {
+    "pool_size": config.get("DB_POOL_SIZE", 5),
+    "max_overflow": config.get("DB_MAX_OVERFLOW", 10),
+    "pool_recycle": 3600,
+}
+
 # Create database directory if it doesn't exist
 os.makedirs(config.get("DB_DIR", "db"), exist_ok=True)
 
 # Create database engine based on connection string
 connection_string = config.get("DB_CONNECTION", "sqlite:///db/hndtotxt.db")
 
+# The sync engine is only used to create and migrate the tables at startup
 if "sqlite" in connection_string:
     engine = create_engine(
         connection_string,
         connect_args={"check_same_thread": False},
         pool_recycle=3600,
     )
-    # Enable foreign key support for SQLite
-    from sqlalchemy import event
-    event.listen(engine, "connect", _fk_pragma_on_connect)
+    # aiosqlite defaults to NullPool, which takes no pool size
+    async_engine = create_async_engine(
+        _async_url(connection_string), poolclass=AsyncAdaptedQueuePool, **pool_args
+    )
+    event.listen(engine, "connect", _sqlite_pragma_on_connect)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragma_on_connect)
     logger.info(f"Created SQLite database engine: {connection_string}")
 elif "mysql" in connection_string:
     engine = create_engine(connection_string, pool_recycle=3600)
+    async_engine = create_async_engine(_async_url(connection_string), **pool_args)
     logger.info(f"Created MySQL database engine: {connection_string}")
 elif "oracle" in connection_string:
     engine = create_engine(connection_string, pool_recycle=3600)
+    async_engine = create_async_engine(_async_url(connection_string), **pool_args)
     logger.info(f"Created Oracle database engine: {connection_string}")
 else:
-    logger.warning(f"Unknown database type in connection string: {connection_string}")
-    engine = create_engine(connection_string, pool_recycle=3600)
+    raise ValueError(f"Unsupported database in DB_CONNECTION: {connection_string}")
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
 
 # Create declarative base
 Base = declarative_base()
@@ -52,4 +90,4 @@ def init_db():
         Base.metadata.create_all(bind=engine)
         logger.info("Database tables created successfully")
     except Exception as e:
-        logger.error(f"Error creating database tables: {e}")
\ No newline at end of file
+        logger.error(f"Error creating database tables: {e}")
@@ -1,4 +1,13 @@
-from sqlalchemy import Column, String, DateTime, Integer, Enum, SmallInteger, JSON
+from sqlalchemy import (
+    Column,
+    String,
+    DateTime,
+    Integer,
+    Enum,
+    SmallInteger,
+    JSON,
+    Index,
+)
 from dbutils.database import Base
 from core.utils import generate_uuid
 from dbutils.schemas import WebhookStatus
@@ -33,7 +42,8 @@ class Manager(Base):
     request_id = Column(String(255), nullable=False, unique=True)
 
 
-    image_path = Column(String(255), nullable=True)  # Path to the stored image
+    # Blob store reference of the image (sha256:...), kept while the request runs
+    image_path = Column(String(255), nullable=True)
     priority = Column(Integer, nullable=True, default=1)
 
     # Status tracking
@@ -51,3 +61,16 @@ class Manager(Base):
 
     # Additional information
     descr = Column(String(255), nullable=True)
+
+
+class WebhookOutbox(Base):
+    """
+    Webhooks still to be sent, one row per request with its latest status
+    """
+    __tablename__ = "webhook_outbox"
+    __table_args__ = (Index("ix_webhook_outbox_next_attempt", "next_attempt"),)
+
+    request_id = Column(String(255), primary_key=True)
+    status = Column(Enum(WebhookStatus), nullable=False)
+    next_attempt = Column(DateTime, nullable=False)
+    itime = Column(DateTime, nullable=False)
@@ -1,7 +1,8 @@
 from generators import recognize_hand_gesture
+from core.executor import executor
+from core.blobstore import blob_store
 import aio_pika
 import json
-import base64
 import numpy as np
 import cv2
 from loguru import logger
@@ -15,11 +16,11 @@ else:
 os.makedirs(output_dir, exist_ok=True)
 
 
-async def process_image(encoded_image):
+def process_image(blob_ref):
     logger.info("Starting hand gesture recognition")
     try:
-        # Decode base64 image
-        image_data = base64.b64decode(encoded_image)
+        # Map the image from the blob store without copying it
+        image_data = blob_store.open_memmap(blob_ref)
         nparr = np.frombuffer(image_data, np.uint8)
         frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
@@ -56,7 +57,7 @@ async def process_message(
         try:
             # Parse the message body
             message_body = json.loads(message.body.decode())
-            encoded_image = message_body["image"]
+            blob_ref = message_body["blob"]
             request_id = message_body["request_id"]
             priority = message_body.get("priority", 1)
 
@@ -77,7 +78,9 @@ async def process_message(
             )
 
             # Process the image
-            hand_detections = await process_image(encoded_image)
+            hand_detections = await executor.run_in_thread(
+                "hand", process_image, blob_ref
+            )
 
             # Optional: save processed image if needed
             # timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -1,24 +1,28 @@
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, WebSocket
+from sqlalchemy.ext.asyncio import AsyncSession
 import aio_pika
 import uuid
 import json
 import asyncio
-import base64
 from core.messages import Message
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 from loguru import logger
 import os
 from version import __version__
 from config.config_handler import config
 from core.queue_utils import consume_results, get_rabbitmq_connection
+from core.webhook_dispatcher import dispatcher
+from core.status_stream import broker, status_event
+from core.blobstore import clean_expired_blobs
+from core.upload import UploadLimitMiddleware, store_upload
 from dbutils import schemas, crud
 import sys
 from starlette.middleware.cors import CORSMiddleware
 from core import base
-from dbutils.database import SessionLocal
+from dbutils.database import AsyncSessionLocal
 from typing import Optional
 
 if os.environ.get("MODE", "dev") == "prod":
@@ -53,16 +57,21 @@ logger.add(
 logger.info("Starting OCR Service with Skew Correction", version=__version__)
 
 
+async def active_blob_refs():
+    async with AsyncSessionLocal() as db:
+        return await crud.get_active_blob_refs(db=db)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan to start the result consumer."""
     try:
         connection = await aio_pika.connect_robust(config["QUEUE_CONNECTION"])
-        db = SessionLocal()
-        asyncio.create_task(consume_results(connection, db))
+        asyncio.create_task(consume_results(connection))
+        asyncio.create_task(dispatcher.run())
+        asyncio.create_task(clean_expired_blobs(active_blob_refs))
         yield
     finally:
-        db.close()
         await connection.close()
 
 
@@ -73,6 +82,8 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Inside CORS so a 413 still carries the CORS headers
+app.add_middleware(UploadLimitMiddleware, routes=app.routes)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -90,7 +101,7 @@ async def process_image(
         request_id: Optional[str] = Form(None, description="Optional request ID"),
         priority: int = Form(1, description="Processing priority (1-10)"),
         connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-        db: Session = Depends(base.get_db),
+        db: AsyncSession = Depends(base.get_db),
 ):
     """
     Process an image for OCR text extraction with skew correction.
@@ -109,13 +120,14 @@ async def process_image(
     if request_id is None:
         request_id = str(uuid.uuid4())
 
-    # Read the image data
-    image_data = await image.read()
+    # Stream the image into the blob store
+    blob_ref = await store_upload(image, "process_image")
 
     # Add request to database
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
+        image_path=blob_ref,
         status=schemas.WebhookStatus.pending,
         itime=datetime.now(tz=None),
     )
@@ -126,12 +138,9 @@ async def process_image(
     # Create channel
     channel = await connection.channel()
 
-    # Convert image to base64
-    base64_image = base64.b64encode(image_data).decode('utf-8')
-
     # Prepare message
     message_body = {
-        "image": base64_image,
+        "blob": blob_ref,
         "request_id": request_id,
         "priority": priority,
     }
@@ -155,7 +164,7 @@ async def process_image(
 @app.get("/aihive-ocr/api/v1/status/{request_id}")
 async def get_status(
         request_id: str,
-        db: Session = Depends(base.get_db)
+        db: AsyncSession = Depends(base.get_db)
 ):
     """
     Get the status of an OCR processing request.
@@ -163,13 +172,51 @@ async def get_status(
     - **request_id**: The request ID returned from the process_image endpoint
     """
     logger.info("/api/v1/status", request_id=request_id)
-    task = crud.get_request(db=db, request_id=request_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    task = broker.get_cached(request_id)
+    if task is None:
+        task = await crud.get_request(db=db, request_id=request_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        broker.cache(request_id, task)
     msg = Message("fa").INF_SUCCESS()
     msg["data"] = task
     return msg
 
 
+async def subscribe_status(request_id: str):
+    """Subscribe to the events of a request, returns (queue, current status)."""
+    queue = broker.subscribe(request_id)
+    async with AsyncSessionLocal() as db:
+        task = await crud.get_request(db=db, request_id=request_id)
+    if not task:
+        broker.unsubscribe(request_id, queue)
+        return None, None
+    return queue, status_event(task)
+
+
+@app.get("/aihive-ocr/api/v1/status/{request_id}/stream")
+async def stream_status(request_id: str):
+    logger.info("/ocr/status/stream", request_id=request_id)
+    queue, current = await subscribe_status(request_id)
+    if queue is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return StreamingResponse(
+        broker.sse(request_id, queue, current),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/aihive-ocr/api/v1/status/{request_id}/ws")
+async def status_websocket(websocket: WebSocket, request_id: str):
+    logger.info("/ocr/status/ws", request_id=request_id)
+    queue, current = await subscribe_status(request_id)
+    if queue is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    await broker.websocket(websocket, request_id, queue, current)
+
+
 if __name__ == "__main__":
     uvicorn.run(app="mainapi:app", host="0.0.0.0", port=8000, reload=False)
\ No newline at end of file
@@ -0,0 +1,99 @@
+from config.config_handler import config
+from core.blobstore import BlobTooLarge, blob_store
+from fastapi import HTTPException, UploadFile
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import BaseRoute, Route
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import List, Optional
+
+
+def get_upload_limit(endpoint: str) -> int:
+    """Maximum upload size of an endpoint in bytes (UPLOAD_MAX_SIZE_MB)."""
+    limits = config.get("UPLOAD_MAX_SIZE_MB") or {}
+    return int(limits.get(endpoint, limits.get("default", 100)) * 1024 * 1024)
+
+
+def _too_large(endpoint: str, limit: int) -> HTTPException:
+    logger.warning("Upload too large", endpoint=endpoint, limit=limit)
+    return HTTPException(
+        status_code=413, detail=f"File is larger than {limit // (1024 * 1024)} MB"
+    )
+
+
+def check_upload_size(upload: UploadFile, endpoint: str):
+    """Reject an upload whose size is already known to exceed the limit."""
+    limit = get_upload_limit(endpoint)
+    if upload.size is not None and upload.size > limit:
+        raise _too_large(endpoint, limit)
+
+
+async def store_upload(upload: UploadFile, endpoint: str) -> str:
+    """
+    Stream an upload into the blob store and return its reference.
+
+    The limit is enforced on the bytes actually written, the client-reported
+    size may be missing, and the blob store hashes the content in the same
+    pass. Raises HTTP 413 when the upload exceeds the endpoint limit.
+    """
+    check_upload_size(upload, endpoint)
+    limit = get_upload_limit(endpoint)
+    try:
+        return await run_in_threadpool(blob_store.put_file, upload.file, limit)
+    except BlobTooLarge:
+        raise _too_large(endpoint, limit)
+
+
+class UploadLimitMiddleware:
+    """
+    Enforce the upload limit of a route while its multipart body arrives.
+
+    Starlette reads (and spools) the whole form before the endpoint runs, so
+    a check in the endpoint comes after the bytes were received. A request
+    whose Content-Length is over the limit is answered with 413 before its
+    body is read, and a body without one is counted as it is received.
+    """
+
+    def __init__(self, app: ASGIApp, routes: List[BaseRoute]):
+        self.app = app
+        self._routes = routes
+
+    def _endpoint(self, path: str) -> Optional[str]:
+        for route in self._routes:
+            if isinstance(route, Route) and route.path == path:
+                return route.name
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        endpoint = self._endpoint(scope["path"])
+        if endpoint is None or not headers.get("content-type", "").startswith(
+            "multipart/form-data"
+        ):
+            await self.app(scope, receive, send)
+            return
+        limit = get_upload_limit(endpoint)
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            error = _too_large(endpoint, limit)
+            response = JSONResponse(
+                {"detail": error.detail}, status_code=error.status_code
+            )
+            await response(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise _too_large(endpoint, limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,193 @@
+from config.config_handler import config
+from loguru import logger
+from typing import Awaitable, BinaryIO, Callable, Collection, Optional, Set
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+
+CHUNK_SIZE = 1024 * 1024
+REF_PREFIX = "sha256:"
+
+
+class BlobTooLarge(ValueError):
+    """The content passed to put_file exceeded its max_size."""
+
+
+class LocalBlobStore:
+    """
+    Content-addressed blob store on a local directory or a shared volume.
+
+    Blobs are stored as <root>/<hh>/<sha256> and referenced as "sha256:<hex>",
+    so the backend and the engine only need to mount the same directory and
+    queue messages carry the reference instead of the file content.
+    """
+
+    def __init__(self, root: str):
+        self._root = root
+        os.makedirs(self._root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self._root, digest[:2], digest)
+
+    @staticmethod
+    def _digest(ref: str) -> str:
+        if not ref.startswith(REF_PREFIX):
+            raise ValueError(f"Invalid blob reference: {ref}")
+        digest = ref[len(REF_PREFIX) :]
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ValueError(f"Invalid blob reference: {ref}")
+        return digest
+
+    def _write_local(self, fileobj: BinaryIO, max_size: Optional[int] = None) -> str:
+        # Stream into a temp file next to the blobs so the final rename is atomic
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self._root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                while chunk := fileobj.read(CHUNK_SIZE):
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise BlobTooLarge(f"Blob is larger than {max_size} bytes")
+                    sha256.update(chunk)
+                    temp_file.write(chunk)
+            digest = sha256.hexdigest()
+            path = self._path(digest)
+            if os.path.exists(path):
+                # Same content already stored, keep it alive for cleanup
+                os.utime(path)
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return digest
+
+    def put_file(self, fileobj: BinaryIO, max_size: Optional[int] = None) -> str:
+        """
+        Store the content of a readable binary file and return its reference.
+
+        Raises BlobTooLarge, and stores nothing, once more than max_size bytes
+        were read.
+        """
+        digest = self._write_local(fileobj, max_size)
+        logger.debug("Blob stored", digest=digest)
+        return REF_PREFIX + digest
+
+    def local_path(self, ref: str) -> str:
+        path = self._path(self._digest(ref))
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Blob not found: {ref}")
+        return path
+
+    def open_memmap(self, ref: str):
+        """Read-only uint8 view of the blob without copying it into memory."""
+        import numpy as np
+
+        return np.memmap(self.local_path(ref), dtype=np.uint8, mode="r")
+
+    def remove_expired(self, max_age_hours: float, keep: Collection[str] = ()) -> int:
+        """
+        Delete blobs not written or re-uploaded in the last max_age_hours,
+        except the references in keep.
+        """
+        deadline = time.time() - max_age_hours * 3600
+        removed = 0
+        for dirpath, _, filenames in os.walk(self._root):
+            for filename in filenames:
+                if REF_PREFIX + filename in keep:
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.path.getmtime(path) < deadline:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        if removed:
+            logger.info("Expired blobs removed", count=removed)
+        return removed
+
+
+class S3BlobStore(LocalBlobStore):
+    """
+    Blob store on an S3-compatible bucket (AWS, MinIO, ...).
+
+    The local directory is used as a write buffer and a read cache, so engines
+    still get a file path to memory-map. Expiry of the bucket itself is left
+    to a bucket lifecycle rule.
+    """
+
+    def __init__(self, root: str, bucket: str, endpoint_url: str = None, prefix=""):
+        try:
+            import boto3
+        except ImportError as e:
+            raise ImportError("BLOB_STORE s3 requires the boto3 package") from e
+        super().__init__(root)
+        self._bucket = bucket
+        self._prefix = prefix
+        self._client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _key(self, digest: str) -> str:
+        return f"{self._prefix}{digest[:2]}/{digest}"
+
+    def put_file(self, fileobj: BinaryIO, max_size: Optional[int] = None) -> str:
+        digest = self._write_local(fileobj, max_size)
+        self._client.upload_file(self._path(digest), self._bucket, self._key(digest))
+        logger.debug("Blob stored", digest=digest, bucket=self._bucket)
+        return REF_PREFIX + digest
+
+    def local_path(self, ref: str) -> str:
+        digest = self._digest(ref)
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self._root, suffix=".part")
+            os.close(fd)
+            try:
+                self._client.download_file(self._bucket, self._key(digest), temp_path)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        return path
+
+
+def create_blob_store() -> LocalBlobStore:
+    root = config.get("BLOB_STORE_DIR", "/approot/data/blobs")
+    if config.get("BLOB_STORE", "local") == "s3":
+        return S3BlobStore(
+            root,
+            bucket=config["BLOB_STORE_S3_BUCKET"],
+            endpoint_url=config.get("BLOB_STORE_S3_ENDPOINT"),
+            prefix=config.get("BLOB_STORE_S3_PREFIX", ""),
+        )
+    return LocalBlobStore(root)
+
+
+blob_store = create_blob_store()
+
+
+async def clean_expired_blobs(
+    get_active_refs: Optional[Callable[[], Awaitable[Set[str]]]] = None,
+):
+    """
+    Periodically drop blobs older than BLOB_TTL_HOURS.
+
+    get_active_refs returns the blobs of requests that are still pending or
+    in progress, those are kept however long they have been queued. When it
+    fails nothing is removed in that round.
+    """
+    max_age_hours = config.get("BLOB_TTL_HOURS", 24)
+    while True:
+        try:
+            keep = await get_active_refs() if get_active_refs else set()
+            await asyncio.to_thread(blob_store.remove_expired, max_age_hours, keep)
+        except Exception:
+            logger.opt(exception=True).warning("Failed to clean expired blobs")
+        await asyncio.sleep(3600)
@@ -0,0 +1,68 @@
+from loguru import logger
+from typing import Callable, Dict
+import multiprocessing
+import signal
+import time
+
+
+def _run_worker(target: Callable[[], None]):
+    # Workers inherit the parent's handlers when they are (re)started
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        target()
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(target: Callable[[], None], num_workers: int):
+    """
+    Run target in num_workers forked processes and restart any that exits.
+
+    Everything loaded before this call (e.g. model weights) is shared
+    copy-on-write with the workers, so load models first and only open
+    connections and pools inside target. With num_workers <= 1 target runs
+    in the current process.
+    """
+    if num_workers <= 1:
+        target()
+        return
+
+    context = multiprocessing.get_context("fork")
+    workers: Dict[int, multiprocessing.Process] = {}
+    stopping = False
+
+    def start_worker(index: int):
+        process = context.Process(
+            target=_run_worker, args=(target,), name=f"worker-{index}"
+        )
+        process.start()
+        workers[index] = process
+        logger.info("Worker started", worker=process.name, pid=process.pid)
+
+    def stop_workers(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()
+
+    for index in range(num_workers):
+        start_worker(index)
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    while not stopping:
+        for index, process in list(workers.items()):
+            if not process.is_alive() and not stopping:
+                logger.warning(
+                    "Worker exited, restarting",
+                    worker=process.name,
+                    exitcode=process.exitcode,
+                )
+                start_worker(index)
+        time.sleep(1)
+
+    for process in workers.values():
+        process.join()
+    logger.info("All workers stopped")
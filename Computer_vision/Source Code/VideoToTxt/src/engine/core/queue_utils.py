@@ -1,11 +1,11 @@
 from generator import EmotionDetector
+from core.executor import executor
+from core.blobstore import blob_store
 import aio_pika
 import json
-import base64
 import os
 from loguru import logger
 from datetime import datetime
-import tempfile
 
 if os.environ.get("MODE", "dev") == "prod":
     output_dir = "/approot/data/result"
@@ -18,7 +18,7 @@ async def process_message(message: aio_pika.IncomingMessage, result_channel: aio
         try:
             body = json.loads(message.body.decode())
             request_id = body["request_id"]
-            encoded_video = body["video"]
+            blob_ref = body["blob"]
             experiment_path = body.get("experiment_path", "default")  # Use .get() for safety
             
             logger.info(f"Processing request {request_id}")
@@ -36,7 +36,9 @@ async def process_message(message: aio_pika.IncomingMessage, result_channel: aio
             )
 
             # Process video
-            results = await process_video_task(encoded_video, experiment_path)
+            results = await executor.run_in_thread(
+                "video", process_video_task, blob_ref, experiment_path
+            )
             
             logger.info(f"Video processing results for {request_id}: {results}")
 
@@ -83,23 +85,17 @@ async def process_message(message: aio_pika.IncomingMessage, result_channel: aio
                 logger.error("Failed to send error result")
 
 
-async def process_video_task(encoded_video, experiment_path):
+def process_video_task(blob_ref, experiment_path):
     """Process video and return emotion analysis results"""
     try:
         logger.info("Starting video processing task")
-        
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_file:
-            video_data = base64.b64decode(encoded_video)
-            temp_file.write(video_data)
-            temp_path = temp_file.name
 
-        logger.info(f"Created temporary video file: {temp_path}")
-        
+        # The detector reads the blob in place, no temporary copy is needed
+        video_path = blob_store.local_path(blob_ref)
+        logger.info(f"Reading video from blob store: {video_path}")
+
         detector = EmotionDetector(gpu=0)
-        results = detector.process_video(temp_path)
-        
-        # Clean up temp file
-        os.unlink(temp_path)
+        results = detector.process_video(video_path)
         logger.info("Video processing completed successfully")
         
         return results
@@ -5,6 +5,8 @@ import sys
 from loguru import logger
 from config.config_handler import config
 from core.queue_utils import process_message
+from core.executor import executor
+from core.launcher import run_workers
 
 # CRITICAL: Import and register Emotic class in __main__ context
 import torch
@@ -69,6 +71,15 @@ logger.add(
     enqueue=True,
 )
 
+async def handle_message(message, result_channel, semaphore):
+    try:
+        await process_message(message, result_channel)
+    except Exception as e:
+        logger.exception(f"Failed to process message: {e}")
+        await message.nack()
+    finally:
+        semaphore.release()
+
 async def main():
     """Main worker function that runs in a continuous loop"""
     connection = None
@@ -79,7 +90,10 @@ async def main():
 
         # Create channel
         channel = await connection.channel()
-        await channel.set_qos(prefetch_count=1)
+        await channel.set_qos(prefetch_count=config.get("PREFETCH_COUNT", 1))
+        # Videos processed at the same time in this process
+        semaphore = asyncio.Semaphore(config.get("CONSUMER_CONCURRENCY", 1))
+        tasks = set()
 
         # Declare main queue
         queue = await channel.declare_queue(
@@ -99,11 +113,12 @@ async def main():
         # Continuous message processing loop
         async with queue.iterator() as queue_iter:
             async for message in queue_iter:
-                try:
-                    await process_message(message, result_channel)
-                except Exception as e:
-                    logger.exception(f"Failed to process message: {e}")
-                    await message.nack()
+                await semaphore.acquire()
+                task = asyncio.create_task(
+                    handle_message(message, result_channel, semaphore)
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
 
     except (KeyboardInterrupt, asyncio.CancelledError):
         logger.info("Worker stopping due to interrupt...")
@@ -116,12 +131,17 @@ async def main():
                 logger.info("RabbitMQ connection closed")
         except Exception as e:
             logger.error(f"Error closing connection: {e}")
+        executor.shutdown()
 
-if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
+def run_worker():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     try:
         loop.run_until_complete(main())
     except KeyboardInterrupt:
         logger.info("Worker stopped gracefully")
     finally:
-        loop.close()
\ No newline at end of file
+        loop.close()
+
+if __name__ == "__main__":
+    run_workers(run_worker, num_workers=config.get("WORKER_PROCESSES", 1))
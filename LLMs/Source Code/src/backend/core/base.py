@@ -1,18 +1,15 @@
 import os
-from dbutils import models
-from dbutils.database import SessionLocal, engine
+from dbutils.migrations import migrate
+from dbutils.database import AsyncSessionLocal, engine
 from config.config_handler import config
 
 
-models.Base.metadata.create_all(bind=engine)
+migrate(engine)
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 class Base:
@@ -0,0 +1,86 @@
+from config.config_handler import config
+from loguru import logger
+from typing import AsyncIterator
+import aio_pika
+import asyncio
+import json
+
+FINAL_EVENTS = ["completed", "failed"]
+
+
+def stream_queue_name(request_id: str) -> str:
+    return f"chat_stream.{request_id}"
+
+
+async def declare_stream_queue(
+    channel: aio_pika.Channel, request_id: str
+) -> aio_pika.Queue:
+    """
+    Declare the queue the engine publishes the tokens of a request to.
+
+    It is declared before the task is published so no token is lost, and
+    RabbitMQ deletes it once nobody has read it for CHAT_STREAM_QUEUE_EXPIRES_S.
+    """
+    return await channel.declare_queue(
+        stream_queue_name(request_id),
+        durable=False,
+        arguments={
+            "x-expires": config.get("CHAT_STREAM_QUEUE_EXPIRES_S", 600) * 1000
+        },
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def relay_tokens(request_id: str) -> AsyncIterator[str]:
+    """
+    Relay the stream queue of a request as server-sent events: one "token"
+    event per chunk of text, then "completed" or "failed".
+
+    The response outlives the request's RabbitMQ dependency, so the relay
+    has its own connection. The final text is stored by consume_results
+    from result_queue as for every other request.
+    """
+    keepalive = config.get("STATUS_STREAM_KEEPALIVE_S", 15)
+    timeout = config.get("CHAT_STREAM_TIMEOUT_S", 600)
+    connection = await aio_pika.connect_robust(config["QUEUE_CONNECTION"])
+    queue = None
+    try:
+        channel = await connection.channel()
+        queue = await declare_stream_queue(channel, request_id)
+        messages: asyncio.Queue = asyncio.Queue()
+        await queue.consume(messages.put, no_ack=True)
+        yield _sse("status", {"request_id": request_id, "status": "pending"})
+        idle = 0
+        while True:
+            try:
+                message = await asyncio.wait_for(messages.get(), keepalive)
+            except asyncio.TimeoutError:
+                idle += keepalive
+                if idle >= timeout:
+                    logger.warning("Chat stream timed out", request_id=request_id)
+                    yield _sse(
+                        "failed",
+                        {"request_id": request_id, "error": "Stream timed out"},
+                    )
+                    return
+                yield ": keepalive\n\n"
+                continue
+            idle = 0
+            data = json.loads(message.body.decode())
+            event = data.pop("event")
+            yield _sse(event, {"request_id": request_id, **data})
+            if event in FINAL_EVENTS:
+                return
+    finally:
+        try:
+            if queue is not None:
+                await queue.delete(if_unused=False, if_empty=False)
+        except Exception:
+            # The queue expires on its own
+            logger.opt(exception=True).debug(
+                "Failed to delete chat stream queue", request_id=request_id
+            )
+        await connection.close()
@@ -1,50 +1,86 @@
 import aio_pika
+import asyncio
 import json
 from loguru import logger
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List
 from config.config_handler import config
-from core import webhook_handler
-from sqlalchemy.orm import Session
+from core.status_stream import broker
+from core.webhook_dispatcher import dispatcher
+from sqlalchemy.ext.asyncio import AsyncSession
 from dbutils import crud
+from dbutils.database import AsyncSessionLocal
+from dbutils.schemas import WebhookStatus
 
 
-async def consume_results(connection: aio_pika.RobustConnection, db: Session):
+async def consume_results(connection: aio_pika.RobustConnection):
+    batch_size = config.get("RESULT_BATCH_SIZE", 64)
     async with connection:
         channel = await connection.channel()
+        await channel.set_qos(prefetch_count=batch_size)
         queue = await channel.declare_queue("result_queue", durable=True)
 
-        async for message in queue:
-            async with message.process():
-                try:
-                    result = json.loads(message.body.decode())
-                    request_id = result["request_id"]
-                    status = result["status"]
-                    result_data = result.get("result_data", None)
-                    result_path = result.get("result_path", None)
-                    logger.debug(f"{status=}, {result_data=}, {result_path=}")
-                    crud.update_request(
-                        db=db,
-                        request_id=request_id,
-                        status=status,
-                        result_data=result_data,
-                        result_path=result_path,
-                        error=result.get("error"),
-                    )
-                    if status == "in_progress":
-                        webhook_handler.set_inprogress(
-                            db=db,
-                            request_id=request_id,
-                        )
-                    elif status == "completed":
-                        webhook_handler.set_completed(
-                            db=db,
-                            request_id=request_id,
-                            result_data=result_data,
-                        )
-                    elif status == "failed":
-                        webhook_handler.set_failed(db=db, request_id=request_id)
-                except Exception as e:
-                    logger.exception(e)
+        # Results that arrive together are written in one transaction
+        messages: asyncio.Queue = asyncio.Queue()
+        await queue.consume(messages.put)
+        while True:
+            batch = [await messages.get()]
+            while len(batch) < batch_size and not messages.empty():
+                batch.append(messages.get_nowait())
+            await _save_results(batch)
+
+
+async def _save_results(batch: List[aio_pika.IncomingMessage]):
+    results = []
+    for message in batch:
+        try:
+            results.append(json.loads(message.body.decode()))
+        except Exception as e:
+            logger.exception(e)
+    try:
+        async with AsyncSessionLocal() as db:
+            for result in results:
+                await _save_result(db, result)
+            await db.commit()
+        saved = results
+    except Exception:
+        logger.opt(exception=True).warning(
+            "Failed to save results, retrying one by one", count=len(results)
+        )
+        saved = []
+        for result in results:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await _save_result(db, result)
+                    await db.commit()
+                saved.append(result)
+            except Exception as e:
+                logger.exception(e)
+    # Only committed results are pushed, a stream never runs ahead of the DB
+    for result in saved:
+        broker.publish(result)
+    dispatcher.notify()
+    for message in batch:
+        await message.ack()
+
+
+async def _save_result(db: AsyncSession, result: dict):
+    request_id = result["request_id"]
+    status = result["status"]
+    result_data = result.get("result_data", None)
+    result_path = result.get("result_path", None)
+    logger.debug(f"{status=}, {result_data=}, {result_path=}")
+    await crud.update_request(
+        db=db,
+        request_id=request_id,
+        status=status,
+        result_data=result_data,
+        result_path=result_path,
+        error=result.get("error"),
+    )
+    if status in ["in_progress", "completed", "failed"]:
+        await crud.add_webhook(
+            db=db, request_id=request_id, status=WebhookStatus[status]
+        )
 
 
 async def get_rabbitmq_connection() -> AsyncGenerator[aio_pika.RobustConnection, None]:
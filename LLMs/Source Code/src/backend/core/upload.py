@@ -0,0 +1,114 @@
+from config.config_handler import config
+from fastapi import HTTPException, UploadFile
+from loguru import logger
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.routing import BaseRoute, Route
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import List, Optional
+import aiofiles
+import hashlib
+import os
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_upload_limit(endpoint: str) -> int:
+    """Maximum upload size of an endpoint in bytes (UPLOAD_MAX_SIZE_MB)."""
+    limits = config.get("UPLOAD_MAX_SIZE_MB") or {}
+    return int(limits.get(endpoint, limits.get("default", 100)) * 1024 * 1024)
+
+
+def _too_large(endpoint: str, limit: int) -> HTTPException:
+    logger.warning("Upload too large", endpoint=endpoint, limit=limit)
+    return HTTPException(
+        status_code=413, detail=f"File is larger than {limit // (1024 * 1024)} MB"
+    )
+
+
+def check_upload_size(upload: UploadFile, endpoint: str):
+    """Reject an upload whose size is already known to exceed the limit."""
+    limit = get_upload_limit(endpoint)
+    if upload.size is not None and upload.size > limit:
+        raise _too_large(endpoint, limit)
+
+
+async def save_upload(upload: UploadFile, path: str, endpoint: str) -> str:
+    """
+    Copy an upload to path in CHUNK_SIZE pieces and return its sha256.
+
+    Only one chunk is held in memory at a time. Raises HTTP 413 (and removes
+    the partial file) when the upload exceeds the endpoint limit.
+    """
+    check_upload_size(upload, endpoint)
+    limit = get_upload_limit(endpoint)
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise _too_large(endpoint, limit)
+                sha256.update(chunk)
+                await f.write(chunk)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    digest = sha256.hexdigest()
+    logger.debug("Upload saved", endpoint=endpoint, size=size, sha256=digest)
+    return digest
+
+
+class UploadLimitMiddleware:
+    """
+    Enforce the upload limit of a route while its multipart body arrives.
+
+    Starlette reads (and spools) the whole form before the endpoint runs, so
+    a check in the endpoint comes after the bytes were received. A request
+    whose Content-Length is over the limit is answered with 413 before its
+    body is read, and a body without one is counted as it is received.
+    """
+
+    def __init__(self, app: ASGIApp, routes: List[BaseRoute]):
+        self.app = app
+        self._routes = routes
+
+    def _endpoint(self, path: str) -> Optional[str]:
+        for route in self._routes:
+            if isinstance(route, Route) and route.path == path:
+                return route.name
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        endpoint = self._endpoint(scope["path"])
+        if endpoint is None or not headers.get("content-type", "").startswith(
+            "multipart/form-data"
+        ):
+            await self.app(scope, receive, send)
+            return
+        limit = get_upload_limit(endpoint)
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            error = _too_large(endpoint, limit)
+            response = JSONResponse(
+                {"detail": error.detail}, status_code=error.status_code
+            )
+            await response(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise _too_large(endpoint, limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -1,5 +1,8 @@
 import uuid
 import os
+import gzip
+import json
+from typing import List
 
 
 def generate_uuid():
@@ -9,3 +12,11 @@ def generate_uuid():
 def delete_file(filepath: str):
     if os.path.exists(filepath):
         os.remove(filepath)
+
+
+def append_jsonl_gz(filepath: str, rows: List[dict]):
+    """Append rows to a gzip JSON-lines file (gzip members can be concatenated)."""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with gzip.open(filepath, "at", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
@@ -0,0 +1,135 @@
+from config.config_handler import config
+from core import webhook_handler
+from core.status_stream import broker
+from dbutils import crud
+from dbutils.database import AsyncSessionLocal
+from dbutils.schemas import WebhookStatus
+from datetime import datetime, timedelta
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import httpx
+
+
+class WebhookDispatcher:
+    """
+    Sends webhooks in the background from the webhook_outbox table.
+
+    consume_results only records the latest status of a request in the outbox
+    (crud.add_webhook, in the same transaction as the result) and calls notify,
+    so a slow webhook endpoint can't stall result consumption, an in_progress
+    update that hasn't gone out yet is replaced by the final one, and pending
+    callbacks survive a restart. Final statuses are retried with exponential
+    backoff on webhook_retry_count, in_progress is sent once.
+    """
+
+    def __init__(self):
+        self._concurrency = config.get("WEBHOOK_CONCURRENCY", 8)
+        self._max_attempts = config.get("WEBHOOK_MAX_ATTEMPTS", 6)
+        self._backoff_base = config.get("WEBHOOK_BACKOFF_BASE_S", 5)
+        self._backoff_max = config.get("WEBHOOK_BACKOFF_MAX_S", 600)
+        self._timeout = config.get("WEBHOOK_TIMEOUT_S", 30)
+        self._handlers = {
+            WebhookStatus.in_progress: webhook_handler.set_inprogress,
+            WebhookStatus.completed: webhook_handler.set_completed,
+            WebhookStatus.failed: webhook_handler.set_failed,
+        }
+        self._wakeup = asyncio.Event()
+        self._in_flight = set()
+        self._tasks = set()
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self._concurrency)
+        limits = httpx.Limits(
+            max_connections=self._concurrency,
+            max_keepalive_connections=self._concurrency,
+        )
+        async with httpx.AsyncClient(timeout=self._timeout, limits=limits) as client:
+            while True:
+                self._wakeup.clear()
+                try:
+                    async with AsyncSessionLocal() as db:
+                        due = await crud.get_due_webhooks(
+                            db=db,
+                            limit=self._concurrency,
+                            exclude=list(self._in_flight),
+                        )
+                except Exception:
+                    logger.opt(exception=True).error("Failed to read webhook outbox")
+                    due = []
+                for request_id, status in due:
+                    await semaphore.acquire()
+                    self._in_flight.add(request_id)
+                    task = asyncio.create_task(
+                        self._deliver(client, request_id, status, semaphore)
+                    )
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _deliver(
+        self,
+        client: httpx.AsyncClient,
+        request_id: str,
+        status: WebhookStatus,
+        semaphore: asyncio.Semaphore,
+    ):
+        try:
+            async with AsyncSessionLocal() as db:
+                await self._deliver_one(client, db, request_id, status)
+        except Exception:
+            logger.opt(exception=True).error(
+                "Failed to deliver webhook", request_id=request_id
+            )
+            async with AsyncSessionLocal() as db:
+                await crud.retry_webhook(
+                    db=db,
+                    request_id=request_id,
+                    status=status,
+                    next_attempt=datetime.now(tz=None)
+                    + timedelta(seconds=self._backoff_max),
+                )
+        finally:
+            # The webhook columns of the cached row are stale now
+            broker.invalidate(request_id)
+            self._in_flight.discard(request_id)
+            semaphore.release()
+            self._wakeup.set()
+
+    async def _deliver_one(
+        self,
+        client: httpx.AsyncClient,
+        db: AsyncSession,
+        request_id: str,
+        status: WebhookStatus,
+    ):
+        delivered = await self._handlers[status](
+            client=client, db=db, request_id=request_id
+        )
+        if delivered or status == WebhookStatus.in_progress:
+            await crud.delete_webhook(db=db, request_id=request_id, status=status)
+            return
+        # Reload the row, set_webhook_result has just bumped webhook_retry_count
+        db.expire_all()
+        task = await crud.get_request(db=db, request_id=request_id)
+        retry_count = (task.webhook_retry_count or 0) if task else 0
+        if task is None or retry_count + 1 >= self._max_attempts:
+            logger.error("Webhook given up", request_id=request_id, status=status.name)
+            await crud.delete_webhook(db=db, request_id=request_id, status=status)
+            return
+        delay = min(self._backoff_max, self._backoff_base * 2**retry_count)
+        await crud.retry_webhook(
+            db=db,
+            request_id=request_id,
+            status=status,
+            next_attempt=datetime.now(tz=None) + timedelta(seconds=delay),
+        )
+
+
+dispatcher = WebhookDispatcher()
@@ -1,18 +1,18 @@
-import requests
+import httpx
 from dbutils.schemas import WebhookStatus
 from dbutils import crud
 from config.config_handler import config
 from loguru import logger
 import json
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import io
 
 
 base_url = f"{config['AIHIVE_ADDR']}/api/Request"
 
 
-def get_file(db: Session, request_id: str):
-    task = crud.get_request(db=db, request_id=request_id)
+async def get_file(db: AsyncSession, request_id: str):
+    task = await crud.get_request(db=db, request_id=request_id)
     if not task:
         return None
     if task.status == WebhookStatus.completed and task.result_path is not None:
@@ -23,89 +23,79 @@ def get_file_by_path(filepath: str):
     return open(filepath, "rb")
 
 
-def set_inprogress(db: Session, request_id: str) -> bool:
+async def _put(
+    client: httpx.AsyncClient,
+    db: AsyncSession,
+    request_id: str,
+    name: str,
+    increase_retry: bool = True,
+    **kwargs,
+) -> bool:
     url = base_url + f"/{request_id}"
     headers = {"Accept": "*/*"}
-    params = {"status": WebhookStatus.in_progress.value, "output": "{}"}
-    response = requests.put(url, params=params, headers=headers)
-    crud.set_webhook_result(
+    try:
+        response = await client.put(url, headers=headers, **kwargs)
+    except httpx.HTTPError as e:
+        logger.warning(f"Webhook-{name}", request_id=request_id, error=repr(e))
+        await crud.set_webhook_result(
+            db=db,
+            request_id=request_id,
+            webhook_status_code=None,
+            increase_retry=increase_retry,
+        )
+        return False
+    await crud.set_webhook_result(
         db=db,
         request_id=request_id,
         webhook_status_code=response.status_code,
-        increase_retry=False,
+        increase_retry=increase_retry,
     )
-    # response.raise_for_status()
     if response.status_code == 200:
-        logger.debug(
-            "Webhook-set_inprogress",
-            status_code=response.status_code,
-        )
+        logger.debug(f"Webhook-{name}", status_code=response.status_code)
         return True
     else:
         logger.warning(
-            "Webhook-set_inprogress",
+            f"Webhook-{name}",
             status_code=response.status_code,
             content=response.content,
         )
         return False
 
 
-def set_completed(
-    db: Session, request_id: str, result_data: str = None, max_param_size: int = 1000
+async def set_inprogress(
+    client: httpx.AsyncClient, db: AsyncSession, request_id: str
 ) -> bool:
-    url = base_url + f"/{request_id}"
-    headers = {"Accept": "*/*"}
-    if result_data:
-        # TODO: use max_param_size (check with Dr. Fathi)
-        # Always send as file when result_data is provided
-        result_json = json.dumps({"result": result_data})
-        file_obj = io.BytesIO(result_json.encode("utf-8"))
-        params = {"status": WebhookStatus.completed.value, "output": "{}"}
-        files = {"outputFile": ("result.txt", file_obj, "text/plain")}
-        response = requests.put(url, params=params, headers=headers, files=files)
-    else:
-        params = {"status": WebhookStatus.completed.value, "output": "{}"}
-        response = requests.put(
-            url,
-            params=params,
-            headers=headers,
-            files={"outputFile": get_file(db, request_id)},
-        )
-    crud.set_webhook_result(
-        db=db, request_id=request_id, webhook_status_code=response.status_code
+    params = {"status": WebhookStatus.in_progress.value, "output": "{}"}
+    return await _put(
+        client, db, request_id, "set_inprogress", increase_retry=False, params=params
     )
-    # response.raise_for_status()
-    if response.status_code == 200:
-        logger.debug(
-            "Webhook-set_completed",
-            status_code=response.status_code,
-        )
-        return True
+
+
+async def set_completed(
+    client: httpx.AsyncClient, db: AsyncSession, request_id: str
+) -> bool:
+    params = {"status": WebhookStatus.completed.value, "output": "{}"}
+    task = await crud.get_request(db=db, request_id=request_id)
+    if task is not None and task.result:
+        # TODO: send small results as output param (check with Dr. Fathi)
+        # Always send as file when result_data is provided
+        result_json = json.dumps({"result": task.result})
+        file = io.BytesIO(result_json.encode("utf-8"))
+        files = {"outputFile": ("result.txt", file, "text/plain")}
     else:
-        logger.warning(
-            "Webhook-set_completed",
-            status_code=response.status_code,
-            content=response.content,
+        file = await get_file(db, request_id)
+        files = {"outputFile": file} if file is not None else None
+    try:
+        return await _put(
+            client, db, request_id, "set_completed", params=params, files=files
         )
-        return False
+    finally:
+        if file is not None:
+            file.close()
 
 
-def set_failed(db: Session, request_id: str) -> bool:
-    url = base_url + f"/{request_id}"
-    headers = {"Accept": "*/*"}
+async def set_failed(
+    client: httpx.AsyncClient, db: AsyncSession, request_id: str
+) -> bool:
     params = {"status": WebhookStatus.failed.value, "output": "{}"}
-    response = requests.put(url, params=params, headers=headers)
-    crud.set_webhook_result(
-        db=db, request_id=request_id, webhook_status_code=response.status_code
-    )
-    # response.raise_for_status()
-    if response.status_code == 200:
-        logger.debug("Webhook-set_failed", status_code=response.status_code)
-        return True
-    else:
-        logger.warning(
-            "Webhook-set_failed",
-            status_code=response.status_code,
-            content=response.content,
-        )
-        return False
+    return await _put(client, db, request_id, "set_failed", params=params)
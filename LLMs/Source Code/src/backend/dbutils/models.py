@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Integer, Enum, SmallInteger
+from sqlalchemy import Column, String, DateTime, Integer, Enum, SmallInteger, Index
 from dbutils.database import Base
 from core.utils import generate_uuid
 from dbutils.schemas import WebhookStatus
@@ -23,6 +23,14 @@ Base.items = items
 
 class Manager(Base):
     __tablename__ = "manager"
+    __table_args__ = (
+        # Nightly file cleanup: finished, webhook delivered, older than N days
+        Index(
+            "ix_manager_status_webhook_utime", "status", "webhook_status_code", "utime"
+        ),
+        # Retention: finished requests by age
+        Index("ix_manager_utime_status", "utime", "status"),
+    )
 
     id = Column(String(255), primary_key=True, default=generate_uuid)
     request_id = Column(String(255), nullable=False, unique=True)
@@ -41,3 +49,13 @@ class Manager(Base):
     itime = Column(DateTime, nullable=False)
     utime = Column(DateTime, nullable=True)
     descr = Column(String(255), nullable=True)
+
+
+class WebhookOutbox(Base):
+    __tablename__ = "webhook_outbox"
+    __table_args__ = (Index("ix_webhook_outbox_next_attempt", "next_attempt"),)
+
+    request_id = Column(String(255), primary_key=True)
+    status = Column(Enum(WebhookStatus), nullable=False)
+    next_attempt = Column(DateTime, nullable=False)
+    itime = Column(DateTime, nullable=False)
@@ -77,6 +77,7 @@ class vm_request_chat(BaseModel):
     priority: int = 1
     model: str = None
     prompt: str
+    stream: bool = False  # relay the completion over SSE as it is generated
 
     class Config:
         from_attributes = True
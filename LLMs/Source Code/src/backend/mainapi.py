@@ -1,23 +1,28 @@
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Depends, UploadFile
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, WebSocket
+from sqlalchemy.ext.asyncio import AsyncSession
 import aio_pika
 import uuid
 import json
 import asyncio
 from core.messages import Message
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 from loguru import logger
 import os
 from version import __version__
 from config.config_handler import config
 from core.queue_utils import consume_results, get_rabbitmq_connection
+from core.status_stream import broker, status_event
+from core.chat_stream import declare_stream_queue, relay_tokens
+from core.webhook_dispatcher import dispatcher
+from core.upload import UploadLimitMiddleware, check_upload_size, save_upload
 from dbutils import crud, schemas
 import sys
 from starlette.middleware.cors import CORSMiddleware
 from core import base
-from dbutils.database import SessionLocal
+from dbutils.database import AsyncSessionLocal
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import pytz
@@ -58,32 +63,55 @@ logger.add(
 logger.info("Starting service", version=__version__)
 
 
+async def clean_unused_temp_files():
+    async with AsyncSessionLocal() as db:
+        await crud.clean_unused_temp_files(db)
+
+
+async def archive_old_requests():
+    async with AsyncSessionLocal() as db:
+        await crud.archive_old_requests(
+            db,
+            archive_dir=config["ARCHIVE_DIR"],
+            days=config.get("RETENTION_DAYS", 90),
+            batch_size=config.get("ARCHIVE_BATCH_SIZE", 5000),
+        )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan to start the result consumer."""
     try:
         # Result queue
         connection = await aio_pika.connect_robust(config["QUEUE_CONNECTION"])
-        db = SessionLocal()
-        asyncio.create_task(consume_results(connection, db))
+        asyncio.create_task(consume_results(connection))
+        # Webhooks are sent from the outbox in the background
+        asyncio.create_task(dispatcher.run())
         # Delete unused temp files everyday at 2 AM
         scheduler = AsyncIOScheduler()
         scheduler.add_job(
-            crud.clean_unused_temp_files,
+            clean_unused_temp_files,
             trigger=CronTrigger(
                 hour=2, minute=0, timezone=pytz.timezone("Asia/Tehran")
             ),
-            args=(db,),
+        )
+        # Move old finished requests to the archive everyday at 3 AM
+        scheduler.add_job(
+            archive_old_requests,
+            trigger=CronTrigger(
+                hour=3, minute=0, timezone=pytz.timezone("Asia/Tehran")
+            ),
         )
         scheduler.start()
         yield
     finally:
         scheduler.shutdown()
-        db.close()
         await connection.close()
 
 
 app = FastAPI(lifespan=lifespan)
+# Inside CORS so a 413 still carries the CORS headers
+app.add_middleware(UploadLimitMiddleware, routes=app.routes)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -101,7 +129,7 @@ async def hr_pdf_analysis(
     priority: int = 1,
     model: str = None,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info("request hr_pdf_analysis", request_id=request_id, model=model)
     if request_id is None:
@@ -111,10 +139,9 @@ async def hr_pdf_analysis(
     current_day = datetime.now().strftime("%Y-%m/%d")
     os.makedirs(f"{temp_dir}/{current_day}", exist_ok=True)
     input1_path = f"{temp_dir}/{current_day}/{request_id}_{file.filename}"
-    with open(input1_path, "wb") as f:
-        f.write(await file.read())
+    await save_upload(file, input1_path, "hr_pdf_analysis")
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         model=model,
@@ -159,7 +186,7 @@ async def pdf_analysis(
     priority: int = 1,
     model: str = None,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info("request pdf_analysis", request_id=request_id, model=model)
     if request_id is None:
@@ -169,10 +196,9 @@ async def pdf_analysis(
     current_day = datetime.now().strftime("%Y-%m/%d")
     os.makedirs(f"{temp_dir}/{current_day}", exist_ok=True)
     input1_path = f"{temp_dir}/{current_day}/{request_id}_{file.filename}"
-    with open(input1_path, "wb") as f:
-        f.write(await file.read())
+    await save_upload(file, input1_path, "pdf_analysis")
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         model=model,
@@ -218,7 +244,7 @@ async def hr_pdf_comparison(
     priority: int = 1,
     model: str = None,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info("request hr_pdf_comparison", request_id=request_id, model=model)
     if request_id is None:
@@ -229,12 +255,16 @@ async def hr_pdf_comparison(
     os.makedirs(f"{temp_dir}/{current_day}", exist_ok=True)
     input1_path = f"{temp_dir}/{current_day}/{request_id}_1_{file1.filename}"
     input2_path = f"{temp_dir}/{current_day}/{request_id}_2_{file2.filename}"
-    with open(input1_path, "wb") as f:
-        f.write(await file1.read())
-    with open(input2_path, "wb") as f:
-        f.write(await file2.read())
+    check_upload_size(file2, "hr_pdf_comparison")
+    await save_upload(file1, input1_path, "hr_pdf_comparison")
+    try:
+        await save_upload(file2, input2_path, "hr_pdf_comparison")
+    except Exception:
+        # save_upload only removes its own partial file
+        os.remove(input1_path)
+        raise
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         task="hr_pdf_comparison",
@@ -243,8 +273,9 @@ async def hr_pdf_comparison(
         itime=datetime.now(tz=None),
     )
     if not response["status"]:
-        if os.path.exists(input1_path):
-            os.remove(input1_path)
+        for input_path in [input1_path, input2_path]:
+            if os.path.exists(input_path):
+                os.remove(input_path)
         return response
 
     channel = await connection.channel()
@@ -279,7 +310,7 @@ async def hr_pdf_zip_comparison(
     priority: int = 1,
     model: str = None,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info("request hr_pdf_comparison", request_id=request_id, model=model)
     if request_id is None:
@@ -289,10 +320,9 @@ async def hr_pdf_zip_comparison(
     current_day = datetime.now().strftime("%Y-%m/%d")
     os.makedirs(f"{temp_dir}/{current_day}", exist_ok=True)
     input1_path = f"{temp_dir}/{current_day}/{request_id}_{file.filename}"
-    with open(input1_path, "wb") as f:
-        f.write(await file.read())
+    await save_upload(file, input1_path, "hr_pdf_zip_comparison")
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         task="hr_pdf_zip_comparison",
@@ -336,7 +366,7 @@ async def hr_pdf_zip_compare_and_match(
     priority: int = 1,
     model: str = None,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     """
     file:            [File] Zip file consist of CV pdfs
@@ -352,11 +382,10 @@ async def hr_pdf_zip_compare_and_match(
     current_day = datetime.now().strftime("%Y-%m/%d")
     os.makedirs(f"{temp_dir}/{current_day}", exist_ok=True)
     input1_path = f"{temp_dir}/{current_day}/{request_id}_{file.filename}"
-    with open(input1_path, "wb") as f:
-        f.write(await file.read())
+    await save_upload(file, input1_path, "hr_pdf_zip_compare_and_match")
 
     # TODO: add input_params to db
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         task="hr_pdf_zip_compare_and_match",
@@ -397,7 +426,7 @@ async def hr_pdf_zip_compare_and_match(
 async def hr_analysis_question(
     items: schemas.vm_request_hr_analysis_question,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info(
         "request hr_analysis_question", request_id=items.request_id, model=items.model
@@ -407,7 +436,7 @@ async def hr_analysis_question(
     else:
         request_id = items.request_id
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         task="hr_analysis_question",
@@ -447,7 +476,7 @@ async def hr_analysis_question(
 async def cv_generate_offline(
     items: schemas.vm_request_cv_generator,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info(
         "request cv_generate_offline", request_id=items.request_id, model=items.model
@@ -457,7 +486,7 @@ async def cv_generate_offline(
     else:
         request_id = items.request_id
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         task="cv_generate",
@@ -496,7 +525,7 @@ async def cv_generate_offline(
 async def chat(
     items: schemas.vm_request_chat,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info("request chat", request_id=items.request_id)
     if items.request_id is None:
@@ -504,12 +533,14 @@ async def chat(
     else:
         request_id = items.request_id
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         task="chat",
         input_params=json.dumps(
-            items.model_dump(exclude={"request_id", "priority", "model"})
+            items.model_dump(
+                exclude={"request_id", "priority", "model", "stream"}
+            )
         ).encode(),
         itime=datetime.now(tz=None),
     )
@@ -520,10 +551,16 @@ async def chat(
 
     message_body = {
         "task": "chat",
-        "input_params": items.model_dump(exclude={"request_id", "priority", "model"}),
+        "input_params": items.model_dump(
+            exclude={"request_id", "priority", "model", "stream"}
+        ),
         "request_id": request_id,
         "model": items.model,
     }
+    if items.stream:
+        # Tokens go to a queue of their own, declared before the task
+        stream_queue = await declare_stream_queue(channel, request_id)
+        message_body["stream_queue"] = stream_queue.name
 
     await channel.default_exchange.publish(
         aio_pika.Message(
@@ -534,6 +571,16 @@ async def chat(
     )
     await channel.close()
 
+    if items.stream:
+        return StreamingResponse(
+            relay_tokens(request_id),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+                "X-Request-ID": request_id,
+            },
+        )
     msg = Message("en").INF_SUCCESS()
     msg["data"] = {"request_id": request_id}
     return msg
@@ -547,7 +594,7 @@ async def chat_multimodal(
     priority: int = 1,
     model: str = None,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info("request chat_multimodal", request_id=request_id)
     if request_id is None:
@@ -559,10 +606,9 @@ async def chat_multimodal(
         current_day = datetime.now().strftime("%Y-%m/%d")
         os.makedirs(f"{temp_dir}/{current_day}", exist_ok=True)
         input1_path = f"{temp_dir}/{current_day}/{request_id}_{file.filename}"
-        with open(input1_path, "wb") as f:
-            f.write(await file.read())
+        await save_upload(file, input1_path, "chat_multimodal")
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         task="chat_multimodal",
@@ -607,7 +653,7 @@ async def painting_analysis(
     lang: str = "en",
     model: str = None,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info("request painting_analysis", request_id=request_id, model=model)
     if request_id is None:
@@ -617,10 +663,9 @@ async def painting_analysis(
     current_day = datetime.now().strftime("%Y-%m/%d")
     os.makedirs(f"{temp_dir}/{current_day}", exist_ok=True)
     input1_path = f"{temp_dir}/{current_day}/{request_id}_{file.filename}"
-    with open(input1_path, "wb") as f:
-        f.write(await file.read())
+    await save_upload(file, input1_path, "painting_analysis")
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         task="painting_analysis",
@@ -664,7 +709,7 @@ async def ocr(
     priority: int = 1,
     model: str = None,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     logger.info("request ocr", request_id=request_id, model=model)
     if request_id is None:
@@ -674,10 +719,9 @@ async def ocr(
     current_day = datetime.now().strftime("%Y-%m/%d")
     os.makedirs(f"{temp_dir}/{current_day}", exist_ok=True)
     input1_path = f"{temp_dir}/{current_day}/{request_id}_{file.filename}"
-    with open(input1_path, "wb") as f:
-        f.write(await file.read())
+    await save_upload(file, input1_path, "ocr")
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         model=model,
@@ -722,7 +766,7 @@ async def ocr_json(
     priority: int = 1,
     model: str = None,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     """
     Extracting text as json format from any filetype. Now supporting images only.
@@ -751,10 +795,9 @@ async def ocr_json(
     current_day = datetime.now().strftime("%Y-%m/%d")
     os.makedirs(f"{temp_dir}/{current_day}", exist_ok=True)
     input1_path = f"{temp_dir}/{current_day}/{request_id}_{file.filename}"
-    with open(input1_path, "wb") as f:
-        f.write(await file.read())
+    await save_upload(file, input1_path, "ocr_json")
 
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         model=model,
@@ -793,15 +836,53 @@ async def ocr_json(
 
 
 @app.get("/aihive-llm/api/v1/status/{request_id}")
-async def get_status(request_id: str, db: Session = Depends(base.get_db)):
+async def get_status(request_id: str, db: AsyncSession = Depends(base.get_db)):
     logger.info("/llm/status", request_id=request_id)
-    task = crud.get_request(db=db, request_id=request_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    task = broker.get_cached(request_id)
+    if task is None:
+        task = await crud.get_request(db=db, request_id=request_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        broker.cache(request_id, task)
     msg = Message("en").INF_SUCCESS()
     msg["data"] = task
     return msg
 
 
+async def subscribe_status(request_id: str):
+    """Subscribe to the events of a request, returns (queue, current status)."""
+    queue = broker.subscribe(request_id)
+    async with AsyncSessionLocal() as db:
+        task = await crud.get_request(db=db, request_id=request_id)
+    if not task:
+        broker.unsubscribe(request_id, queue)
+        return None, None
+    return queue, status_event(task)
+
+
+@app.get("/aihive-llm/api/v1/status/{request_id}/stream")
+async def stream_status(request_id: str):
+    logger.info("/llm/status/stream", request_id=request_id)
+    queue, current = await subscribe_status(request_id)
+    if queue is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return StreamingResponse(
+        broker.sse(request_id, queue, current),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/aihive-llm/api/v1/status/{request_id}/ws")
+async def status_websocket(websocket: WebSocket, request_id: str):
+    logger.info("/llm/status/ws", request_id=request_id)
+    queue, current = await subscribe_status(request_id)
+    if queue is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    await broker.websocket(websocket, request_id, queue, current)
+
+
 if __name__ == "__main__":
     uvicorn.run(app="mainapi:app", host="0.0.0.0", port=8000, reload=False)
@@ -2,7 +2,9 @@ from generators import LLMGenerator
 import aio_pika
 import json
 from loguru import logger
+from config.config_handler import config
 import os
+import time
 from datetime import datetime
 
 if os.environ.get("MODE", "dev") == "prod":
@@ -12,12 +14,64 @@ else:
 os.makedirs(output_dir, exist_ok=True)
 
 
+async def _publish(
+    channel: aio_pika.Channel, routing_key: str, body: dict, request_id: str
+):
+    await channel.default_exchange.publish(
+        aio_pika.Message(
+            body=json.dumps(body).encode(), headers={"request_id": request_id}
+        ),
+        routing_key=routing_key,
+    )
+
+
+async def stream_task(
+    result_channel: aio_pika.Channel,
+    llm_generator: LLMGenerator,
+    stream_queue: str,
+    request_id: str,
+    task: str,
+    input_params: dict,
+    model: str = None,
+) -> str:
+    """
+    Publish the completion to the request's stream queue as it is generated
+    and return the whole text. Tokens are coalesced into one message per
+    CHAT_STREAM_FLUSH_MS, so RabbitMQ is not hit once per token.
+    """
+    flush_interval = config.get("CHAT_STREAM_FLUSH_MS", 50) / 1000
+    chunks = []
+    pending = []
+    last_flush = time.monotonic()
+    async for token in llm_generator.stream_task(task, input_params, model=model):
+        chunks.append(token)
+        pending.append(token)
+        if time.monotonic() - last_flush >= flush_interval:
+            await _publish(
+                result_channel,
+                stream_queue,
+                {"event": "token", "text": "".join(pending)},
+                request_id,
+            )
+            pending = []
+            last_flush = time.monotonic()
+    if pending:
+        await _publish(
+            result_channel,
+            stream_queue,
+            {"event": "token", "text": "".join(pending)},
+            request_id,
+        )
+    return "".join(chunks)
+
+
 async def process_message(
     message: aio_pika.IncomingMessage,
     result_channel: aio_pika.Channel,
     llm_generator: LLMGenerator,
 ):
     async with message.process():
+        stream_queue = None
         try:
             # Parse the message body
             message_body = json.loads(message.body.decode())
@@ -27,6 +81,8 @@ async def process_message(
             input2_path = message_body.get("input2_path", None)
             input_params = message_body.get("input_params", None)
             model = message_body.get("model", None)
+            # Set by the backend when the client reads the completion over SSE
+            stream_queue = message_body.get("stream_queue", None)
 
             logger.info(
                 "Processing task",
@@ -39,12 +95,7 @@ async def process_message(
             )
             # Mark task as in progress
             result = {"request_id": request_id, "status": "in_progress"}
-            await result_channel.default_exchange.publish(
-                aio_pika.Message(
-                    body=json.dumps(result).encode(), headers={"request_id": request_id}
-                ),
-                routing_key="result_queue",
-            )
+            await _publish(result_channel, "result_queue", result, request_id)
 
             output_path = None
             # TODO: delete after 7 days
@@ -53,9 +104,26 @@ async def process_message(
                 os.makedirs(f"{output_dir}/{current_day}", exist_ok=True)
                 output_path = f"{output_dir}/{current_day}/{request_id}.pdf"
 
-            result_data, result_path = await llm_generator.process_task(
-                task, input1_path, input2_path, input_params, output_path, model=model
-            )
+            if stream_queue:
+                result_data = await stream_task(
+                    result_channel,
+                    llm_generator,
+                    stream_queue,
+                    request_id,
+                    task,
+                    input_params,
+                    model=model,
+                )
+                result_path = None
+            else:
+                result_data, result_path = await llm_generator.process_task(
+                    task,
+                    input1_path,
+                    input2_path,
+                    input_params,
+                    output_path,
+                    model=model,
+                )
 
             result = {
                 "request_id": request_id,
@@ -70,9 +138,12 @@ async def process_message(
             logger.exception(e)
             result = {"request_id": request_id, "status": "failed", "error": str(e)}
 
-        await result_channel.default_exchange.publish(
-            aio_pika.Message(
-                body=json.dumps(result).encode(), headers={"request_id": request_id}
-            ),
-            routing_key="result_queue",
-        )
+        # The final text is stored by the backend from result_queue
+        await _publish(result_channel, "result_queue", result, request_id)
+        if stream_queue:
+            await _publish(
+                result_channel,
+                stream_queue,
+                {"event": result["status"], "error": result.get("error")},
+                request_id,
+            )
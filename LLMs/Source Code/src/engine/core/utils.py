@@ -7,9 +7,10 @@ import base64
 import PyPDF2
 import mimetypes
 import fitz
+from core.executor import executor
 
 
-async def get_pdf_content(filepath: str) -> str:
+def extract_pdf_text(filepath: str) -> str:
     pdf_content = ""
     with open(filepath, "rb") as file:
         pdf_reader = PyPDF2.PdfReader(file)
@@ -18,6 +19,11 @@ async def get_pdf_content(filepath: str) -> str:
     return pdf_content
 
 
+async def get_pdf_content(filepath: str) -> str:
+    # PyPDF2 is pure Python, so parsing runs in the process pool
+    return await executor.run_in_process("pdf", extract_pdf_text, filepath)
+
+
 async def img_to_b64(filepath: str) -> str:
     with open(filepath, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode("utf-8")
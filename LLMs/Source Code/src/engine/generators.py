@@ -1,7 +1,7 @@
 from loguru import logger
 from config.config_handler import config
 from langchain_ollama import ChatOllama
-from typing import Union, Dict, List
+from typing import AsyncIterator, Union, Dict, List
 from core.cv_generator import CVGenerator
 import zipfile
 import tempfile
@@ -9,40 +9,52 @@ import os
 import asyncio
 from core.prompt import PromptHandler
 from core import utils
+from core.executor import executor
 
 
 class LLMGenerator:
     def __init__(self):
-        self._current_state = {}
+        self._llms: Dict[tuple, ChatOllama] = {}
         self.prompt_handler = PromptHandler()
-        self._set_model("chat")
+        self._get_llm("chat")
 
-    def _set_model(self, task: str, model: str = None):
+    def _get_llm(self, task: str, model: str = None) -> ChatOllama:
+        # Clients are cached per parameter set instead of swapping one shared
+        # client, since several tasks can be in flight at the same time
         params = self.prompt_handler.get_model_params(task)
         if model is None:
             model = params["model"]
         num_predict = params["num_predict"]
         num_ctx = params["num_ctx"]
-        if (
-            model == self._current_state.get("model", None)
-            and num_predict == self._current_state.get("num_predict", None)
-            and num_ctx == self._current_state.get("num_ctx", None)
-        ):
-            return
-        self.llm = ChatOllama(
-            base_url=config.CORE_BASE_URL,
-            model=model,
-            temperature=config.MODEL_TEMPERATURE,
-            num_predict=num_predict,
-            top_p=config.MODEL_TOP_P,
-            num_ctx=num_ctx,
-        )
-        self.cv_generator = CVGenerator(self.llm)
-        self._current_state = {
-            "model": model,
-            "num_predict": num_predict,
-            "num_ctx": num_ctx,
-        }
+        key = (model, num_predict, num_ctx)
+        if key not in self._llms:
+            self._llms[key] = ChatOllama(
+                base_url=config.CORE_BASE_URL,
+                model=model,
+                temperature=config.MODEL_TEMPERATURE,
+                num_predict=num_predict,
+                top_p=config.MODEL_TOP_P,
+                num_ctx=num_ctx,
+            )
+        return self._llms[key]
+
+    async def _invoke(self, llm: ChatOllama, messages: List):
+        # ChatOllama.invoke blocks until the whole completion is generated
+        return await executor.run_in_thread(llm.model, llm.invoke, messages)
+
+    async def stream_task(
+        self, task: str, input_params: Dict, model: str = None
+    ) -> AsyncIterator[str]:
+        """Yield the completion of a chat task piece by piece as Ollama generates it."""
+        if task != "chat":
+            raise ValueError(f"Task {task} does not support streaming")
+        llm = self._get_llm(task=task, model=model)
+        messages = self.prompt_handler.get_messages(task, input_params["prompt"])
+        # astream runs on the event loop, it only takes the model's slot
+        async with executor.limit(llm.model):
+            async for chunk in llm.astream(messages):
+                if chunk.content:
+                    yield chunk.content
 
     async def _process_zip_file(self, zip_path: str, files_type: str) -> Dict[str, str]:
         """
@@ -142,11 +154,11 @@ class LLMGenerator:
         logger.debug(
             f"{task=}, {input_params=}, {input1_path=}, {input2_path=}, {output_path=}, {model=}"
         )
-        self._set_model(task=task, model=model)
+        llm = self._get_llm(task=task, model=model)
         if task == "hr_pdf_analysis":
             pdf_text = await utils.get_pdf_content(input1_path)
             messages = self.prompt_handler.get_messages(task, pdf_text)
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             try:
                 resp = utils.extract_json_from_response(ai_msg.content)
@@ -159,7 +171,7 @@ class LLMGenerator:
         elif task == "pdf_analysis":
             pdf_text = await utils.get_pdf_content(input1_path)
             messages = self.prompt_handler.get_messages(task, pdf_text)
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             return ai_msg.content, None
         elif task == "hr_pdf_comparison":
@@ -168,7 +180,7 @@ class LLMGenerator:
             messages = self.prompt_handler.get_messages(
                 task, f"CV 1:\n{pdf_text1}\n\CV 2:\n{pdf_text2}"
             )
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             return ai_msg.content, None
         elif task == "hr_pdf_zip_comparison":
@@ -182,7 +194,7 @@ class LLMGenerator:
             logger.debug(f"{human_message=}")
 
             messages = self.prompt_handler.get_messages(task, human_message)
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             return ai_msg.content, None
         elif task == "hr_pdf_zip_compare_and_match":
@@ -199,7 +211,7 @@ class LLMGenerator:
             logger.debug(f"{human_message=}")
 
             messages = self.prompt_handler.get_messages(task, human_message)
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             return ai_msg.content, None
         elif task == "hr_analysis_question":
@@ -208,7 +220,7 @@ class LLMGenerator:
             messages = self.prompt_handler.get_messages(
                 task, f"Questions:\n{questions}\n\nAnswers:{answers}"
             )
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             try:
                 resp = utils.extract_json_from_response(ai_msg.content)
@@ -224,13 +236,18 @@ class LLMGenerator:
                 if type(response) is str:
                     response = response.strip()
                 user_data[question] = response
-            cv_content = self.cv_generator.generate_cv_content(user_data)
-            self.cv_generator.create_pdf_cv(cv_content, output_path)
+            cv_generator = CVGenerator(llm)
+            cv_content = await executor.run_in_thread(
+                llm.model, cv_generator.generate_cv_content, user_data
+            )
+            await executor.run_in_thread(
+                "pdf", cv_generator.create_pdf_cv, cv_content, output_path
+            )
             return None, output_path
         elif task == "chat":
             prompt = input_params["prompt"]
             messages = self.prompt_handler.get_messages(task, prompt)
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             return ai_msg.content, None
         elif task == "chat_multimodal":
@@ -244,7 +261,7 @@ class LLMGenerator:
                 }
             )
             messages = self.prompt_handler.get_messages(task, human_message)
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             return ai_msg.content, None
         elif task == "painting_analysis":
@@ -284,7 +301,7 @@ class LLMGenerator:
                 raise ValueError(f"lang {lang} is not supported")
             logger.debug(f"{human_message=}")
             messages = self.prompt_handler.get_messages(task, human_message)
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             return ai_msg.content, None
         elif task == "ocr":
@@ -307,7 +324,7 @@ class LLMGenerator:
             else:
                 raise ValueError("This filetype is not supported yet")
             messages = self.prompt_handler.get_messages(task, human_message)
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             return ai_msg.content, None
         elif task == "ocr_json":
@@ -330,7 +347,7 @@ class LLMGenerator:
             else:
                 raise ValueError("This filetype is not supported yet")
             messages = self.prompt_handler.get_messages(task, human_message)
-            ai_msg = self.llm.invoke(messages)
+            ai_msg = await self._invoke(llm, messages)
             logger.debug(f"ai response content: {ai_msg.content}")
             return ai_msg.content, None
         else:
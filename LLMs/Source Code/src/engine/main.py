@@ -42,30 +42,44 @@ from generators import LLMGenerator
 import aio_pika
 import asyncio
 from core.queue_utils import process_message
+from core.executor import executor
+from core.launcher import run_workers
 
 
-async def main():
-    llm_generator = LLMGenerator()
+async def main(llm_generator: LLMGenerator):
     connection = await aio_pika.connect_robust(config["QUEUE_CONNECTION"])
 
     # Create separate channels for consuming and publishing
     task_channel = await connection.channel()
     result_channel = await connection.channel()
 
+    # Unacked messages RabbitMQ delivers to this process
+    await task_channel.set_qos(prefetch_count=config.get("PREFETCH_COUNT", 1))
+    # Handlers running at the same time in this process
+    semaphore = asyncio.Semaphore(config.get("CONSUMER_CONCURRENCY", 1))
+
     # Configure task queue
     task_queue = await task_channel.declare_queue("task_queue", durable=True)
 
+    async def on_message(message: aio_pika.IncomingMessage):
+        async with semaphore:
+            await process_message(message, result_channel, llm_generator)
+
     # Start consuming tasks
-    await task_queue.consume(
-        lambda message: process_message(message, result_channel, llm_generator)
-    )
+    await task_queue.consume(on_message)
 
     # Keep connection alive
     try:
         await asyncio.Future()
     finally:
         await connection.close()
+        executor.shutdown()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Models are loaded before forking so workers share them
+    llm_generator = LLMGenerator()
+    run_workers(
+        lambda: asyncio.run(main(llm_generator)),
+        num_workers=config.get("WORKER_PROCESSES", 1),
+    )
@@ -0,0 +1,41 @@
+from config.config_handler import config
+from core.status_stream import FINAL_STATUSES, broker
+from typing import AsyncIterator, Optional
+import asyncio
+import os
+
+
+async def relay_result_file(
+    request_id: str, queue: asyncio.Queue, result_path: Optional[str]
+) -> AsyncIterator[bytes]:
+    """
+    Relay the WAV of a streamed request while the engine is still writing it.
+
+    The engine publishes a "partial" result after every sentence it appends
+    to the file; each event (or TTS_STREAM_POLL_S without one) sends the bytes
+    written since the last read. The relay ends once the request is completed
+    or failed and the file is drained.
+    """
+    chunk_size = config.get("TTS_STREAM_CHUNK_BYTES", 65536)
+    poll = config.get("TTS_STREAM_POLL_S", 1)
+    result_file = None
+    finished = False
+    try:
+        while True:
+            if result_file is None and result_path and os.path.exists(result_path):
+                result_file = open(result_path, "rb")
+            if result_file is not None:
+                while data := await asyncio.to_thread(result_file.read, chunk_size):
+                    yield data
+            if finished:
+                return
+            try:
+                event = await asyncio.wait_for(queue.get(), poll)
+            except asyncio.TimeoutError:
+                continue
+            result_path = event.get("result_path") or result_path
+            finished = event["status"] in FINAL_STATUSES
+    finally:
+        broker.unsubscribe(request_id, queue)
+        if result_file is not None:
+            result_file.close()
@@ -0,0 +1,104 @@
+from core.tts_cache import file_sha256
+from email.utils import formatdate
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from typing import AsyncIterator, Optional, Tuple
+import anyio
+import asyncio
+import os
+import re
+
+MEDIA_TYPES = {
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+}
+CHUNK_SIZE = 64 * 1024
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def media_type(path: str) -> str:
+    return MEDIA_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive of a single-range header, None if unsatisfiable."""
+    match = RANGE.match(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+async def _read_range(path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def file_response(
+    request: Request, path: str, digest: Optional[str] = None
+) -> Response:
+    """
+    FileResponse with conditional and range requests.
+
+    The ETag is the sha256 of the content, stored with the result when it
+    was written (digest) or hashed here for older results. If-None-Match
+    answers 304, and a single "bytes=" range (honoured only when If-Range, if
+    sent, still matches) answers 206, so clients can resume an interrupted
+    download.
+    """
+    try:
+        stat = os.stat(path)
+        if digest is None:
+            digest = await asyncio.to_thread(file_sha256, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Result file not found")
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": "private, max-age=86400",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # Other units, multiple ranges and stale If-Range get the whole file
+    if range_header and RANGE.match(range_header.strip()) and if_range in [None, etag]:
+        byte_range = _parse_range(range_header, stat.st_size)
+        if byte_range is None:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{stat.st_size}"},
+            )
+        start, end = byte_range
+        return StreamingResponse(
+            _read_range(path, start, end),
+            status_code=206,
+            media_type=media_type(path),
+            headers={
+                **headers,
+                "Content-Range": f"bytes {start}-{end}/{stat.st_size}",
+                "Content-Length": str(end - start + 1),
+            },
+        )
+    return FileResponse(path=path, media_type=media_type(path), headers=headers)
@@ -0,0 +1,204 @@
+from config.config_handler import config
+from loguru import logger
+from typing import Dict, Optional
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+
+# Model used when a request doesn't name one
+DEFAULT_MODEL_IDS = {
+    "fa": "male1-online-fa",
+    "en": "female1-en",
+    "ar": "male1-ar",
+}
+
+CHUNK_SIZE = 1024 * 1024
+
+if os.environ.get("MODE", "dev") == "prod":
+    default_cache_dir = "/approot/data/tts_cache"
+else:
+    default_cache_dir = "../../../Outputs/tts_cache"
+
+
+def normalize_text(text: str) -> str:
+    """Text as it is keyed: NFKC with runs of whitespace collapsed."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(
+    model_id: str,
+    text: str,
+    voice: str = "",
+    speed: float = 1.0,
+    audio_format: str = "wav",
+    bitrate: Optional[int] = None,
+) -> str:
+    parts = [
+        model_id,
+        normalize_text(text),
+        voice,
+        f"{speed:g}",
+        audio_format,
+        str(bitrate or ""),
+    ]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _copy(src_path: str, dest_path: str) -> str:
+    """
+    Copy src_path to dest_path through a temp file next to it, so the final
+    rename is atomic, and return the sha256 of the content.
+    """
+    sha256 = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(dest_path) or ".", suffix=".part"
+    )
+    try:
+        with os.fdopen(fd, "wb") as temp_file, open(src_path, "rb") as src:
+            while chunk := src.read(CHUNK_SIZE):
+                sha256.update(chunk)
+                temp_file.write(chunk)
+        os.replace(temp_path, dest_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return sha256.hexdigest()
+
+
+class PhraseCache:
+    """
+    Encoded audio of repeated phrases (IVR greetings, fixed notices).
+
+    Entries are content addressed, <cache_dir>/<hh>/<key>, on the data
+    volume the backend and the engine share: the backend answers hits without
+    queueing a task and the engine stores what it synthesized. Only texts up
+    to TTS_CACHE_MAX_TEXT_CHARS are cached. A hit touches the entry's mtime,
+    and when the cache grows over TTS_CACHE_MAX_MB the least recently used
+    entries are removed down to 90% of it. Results get their own copy of an
+    entry, so touching it never changes a result file.
+    """
+
+    def __init__(self):
+        self.enabled = config.get("TTS_CACHE_ENABLED", True)
+        self._dir = config.get("TTS_CACHE_DIR", default_cache_dir)
+        self._max_bytes = config.get("TTS_CACHE_MAX_MB", 2048) * 1024 * 1024
+        self._max_text_chars = config.get("TTS_CACHE_MAX_TEXT_CHARS", 500)
+        self._lock = threading.Lock()
+        # Bytes stored since the last scan, None until the first store
+        self._size: Optional[int] = None
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def cacheable(self, text: str) -> bool:
+        return self.enabled and len(text) <= self._max_text_chars
+
+    def _path(self, key: str) -> str:
+        # Any format, the key covers it
+        return os.path.join(self._dir, key[:2], key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Path of the entry for key, or None."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+        with self._lock:
+            self._counters["hits"] += 1
+        return path
+
+    def copy_to(self, key: str, dest_path: str) -> Optional[str]:
+        """
+        Copy the entry for key to dest_path and return the sha256 of its
+        content, None on a miss.
+        """
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            return _copy(path, dest_path)
+        except FileNotFoundError:
+            # Evicted in between
+            return None
+
+    def put(self, key: str, src_path: str):
+        """Store a copy of src_path under key."""
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _copy(src_path, path)
+        with self._lock:
+            self._counters["stores"] += 1
+            if self._size is not None:
+                self._size += os.path.getsize(path)
+        if self._size is None or self._size > self._max_bytes:
+            self._evict()
+
+    def _scan(self):
+        entries = []
+        for dirpath, _, filenames in os.walk(self._dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        # Other processes store and touch entries too, so sizes and recency
+        # come from the disk, which is only scanned once over budget
+        entries = self._scan()
+        size = sum(entry[1] for entry in entries)
+        evicted = 0
+        if size > self._max_bytes:
+            entries.sort()
+            low_watermark = self._max_bytes * 0.9
+            for _, entry_size, path in entries:
+                if size <= low_watermark:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= entry_size
+                evicted += 1
+        with self._lock:
+            self._size = size
+            self._counters["evictions"] += evicted
+        if evicted:
+            logger.info("TTS cache evicted", entries=evicted, **self.stats())
+
+    def usage(self) -> Dict:
+        """Entries and size on disk (scans the cache directory)."""
+        entries = self._scan()
+        return {
+            "entries": len(entries),
+            "size_mb": round(sum(entry[1] for entry in entries) / 1024 / 1024, 1),
+            "max_mb": round(self._max_bytes / 1024 / 1024),
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = round(counters["hits"] / lookups, 4) if lookups else 0
+        return counters
+
+
+phrase_cache = PhraseCache()
@@ -1,5 +1,9 @@
+from config.config_handler import config
 import uuid
 import os
+import gzip
+import json
+from typing import List
 
 
 def generate_uuid():
@@ -12,6 +16,15 @@ def delete_file(filepath: str):
 
 
 def validate_text(text: str):
-    if len(text) > 1024:
+    """Long texts are split into segments by the engine (TTS_MAX_TEXT_CHARS)."""
+    if not text.strip() or len(text) > config.get("TTS_MAX_TEXT_CHARS", 100000):
         return False
     return True
+
+
+def append_jsonl_gz(filepath: str, rows: List[dict]):
+    """Append rows to a gzip JSON-lines file (gzip members can be concatenated)."""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with gzip.open(filepath, "at", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
@@ -1,43 +1,47 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from dbutils import models
 from loguru import logger
 from core.messages import Message
 from datetime import datetime, timedelta
-from core import utils
 from dbutils.schemas import WebhookStatus
-from typing import Dict
+from typing import Dict, List
 from sqlalchemy.exc import IntegrityError
+from core import utils
+import asyncio
+import os
 
 
-def clear_database(db: Session):
+async def clear_database(db: AsyncSession):
     try:
-        db.query(models.Manager).delete()
-        db.commit()
+        await db.execute(delete(models.Manager))
+        await db.commit()
         return True
     except Exception as exp:
         logger.opt(exception=False, colors=True).warning(f"Failed: {exp.args}")
-        db.rollback()
+        await db.rollback()
         return False
 
 
-def get_request(
-    db: Session,
+async def get_request(
+    db: AsyncSession,
     request_id: str,
 ):
-    item = (
-        db.query(models.Manager).filter(models.Manager.request_id == request_id).first()
+    item = await db.scalar(
+        select(models.Manager).where(models.Manager.request_id == request_id)
     )
     return item
 
 
-def add_request(db: Session, **kwargs):
+async def add_request(db: AsyncSession, **kwargs):
     kwargs["itime"] = datetime.now(tz=None)
     item = models.Manager(**kwargs)
     try:
         db.add(item)
-        db.commit()
+        await db.commit()
         return Message("fa").INF_SUCCESS()
     except IntegrityError as e:
+        await db.rollback()
         if "UNIQUE constraint failed: manager.request_id" in str(e.args):
             msg = Message("fa").ERR_DUPLICATE_REQUEST_ID()
             return msg
@@ -46,62 +50,206 @@ def add_request(db: Session, **kwargs):
             msg = Message("fa").ERR_FAILED_TO_ADD_TO_DB()
             return msg
     except Exception:
+        await db.rollback()
         logger.opt(exception=True).error("Failed to add_request")
         msg = Message("fa").ERR_FAILED_TO_ADD_TO_DB()
         return msg
 
 
-def update_request(
-    db: Session, request_id: str, status: WebhookStatus, result: Dict, error: str = None
-):
-    item = (
-        db.query(models.Manager).filter(models.Manager.request_id == request_id).first()
+async def update_request(
+    db: AsyncSession,
+    request_id: str,
+    status: WebhookStatus,
+    result: Dict,
+    error: str = None,
+    etag: str = None,
+) -> bool:
+    """Single UPDATE of a request; the caller commits (results are batched)."""
+    values = {"utime": datetime.now(tz=None), "status": status, "result": result}
+    if error is not None:
+        values["error"] = error
+    if etag is not None:
+        values["etag"] = etag
+    response = await db.execute(
+        update(models.Manager)
+        .where(models.Manager.request_id == request_id)
+        .values(**values)
     )
+    return response.rowcount > 0
+
+
+async def set_webhook_result(
+    db: AsyncSession,
+    request_id: str,
+    webhook_status_code: int,
+    increase_retry: bool = True,
+) -> bool:
+    values = {
+        "utime": datetime.now(tz=None),
+        "webhook_status_code": webhook_status_code,
+    }
+    if increase_retry:
+        values["webhook_retry_count"] = case(
+            (models.Manager.webhook_retry_count.is_(None), 0),
+            else_=models.Manager.webhook_retry_count + 1,
+        )
+    try:
+        response = await db.execute(
+            update(models.Manager)
+            .where(models.Manager.request_id == request_id)
+            .values(**values)
+        )
+        await db.commit()
+        return response.rowcount > 0
+    except Exception:
+        logger.opt(exception=True, colors=True).error("Failed to set_webhook_result")
+        await db.rollback()
+        return False
+
+
+async def clean_unused_result_files(db: AsyncSession):
+    filepaths = (
+        await db.execute(
+            select(models.Manager.result)
+            .where(models.Manager.status == "completed")
+            .where(models.Manager.webhook_status_code == 200)
+            .where(models.Manager.utime < datetime.now() - timedelta(days=7))
+        )
+    ).all()
+    for filepath in filepaths:
+        utils.delete_file(filepath[0])
+
+
+async def add_webhook(
+    db: AsyncSession, request_id: str, status: WebhookStatus
+) -> bool:
+    """
+    Queue a webhook, replacing an in_progress one that has not been sent yet.
+    The caller commits (results are batched).
+    """
+    item = await db.get(models.WebhookOutbox, request_id)
+    now = datetime.now(tz=None)
     if item is None:
+        item = models.WebhookOutbox(
+            request_id=request_id, status=status, next_attempt=now, itime=now
+        )
+        db.add(item)
+        # The session doesn't autoflush: without this, a second result of the
+        # same request in the batch wouldn't find the row and add it again
+        await db.flush()
+    elif (
+        item.status == WebhookStatus.in_progress
+        or status != WebhookStatus.in_progress
+    ):
+        item.status = status
+        item.next_attempt = now
+    else:
+        # A late in_progress must not replace a final status
         return False
-    item.utime = datetime.now(tz=None)
-    item.status = status
-    item.result = result
-    if error is not None:
-        item.error = error
+    return True
+
+
+async def get_due_webhooks(
+    db: AsyncSession, limit: int, exclude: List[str]
+) -> List[tuple]:
+    items = await db.execute(
+        select(models.WebhookOutbox.request_id, models.WebhookOutbox.status)
+        .where(models.WebhookOutbox.next_attempt <= datetime.now(tz=None))
+        .where(models.WebhookOutbox.request_id.notin_(exclude))
+        .order_by(models.WebhookOutbox.next_attempt)
+        .limit(limit)
+    )
+    return [(item.request_id, item.status) for item in items]
+
+
+async def delete_webhook(
+    db: AsyncSession, request_id: str, status: WebhookStatus
+) -> bool:
+    """Remove a sent webhook unless a newer status replaced it meanwhile."""
     try:
-        db.commit()
+        await db.execute(
+            delete(models.WebhookOutbox).where(
+                models.WebhookOutbox.request_id == request_id,
+                models.WebhookOutbox.status == status,
+            )
+        )
+        await db.commit()
         return True
     except Exception:
-        logger.opt(exception=True, colors=True).error("Failed to update_request")
+        logger.opt(exception=True, colors=True).error("Failed to delete_webhook")
+        await db.rollback()
         return False
 
 
-def set_webhook_result(
-    db: Session, request_id: str, webhook_status_code: int, increase_retry: bool = True
+async def retry_webhook(
+    db: AsyncSession, request_id: str, status: WebhookStatus, next_attempt: datetime
 ) -> bool:
-    item = (
-        db.query(models.Manager).filter(models.Manager.request_id == request_id).first()
-    )
-    if item is None:
-        return False
-    item.utime = datetime.now(tz=None)
-    if increase_retry:
-        if item.webhook_retry_count is None:
-            item.webhook_retry_count = 0
-        else:
-            item.webhook_retry_count += 1
-    item.webhook_status_code = webhook_status_code
     try:
-        db.commit()
+        await db.execute(
+            update(models.WebhookOutbox)
+            .where(
+                models.WebhookOutbox.request_id == request_id,
+                models.WebhookOutbox.status == status,
+            )
+            .values(next_attempt=next_attempt)
+        )
+        await db.commit()
         return True
     except Exception:
-        logger.opt(exception=True, colors=True).error("Failed to set_webhook_result")
+        logger.opt(exception=True, colors=True).error("Failed to retry_webhook")
+        await db.rollback()
         return False
 
 
-def clean_unused_result_files(db: Session):
-    filepaths = (
-        db.query(models.Manager.result)
-        .filter(models.Manager.status == "completed")
-        .filter(models.Manager.webhook_status_code == 200)
-        .filter(models.Manager.utime < datetime.now() - timedelta(days=7))
-        .all()
-    )
-    for filepath in filepaths:
-        utils.delete_file(filepath[0])
+def _archive_row(item: models.Manager) -> dict:
+    row = {}
+    for column in models.Manager.__table__.columns:
+        value = getattr(item, column.name)
+        row[column.name] = value.name if isinstance(value, WebhookStatus) else value
+    return row
+
+
+async def archive_old_requests(
+    db: AsyncSession, archive_dir: str, days: int, batch_size: int = 5000
+) -> int:
+    """
+    Move finished requests not updated in the last `days` days out of the
+    database into monthly gzip JSON-lines files (manager-YYYY-MM.jsonl.gz).
+    """
+    deadline = datetime.now(tz=None) - timedelta(days=days)
+    archived = 0
+    while True:
+        items = (
+            await db.scalars(
+                select(models.Manager)
+                .where(models.Manager.utime < deadline)
+                .where(
+                    models.Manager.status.in_(
+                        [WebhookStatus.completed, WebhookStatus.failed]
+                    )
+                )
+                .limit(batch_size)
+            )
+        ).all()
+        if not items:
+            break
+        months: Dict[str, List[dict]] = {}
+        for item in items:
+            months.setdefault(item.itime.strftime("%Y-%m"), []).append(
+                _archive_row(item)
+            )
+        # Rows are written before they are deleted, a crash can only duplicate
+        for month, rows in months.items():
+            filepath = os.path.join(archive_dir, f"manager-{month}.jsonl.gz")
+            await asyncio.to_thread(utils.append_jsonl_gz, filepath, rows)
+        await db.execute(
+            delete(models.Manager).where(
+                models.Manager.id.in_([item.id for item in items])
+            )
+        )
+        await db.commit()
+        db.expunge_all()
+        archived += len(items)
+    if archived:
+        logger.info("Archived old requests", count=archived, archive_dir=archive_dir)
+    return archived
@@ -0,0 +1,84 @@
+from sqlalchemy import Table, Text, inspect, text
+from sqlalchemy.engine import Engine
+from dbutils import models
+from loguru import logger
+
+
+def _add_missing_columns(engine: Engine, table: Table, existing: dict):
+    """Nullable columns added to the models since the table was created."""
+    quote = engine.dialect.identifier_preparer.quote
+    for column in table.columns:
+        if column.name in existing or not column.nullable:
+            continue
+        logger.info("Adding column", table=table.name, column=column.name)
+        column_type = column.type.compile(dialect=engine.dialect)
+        with engine.begin() as connection:
+            connection.execute(
+                text(
+                    f"ALTER TABLE {quote(table.name)} "
+                    f"ADD {quote(column.name)} {column_type}"
+                )
+            )
+
+
+def _widen_text_columns(engine: Engine, table: Table, existing: dict):
+    """
+    Columns the models now declare as Text that an existing table still has
+    as VARCHAR (manager.text was String(4000) before long texts were split
+    into segments). SQLite doesn't enforce the length; MySQL is altered in
+    place; Oracle can't turn a VARCHAR2 into a CLOB in place, so the column
+    has to be moved to a new CLOB column by hand.
+    """
+    for column in table.columns:
+        current = existing.get(column.name)
+        if (
+            current is None
+            or not isinstance(column.type, Text)
+            or not getattr(current["type"], "length", None)
+        ):
+            continue
+        if engine.dialect.name == "sqlite":
+            continue
+        if engine.dialect.name == "mysql":
+            logger.info("Altering column to TEXT", table=table.name, column=column.name)
+            quote = engine.dialect.identifier_preparer.quote
+            null = "NULL" if column.nullable else "NOT NULL"
+            with engine.begin() as connection:
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {quote(table.name)} "
+                        f"MODIFY {quote(column.name)} TEXT {null}"
+                    )
+                )
+        else:
+            logger.warning(
+                "Column is still VARCHAR, longer texts will fail: migrate it to "
+                "a text type by hand",
+                table=table.name,
+                column=column.name,
+                dialect=engine.dialect.name,
+            )
+
+
+def migrate(engine: Engine):
+    """
+    Bring an existing database up to the current models.
+
+    create_all only creates missing tables, so indexes added to a table that
+    already exists are created here, as are nullable columns added to it
+    (e.g. manager.etag), and columns changed to Text are widened.
+    Every step is idempotent and runs at startup.
+    """
+    models.Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    for table in models.Base.metadata.sorted_tables:
+        columns = {
+            column["name"]: column for column in inspector.get_columns(table.name)
+        }
+        _add_missing_columns(engine, table, columns)
+        _widen_text_columns(engine, table, columns)
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info("Creating index", table=table.name, index=index.name)
+                index.create(bind=engine)
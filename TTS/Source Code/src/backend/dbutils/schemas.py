@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Literal, Optional
 from pydantic import BaseModel
 from datetime import datetime
 from enum import Enum
@@ -10,6 +10,9 @@ class GenerateRequest(BaseModel):
     model: str = None
     request_id: str = None
     priority: int = 1
+    stream: bool = False
+    format: Literal["wav", "mp3", "ogg", "opus"] = "wav"
+    bitrate: Optional[int] = None  # kbps, the format's default when not set
 
 
 class WebhookStatus(Enum):
@@ -1,24 +1,29 @@
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, HTTPException, Depends, Request, WebSocket
+from sqlalchemy.ext.asyncio import AsyncSession
 import aio_pika
 import uuid
 import json
 import asyncio
 from core.messages import Message
 from datetime import datetime
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from loguru import logger
 import os
 from version import __version__
 from config.config_handler import config
+from core.audio_stream import relay_result_file
+from core.file_response import file_response
 from core.queue_utils import consume_results, get_rabbitmq_connection
+from core.status_stream import broker, status_event
+from core.tts_cache import DEFAULT_MODEL_IDS, cache_key, phrase_cache
+from core.webhook_dispatcher import dispatcher
 from dbutils import schemas, crud
 import sys
 from starlette.middleware.cors import CORSMiddleware
 from core import base, utils
-from dbutils.database import SessionLocal
+from dbutils.database import AsyncSessionLocal
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import pytz
@@ -30,6 +35,13 @@ else:
     log_dir = "../../../Outputs/result"
 os.makedirs(log_dir, exist_ok=True)
 
+# Where the engine writes results, cache hits are put there too
+if os.environ.get("MODE", "dev") == "prod":
+    result_dir = "/approot/data/result"
+else:
+    result_dir = "../../../Outputs/result"
+os.makedirs(result_dir, exist_ok=True)
+
 logger.remove()
 logger.add(
     sys.stderr,
@@ -56,28 +68,49 @@ logger.add(
 logger.info("Starting service", version=__version__)
 
 
+async def clean_unused_result_files():
+    async with AsyncSessionLocal() as db:
+        await crud.clean_unused_result_files(db)
+
+
+async def archive_old_requests():
+    async with AsyncSessionLocal() as db:
+        await crud.archive_old_requests(
+            db,
+            archive_dir=config["ARCHIVE_DIR"],
+            days=config.get("RETENTION_DAYS", 90),
+            batch_size=config.get("ARCHIVE_BATCH_SIZE", 5000),
+        )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan to start the result consumer."""
     try:
         # Result queue
         connection = await aio_pika.connect_robust(config["QUEUE_CONNECTION"])
-        db = SessionLocal()
-        asyncio.create_task(consume_results(connection, db))
+        asyncio.create_task(consume_results(connection))
+        # Webhooks are sent from the outbox in the background
+        asyncio.create_task(dispatcher.run())
         # Delete unused temp files everyday at 2 AM
         scheduler = AsyncIOScheduler()
         scheduler.add_job(
-            crud.clean_unused_result_files,
+            clean_unused_result_files,
             trigger=CronTrigger(
                 hour=2, minute=0, timezone=pytz.timezone("Asia/Tehran")
             ),
-            args=(db,),
+        )
+        # Move old finished requests to the archive everyday at 3 AM
+        scheduler.add_job(
+            archive_old_requests,
+            trigger=CronTrigger(
+                hour=3, minute=0, timezone=pytz.timezone("Asia/Tehran")
+            ),
         )
         scheduler.start()
         yield
     finally:
         scheduler.shutdown()
-        db.close()
         await connection.close()
 
 
@@ -92,19 +125,45 @@ app.add_middleware(
 base_mdl = base.Base()
 
 
+async def complete_from_cache(
+    db: AsyncSession, request_id: str, key: str, audio_format: str
+) -> bool:
+    """Complete a request with cached audio, False when it isn't cached."""
+    result_path = os.path.join(result_dir, f"{request_id}.{audio_format}")
+    etag = await asyncio.to_thread(phrase_cache.copy_to, key, result_path)
+    if etag is None:
+        return False
+    await crud.update_request(
+        db=db,
+        request_id=request_id,
+        status="completed",
+        result=result_path,
+        etag=etag,
+    )
+    await crud.add_webhook(
+        db=db, request_id=request_id, status=schemas.WebhookStatus.completed
+    )
+    await db.commit()
+    broker.publish(
+        {"request_id": request_id, "status": "completed", "result_path": result_path}
+    )
+    dispatcher.notify()
+    return True
+
+
 @app.post("/aihive-txttosp/api/v1/text-to-speech-offline")
 async def generate_sound(
     request: schemas.GenerateRequest,
     connection: aio_pika.RobustConnection = Depends(get_rabbitmq_connection),
-    db: Session = Depends(base.get_db),
+    db: AsyncSession = Depends(base.get_db),
 ):
     if not utils.validate_text(request.text):
-        Message("fa").ERR_INVALID_INPUT()
+        return Message("fa").ERR_INVALID_INPUT()
     logger.info("/tts/text-to-speech-offline", request=request)
     request_id = request.request_id
     if request_id is None:
         request_id = str(uuid.uuid4())
-    response = crud.add_request(
+    response = await crud.add_request(
         db=db,
         request_id=request_id,
         text=request.text,
@@ -115,6 +174,20 @@ async def generate_sound(
     if not response["status"]:
         return response
 
+    model_id = request.model or DEFAULT_MODEL_IDS.get(request.lang or "fa")
+    if model_id and phrase_cache.cacheable(request.text):
+        key = cache_key(
+            model_id,
+            request.text,
+            audio_format=request.format,
+            bitrate=request.bitrate,
+        )
+        if await complete_from_cache(db, request_id, key, request.format):
+            logger.info("Served from TTS cache", request_id=request_id)
+            msg = Message("fa").INF_SUCCESS()
+            msg["data"] = {"request_id": request_id}
+            return msg
+
     channel = await connection.channel()
 
     # Prepare message with text, model, and request_id
@@ -123,6 +196,9 @@ async def generate_sound(
         "model": request.model,
         "lang": request.lang,
         "request_id": request_id,
+        "stream": request.stream,
+        "format": request.format,
+        "bitrate": request.bitrate,
     }
 
     await channel.default_exchange.publish(
@@ -140,27 +216,98 @@ async def generate_sound(
 
 
 @app.get("/aihive-txttosp/api/v1/status/{request_id}")
-async def get_status(request_id: str, db: Session = Depends(base.get_db)):
+async def get_status(request_id: str, db: AsyncSession = Depends(base.get_db)):
     logger.info("/tts/status", request_id=request_id)
-    task = crud.get_request(db=db, request_id=request_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+    task = broker.get_cached(request_id)
+    if task is None:
+        task = await crud.get_request(db=db, request_id=request_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        broker.cache(request_id, task)
     msg = Message("fa").INF_SUCCESS()
     msg["data"] = task
     return msg
 
 
+async def subscribe_status(request_id: str):
+    """Subscribe to the events of a request, returns (queue, current status)."""
+    queue = broker.subscribe(request_id)
+    async with AsyncSessionLocal() as db:
+        task = await crud.get_request(db=db, request_id=request_id)
+    if not task:
+        broker.unsubscribe(request_id, queue)
+        return None, None
+    return queue, status_event(task)
+
+
+@app.get("/aihive-txttosp/api/v1/status/{request_id}/stream")
+async def stream_status(request_id: str):
+    logger.info("/tts/status/stream", request_id=request_id)
+    queue, current = await subscribe_status(request_id)
+    if queue is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return StreamingResponse(
+        broker.sse(request_id, queue, current),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/aihive-txttosp/api/v1/status/{request_id}/ws")
+async def status_websocket(websocket: WebSocket, request_id: str):
+    logger.info("/tts/status/ws", request_id=request_id)
+    queue, current = await subscribe_status(request_id)
+    if queue is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    await broker.websocket(websocket, request_id, queue, current)
+
+
 @app.get("/aihive-txttosp/api/v1/file/{request_id}")
-async def get_file(request_id: str, db: Session = Depends(base.get_db)):
+async def get_file(
+    request_id: str, request: Request, db: AsyncSession = Depends(base.get_db)
+):
     logger.info("/tts/file", request_id=request_id)
-    task = crud.get_request(db=db, request_id=request_id)
+    task = await crud.get_request(db=db, request_id=request_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     if task.status == schemas.WebhookStatus.completed and task.result is not None:
-        return FileResponse(path=task.result, media_type="audio/wav")
+        return await file_response(request, task.result, task.etag)
     else:
         raise HTTPException(status_code=404, detail="Task pending or failed")
 
 
+@app.get("/aihive-txttosp/api/v1/file/{request_id}/stream")
+async def stream_file(request_id: str, request: Request):
+    """Audio of a request as it is synthesized (requests sent with stream)."""
+    logger.info("/tts/file/stream", request_id=request_id)
+    queue = broker.subscribe(request_id)
+    async with AsyncSessionLocal() as db:
+        task = await crud.get_request(db=db, request_id=request_id)
+    if not task or task.status == schemas.WebhookStatus.failed:
+        broker.unsubscribe(request_id, queue)
+        raise HTTPException(status_code=404, detail="Task not found or failed")
+    if task.status == schemas.WebhookStatus.completed and task.result is not None:
+        broker.unsubscribe(request_id, queue)
+        return await file_response(request, task.result, task.etag)
+    return StreamingResponse(
+        relay_result_file(request_id, queue, task.result),
+        media_type="audio/wav",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/aihive-txttosp/api/v1/cache/stats")
+async def cache_stats():
+    logger.info("/tts/cache/stats")
+    msg = Message("fa").INF_SUCCESS()
+    msg["data"] = {
+        **phrase_cache.stats(),
+        **await asyncio.to_thread(phrase_cache.usage),
+    }
+    return msg
+
+
 if __name__ == "__main__":
     uvicorn.run(app="mainapi:app", host="0.0.0.0", port=8001, reload=False)
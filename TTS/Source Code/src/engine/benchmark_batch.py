@@ -0,0 +1,67 @@
+"""
+Throughput of batched SpeechT5 (male1-ar) synthesis against batch size.
+
+Usage:
+    python3 benchmark_batch.py
+    python3 benchmark_batch.py --texts ../../../Samples/ar.txt --batch-sizes 1,4,8 --requests 64
+"""
+
+import argparse
+import time
+from config.config_handler import config
+
+SAMPLE_TEXTS = [
+    "مرحبا بكم.",
+    "كيف حالك اليوم؟",
+    "شكرا لاتصالكم، سيتم تحويل مكالمتكم إلى أحد الموظفين.",
+    "الطقس اليوم مشمس مع بعض السحب في فترة ما بعد الظهر.",
+    "يرجى الانتظار قليلا.",
+    "تم استلام طلبكم بنجاح وسيتم التواصل معكم خلال يومين.",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TTS batch synthesis benchmark")
+    parser.add_argument("--texts", help="File with one text per line")
+    parser.add_argument("--model", default="male1-ar")
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16")
+    parser.add_argument(
+        "--requests", type=int, default=32, help="Number of texts per run"
+    )
+    return parser.parse_args()
+
+
+def run(args):
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            sample_texts = [line.strip() for line in f if line.strip()]
+    else:
+        sample_texts = SAMPLE_TEXTS
+    texts = [sample_texts[i % len(sample_texts)] for i in range(args.requests)]
+
+    # Only load the benchmarked model
+    config._config["MODEL_IDs"] = args.model
+    from generators import TTSGenerator
+
+    tts_generator = TTSGenerator()
+    # Warm up so the first run does not pay lazy initialization
+    tts_generator.synthesize_batch(texts[:1], model_id=args.model)
+
+    print(f"{'batch':>6} {'seconds':>9} {'req/s':>8} {'audio_s/s':>10}")
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        audio_seconds = 0
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            results = tts_generator.synthesize_batch(
+                texts[i : i + batch_size], model_id=args.model
+            )
+            audio_seconds += sum(len(audio) / sr for audio, sr in results)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{batch_size:>6} {elapsed:>9.2f} "
+            f"{len(texts) / elapsed:>8.2f} {audio_seconds / elapsed:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    run(parse_args())
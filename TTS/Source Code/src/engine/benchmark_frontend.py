@@ -0,0 +1,96 @@
+"""
+Front-end time per request of the Persian VITS models: normalization,
+sentence splitting and tokenization (phonemes to ids), without and with
+the phoneme cache. The acoustic model and vocoder are not run.
+
+Usage:
+    python3 benchmark_frontend.py
+    python3 benchmark_frontend.py --texts ../../../Samples/fa.txt --model male1-fa --requests 500
+"""
+
+import argparse
+import statistics
+import time
+from config.config_handler import config
+
+SAMPLE_TEXTS = [
+    "سلام، به سامانه‌ی تبدیل متن به گفتار خوش آمدید.",
+    "لطفا منتظر بمانید.",
+    "سفارش شما با شماره ۱۲۳۴۵ در تاریخ ۱۴۰۲/۰۵/۱۲ ثبت شد.",
+    "مبلغ ۲۵۰٬۰۰۰ تومان با ۱۵٪ تخفیف از حساب شما کسر شد.",
+    "برای ارتباط با پشتیبانی با شماره ۰۲۱۸۸۷۶۵۴۳۲ تماس بگیرید.",
+    "کتاب ها را می خوانم. دما امروز ۲۳.۵ درجه است.",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TTS front-end benchmark")
+    parser.add_argument("--texts", help="File with one text per line")
+    parser.add_argument("--model", default="female1-fa")
+    parser.add_argument(
+        "--requests", type=int, default=200, help="Number of texts per run"
+    )
+    return parser.parse_args()
+
+
+def time_requests(texts, front_end):
+    timings = []
+    for text in texts:
+        start = time.perf_counter()
+        front_end(text)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(args):
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            sample_texts = [line.strip() for line in f if line.strip()]
+    else:
+        sample_texts = SAMPLE_TEXTS
+    texts = [sample_texts[i % len(sample_texts)] for i in range(args.requests)]
+
+    # Only load the benchmarked model
+    config._config["MODEL_IDs"] = args.model
+    from core.normalizer import normalize_fa
+    from core.phoneme_cache import phoneme_cache
+    from generators import TTSGenerator
+
+    synthesizer = TTSGenerator()._synthesizers[args.model]
+    tokenizer = synthesizer.tts_model.tokenizer
+    cached_text_to_ids = tokenizer.text_to_ids
+    uncached_text_to_ids = getattr(cached_text_to_ids, "__wrapped__", None)
+    if uncached_text_to_ids is None:
+        raise SystemExit("TTS_PHONEME_CACHE_SIZE is 0, nothing to compare")
+
+    def front_end(text_to_ids):
+        def run_front_end(text):
+            for sentence in synthesizer.split_into_sentences(normalize_fa(text)):
+                text_to_ids(sentence)
+
+        return run_front_end
+
+    def normalize(text):
+        normalize_fa(text)
+
+    # Warm up the phonemizer, then fill the cache with every sample
+    time_requests(sample_texts, front_end(cached_text_to_ids))
+    runs = {
+        "normalize": time_requests(texts, normalize),
+        "uncached": time_requests(texts, front_end(uncached_text_to_ids)),
+        "cached": time_requests(texts, front_end(cached_text_to_ids)),
+    }
+
+    print(f"{'stage':>10} {'mean_ms':>9} {'p50_ms':>8} {'p95_ms':>8}")
+    for stage, timings in runs.items():
+        timings = sorted(timings)
+        print(
+            f"{stage:>10} {statistics.mean(timings) * 1000:>9.3f} "
+            f"{statistics.median(timings) * 1000:>8.3f} "
+            f"{timings[int(len(timings) * 0.95) - 1] * 1000:>8.3f}"
+        )
+    print(phoneme_cache.stats())
+
+
+if __name__ == "__main__":
+    run(parse_args())
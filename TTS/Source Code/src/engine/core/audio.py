@@ -0,0 +1,96 @@
+from math import gcd
+from scipy.signal import resample_poly
+import numpy as np
+import struct
+
+# RIFF and data sizes of a WAV whose length is not known yet
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def resample(audio: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    if orig_sr == target_sr:
+        return audio
+    divisor = gcd(orig_sr, target_sr)
+    return resample_poly(audio, target_sr // divisor, orig_sr // divisor)
+
+
+def to_pcm16(audio: np.ndarray) -> bytes:
+    audio = np.clip(np.asarray(audio, dtype=np.float32).reshape(-1), -1.0, 1.0)
+    return (audio * 32767).astype("<i2").tobytes()
+
+
+def wav_header(sample_rate: int, data_size: int = UNKNOWN_SIZE) -> bytes:
+    """Header of a mono 16-bit PCM WAV."""
+    riff_size = UNKNOWN_SIZE if data_size == UNKNOWN_SIZE else 36 + data_size
+    return (
+        b"RIFF"
+        + struct.pack("<I", riff_size)
+        + b"WAVEfmt "
+        + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+        + b"data"
+        + struct.pack("<I", data_size)
+    )
+
+
+class StreamingWavWriter:
+    """
+    Mono 16-bit WAV that can be read while it is being written.
+
+    The header is written first with unknown (0xFFFFFFFF) sizes, which
+    streaming players accept, and every write is flushed, so a reader tailing
+    the file gets playable audio as soon as the first chunk lands. close
+    patches the real sizes in. Chunks at another sample rate are resampled.
+
+    With crossfade > 0 consecutive chunks overlap by that many samples with a
+    linear fade, so the joins don't click. Only the last crossfade samples of
+    the previous chunk are held back, until the next chunk or close.
+    """
+
+    def __init__(self, path: str, sample_rate: int, crossfade: int = 0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._crossfade = crossfade
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._data_size = 0
+        self._file = open(path, "wb")
+        self._file.write(wav_header(sample_rate))
+        self._file.flush()
+
+    def _write_pcm(self, audio: np.ndarray):
+        data = to_pcm16(audio)
+        self._file.write(data)
+        self._file.flush()
+        self._data_size += len(data)
+
+    def write(self, audio: np.ndarray, sample_rate: int):
+        audio = resample(audio, sample_rate, self.sample_rate)
+        if not self._crossfade:
+            self._write_pcm(audio)
+            return
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        tail = self._tail
+        overlap = min(self._crossfade, len(tail), len(audio))
+        if overlap:
+            fade = np.linspace(0.0, 1.0, overlap, dtype=np.float32)
+            audio = np.concatenate(
+                [
+                    tail[:-overlap],
+                    tail[-overlap:] * (1 - fade) + audio[:overlap] * fade,
+                    audio[overlap:],
+                ]
+            )
+        else:
+            audio = np.concatenate([tail, audio])
+        split = max(len(audio) - self._crossfade, 0)
+        self._write_pcm(audio[:split])
+        self._tail = audio[split:]
+
+    def close(self):
+        if self._file.closed:
+            return
+        if len(self._tail):
+            self._write_pcm(self._tail)
+            self._tail = np.zeros(0, dtype=np.float32)
+        self._file.seek(0)
+        self._file.write(wav_header(self.sample_rate, self._data_size))
+        self._file.close()
@@ -0,0 +1,82 @@
+from generators import TTSGenerator
+from core.executor import executor
+from loguru import logger
+from typing import Dict, List, Tuple
+import asyncio
+import numpy as np
+
+
+class TTSBatcher:
+    """
+    Collects pending texts per model and synthesizes them in micro-batches.
+
+    A batch is flushed when it reaches max_batch_size or when its oldest
+    text has waited max_wait_ms, whichever comes first.
+    """
+
+    def __init__(
+        self, tts_generator: TTSGenerator, max_batch_size: int, max_wait_ms: int
+    ):
+        self._tts_generator = tts_generator
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max_wait_ms / 1000
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    async def submit(self, text: str, model_id: str) -> Tuple[np.ndarray, int]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(model_id, [])
+        pending.append((text, future))
+        if len(pending) >= self._max_batch_size:
+            self._flush(model_id)
+        elif model_id not in self._timers:
+            self._timers[model_id] = loop.call_later(
+                self._max_wait, self._flush, model_id
+            )
+        return await future
+
+    def _flush(self, model_id: str):
+        timer = self._timers.pop(model_id, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(model_id, [])
+        if not batch:
+            return
+        task = asyncio.create_task(self._run_batch(model_id, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, model_id: str, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        logger.debug("Running batch", model_id=model_id, size=len(batch))
+        try:
+            results = await executor.run_in_thread(
+                model_id,
+                self._tts_generator.synthesize_batch,
+                texts=texts,
+                model_id=model_id,
+            )
+        except Exception:
+            # One bad text must not fail the whole batch
+            logger.opt(exception=True).warning(
+                "Batch failed, retrying texts one by one", model_id=model_id
+            )
+            for text, future in batch:
+                if future.done():
+                    continue
+                try:
+                    result = await executor.run_in_thread(
+                        model_id,
+                        self._tts_generator.synthesize_batch,
+                        texts=[text],
+                        model_id=model_id,
+                    )
+                    future.set_result(result[0])
+                except Exception as e:
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,84 @@
+from config.config_handler import config
+from typing import Optional
+import asyncio
+import os
+
+# ffmpeg encoder arguments and default bitrate (kbps) per output format
+FORMATS = {
+    "wav": {"args": [], "bitrate": None},
+    "mp3": {"args": ["-c:a", "libmp3lame"], "bitrate": 48},
+    "ogg": {"args": ["-c:a", "libvorbis"], "bitrate": 48},
+    # Opus in an Ogg container, tuned for speech
+    "opus": {"args": ["-c:a", "libopus", "-application", "voip"], "bitrate": 24},
+}
+
+
+class Encoder:
+    """
+    Post-synthesis encoding with ffmpeg.
+
+    Every encode is an ffmpeg process awaited on the event loop, at most
+    TTS_ENCODE_WORKERS at a time per engine process, so encoding neither
+    holds an inference thread nor the GIL.
+    """
+
+    def __init__(self):
+        self._workers = config.get("TTS_ENCODE_WORKERS", 2)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def encode(
+        self, wav_path: str, audio_format: str, bitrate: Optional[int] = None
+    ) -> str:
+        """
+        Encode a WAV result to audio_format next to it and remove the WAV.
+        Returns the path of the encoded file (wav_path for "wav").
+
+        bitrate is in kbps, clamped to TTS_BITRATE_MIN_KBPS..MAX; the
+        format's default is used when it is None.
+        """
+        if audio_format not in FORMATS:
+            raise ValueError(f"Format {audio_format} not supported")
+        if audio_format == "wav":
+            return wav_path
+        if bitrate is None:
+            bitrate = FORMATS[audio_format]["bitrate"]
+        bitrate = min(
+            max(bitrate, config.get("TTS_BITRATE_MIN_KBPS", 8)),
+            config.get("TTS_BITRATE_MAX_KBPS", 192),
+        )
+        output_path = f"{os.path.splitext(wav_path)[0]}.{audio_format}"
+        # Encode under a temporary name so a reader never sees a partial file
+        temp_path = f"{output_path}.part"
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._workers)
+        try:
+            async with self._semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    "ffmpeg",
+                    "-nostdin",
+                    "-v",
+                    "error",
+                    "-y",
+                    "-i",
+                    wav_path,
+                    *FORMATS[audio_format]["args"],
+                    "-b:a",
+                    f"{bitrate}k",
+                    "-f",
+                    "ogg" if audio_format == "opus" else audio_format,
+                    temp_path,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                _, stderr = await process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed: {stderr.decode().strip()}")
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        os.remove(wav_path)
+        return output_path
+
+
+encoder = Encoder()
@@ -0,0 +1,121 @@
+from loguru import logger
+from typing import Callable, Dict, Optional
+import functools
+import multiprocessing
+import multiprocessing.synchronize
+import os
+import signal
+import time
+
+# Set in every worker by run_workers, see notify_ready()
+_ready_callback: Optional[Callable[[], None]] = None
+
+
+def notify_ready():
+    """Report the current worker as warmed up and consuming."""
+    if _ready_callback is not None:
+        _ready_callback()
+
+
+def _write_ready_file(ready_file: Optional[str]):
+    if ready_file:
+        with open(ready_file, "w") as f:
+            f.write(str(os.getpid()))
+
+
+def _remove_ready_file(ready_file: Optional[str]):
+    if ready_file and os.path.exists(ready_file):
+        os.remove(ready_file)
+
+
+def _run_worker(target: Callable[[], None], ready: Callable[[], None]):
+    global _ready_callback
+    _ready_callback = ready
+    # Workers inherit the parent's handlers when they are (re)started
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        target()
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(
+    target: Callable[[], None], num_workers: int, ready_file: Optional[str] = None
+):
+    """
+    Run target in num_workers forked processes and restart any that exits.
+
+    Everything loaded before this call (e.g. model weights) is shared
+    copy-on-write with the workers, so load models first and only open
+    connections and pools inside target. With num_workers <= 1 target runs
+    in the current process.
+
+    target calls notify_ready() once it consumes. Only this process writes
+    ready_file: it exists while every worker has reported ready, and is
+    removed as soon as one exits.
+    """
+    _remove_ready_file(ready_file)
+    if num_workers <= 1:
+        global _ready_callback
+        _ready_callback = functools.partial(_write_ready_file, ready_file)
+        try:
+            target()
+        finally:
+            _remove_ready_file(ready_file)
+        return
+
+    context = multiprocessing.get_context("fork")
+    workers: Dict[int, multiprocessing.Process] = {}
+    ready_events: Dict[int, multiprocessing.synchronize.Event] = {}
+    ready = False
+    stopping = False
+
+    def start_worker(index: int):
+        ready_events[index] = context.Event()
+        process = context.Process(
+            target=_run_worker,
+            args=(target, ready_events[index].set),
+            name=f"worker-{index}",
+        )
+        process.start()
+        workers[index] = process
+        logger.info("Worker started", worker=process.name, pid=process.pid)
+
+    def stop_workers(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()
+
+    for index in range(num_workers):
+        start_worker(index)
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+
+    try:
+        while not stopping:
+            for index, process in list(workers.items()):
+                if not process.is_alive() and not stopping:
+                    logger.warning(
+                        "Worker exited, restarting",
+                        worker=process.name,
+                        exitcode=process.exitcode,
+                    )
+                    start_worker(index)
+            all_ready = all(event.is_set() for event in ready_events.values())
+            if all_ready and not ready:
+                _write_ready_file(ready_file)
+                logger.info("All workers ready", workers=num_workers)
+            elif ready and not all_ready:
+                _remove_ready_file(ready_file)
+                logger.warning("Not all workers ready")
+            ready = all_ready
+            time.sleep(1)
+    finally:
+        _remove_ready_file(ready_file)
+
+    for process in workers.values():
+        process.join()
+    logger.info("All workers stopped")
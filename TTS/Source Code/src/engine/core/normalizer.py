@@ -0,0 +1,240 @@
+from config.config_handler import config
+import re
+
+ONES = ["", "یک", "دو", "سه", "چهار", "پنج", "شش", "هفت", "هشت", "نه"]
+TEENS = [
+    "ده",
+    "یازده",
+    "دوازده",
+    "سیزده",
+    "چهارده",
+    "پانزده",
+    "شانزده",
+    "هفده",
+    "هجده",
+    "نوزده",
+]
+TENS = ["", "", "بیست", "سی", "چهل", "پنجاه", "شصت", "هفتاد", "هشتاد", "نود"]
+HUNDREDS = [
+    "",
+    "صد",
+    "دویست",
+    "سیصد",
+    "چهارصد",
+    "پانصد",
+    "ششصد",
+    "هفتصد",
+    "هشتصد",
+    "نهصد",
+]
+SCALES = ["", "هزار", "میلیون", "میلیارد", "تریلیون"]
+JALALI_MONTHS = [
+    "فروردین",
+    "اردیبهشت",
+    "خرداد",
+    "تیر",
+    "مرداد",
+    "شهریور",
+    "مهر",
+    "آبان",
+    "آذر",
+    "دی",
+    "بهمن",
+    "اسفند",
+]
+GREGORIAN_MONTHS = [
+    "ژانویه",
+    "فوریه",
+    "مارس",
+    "آوریل",
+    "مه",
+    "ژوئن",
+    "ژوئیه",
+    "اوت",
+    "سپتامبر",
+    "اکتبر",
+    "نوامبر",
+    "دسامبر",
+]
+ABBREVIATIONS = {
+    "ج.ا.ا": "جمهوری اسلامی ایران",
+    "ه.ش": "هجری شمسی",
+    "ه.ق": "هجری قمری",
+    "ق.م": "قبل از میلاد",
+    "ص.پ": "صندوق پستی",
+    "ر.ک": "رجوع کنید",
+    "km2": "کیلومتر مربع",
+    "m2": "متر مربع",
+    "cm2": "سانتی‌متر مربع",
+    "m3": "متر مکعب",
+    "km": "کیلومتر",
+    "kg": "کیلوگرم",
+    "cm": "سانتی‌متر",
+    "mm": "میلی‌متر",
+}
+
+ZWNJ = "‌"
+CHARACTERS = str.maketrans(
+    {
+        "ي": "ی",
+        "ى": "ی",
+        "ك": "ک",
+        "ـ": None,  # tatweel
+        "‎": None,  # LRM
+        "‏": None,  # RLM
+        "­": None,  # soft hyphen
+        "﻿": None,
+        "٫": ".",
+        "٬": ",",
+        **{chr(0x06F0 + i): str(i) for i in range(10)},
+        **{chr(0x0660 + i): str(i) for i in range(10)},
+    }
+)
+PERSIAN_LETTER = "؀-ۿ"
+DATE = re.compile(r"\b(\d{4})[/-](\d{1,2})[/-](\d{1,2})\b")
+# HH:MM[:SS], other digits around a colon are a ratio or a score
+TIME = re.compile(r"(?<![\d:])([01]\d|2[0-3]):([0-5]\d)(?::([0-5]\d))?(?![\d:])")
+RATIO = re.compile(r"(?<![\d:])(\d+):(\d+)(?![\d:])")
+GROUPED_NUMBER = re.compile(r"\b\d{1,3}(?:,\d{3})+\b")
+PERCENT = re.compile(r"(\d+(?:\.\d+)?)\s*[%٪]")
+# Numbers in Latin tokens (mp3, 5a) or dotted sequences (2.0.1) are left as is
+NOT_NUMBER_BEFORE = r"(?<![A-Za-z\d])(?<!\d\.)"
+NOT_NUMBER_AFTER = r"(?![A-Za-z\d])(?!\.\d)"
+DECIMAL = re.compile(rf"{NOT_NUMBER_BEFORE}(\d+)\.(\d+){NOT_NUMBER_AFTER}")
+NUMBER = re.compile(rf"{NOT_NUMBER_BEFORE}\d+{NOT_NUMBER_AFTER}")
+PREFIX_MI = re.compile(
+    rf"(?<![{PERSIAN_LETTER}{ZWNJ}])(ن?می) +(?=[{PERSIAN_LETTER}])"
+)
+SUFFIXES = re.compile(
+    rf"(?<=[{PERSIAN_LETTER}]) +"
+    r"(ها|های|هایی|هایم|هایت|هایش|هایمان|هایتان|هایشان|ترین)"
+    rf"(?![{PERSIAN_LETTER}])"
+)
+# Built-in abbreviations, extended or overridden by TTS_FA_ABBREVIATIONS.
+# A unit may follow its number directly (5km), the expansion is then spaced.
+ABBREVIATION_PATTERNS = [
+    (re.compile(rf"(?:(?<=\d)|(?<!\w)){re.escape(abbreviation)}(?!\w)"), expansion)
+    for abbreviation, expansion in {
+        **ABBREVIATIONS,
+        **(config.get("TTS_FA_ABBREVIATIONS") or {}),
+    }.items()
+]
+
+
+def _three_digits(n: int) -> str:
+    parts = []
+    if n >= 100:
+        parts.append(HUNDREDS[n // 100])
+        n %= 100
+    if 10 <= n < 20:
+        parts.append(TEENS[n - 10])
+    else:
+        if n >= 20:
+            parts.append(TENS[n // 10])
+        if n % 10:
+            parts.append(ONES[n % 10])
+    return " و ".join(parts)
+
+
+def number_to_words(n: int) -> str:
+    """Persian words of an integer, digit by digit beyond the trillions."""
+    if n == 0:
+        return "صفر"
+    if n < 0:
+        return f"منفی {number_to_words(-n)}"
+    if n >= 1000 ** len(SCALES):
+        return " ".join(number_to_words(int(digit)) for digit in str(n))
+    parts = []
+    scale = 0
+    while n:
+        n, group = divmod(n, 1000)
+        if group:
+            if scale == 1 and group == 1:
+                parts.append(SCALES[1])
+            else:
+                parts.append(f"{_three_digits(group)} {SCALES[scale]}".strip())
+        scale += 1
+    return " و ".join(reversed(parts))
+
+
+def ordinal(n: int) -> str:
+    if n == 1:
+        return "یکم"
+    words = number_to_words(n)
+    if words.endswith("سه"):
+        return words[:-2] + "سوم"
+    if words.endswith("ی"):
+        return words + ZWNJ + "ام"
+    return words + "م"
+
+
+def _read_number(digits: str) -> str:
+    # Phone numbers, codes and the like are read digit by digit
+    if len(digits) > 1 and digits.startswith("0"):
+        return " ".join(number_to_words(int(digit)) for digit in digits)
+    return number_to_words(int(digits))
+
+
+def _read_date(match: re.Match) -> str:
+    year, month, day = (int(group) for group in match.groups())
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return match.group(0)
+    months = JALALI_MONTHS if year < 1700 else GREGORIAN_MONTHS
+    return f"{ordinal(day)} {months[month - 1]} {number_to_words(year)}"
+
+
+def _read_time(match: re.Match) -> str:
+    hour, minute, second = match.groups()
+    parts = [number_to_words(int(hour))]
+    if int(minute):
+        parts.append(f"{number_to_words(int(minute))} دقیقه")
+    if second and int(second):
+        parts.append(f"{number_to_words(int(second))} ثانیه")
+    return " و ".join(parts)
+
+
+def _read_decimal(match: re.Match) -> str:
+    # Fractional digits keep their leading zeros: 3.05 is not 3.5
+    return f"{_read_number(match.group(1))} ممیز {_read_number(match.group(2))}"
+
+
+def _expand_abbreviations(text: str) -> str:
+    for pattern, expansion in ABBREVIATION_PATTERNS:
+        text = pattern.sub(f" {expansion}", text)
+    return text
+
+
+def _fix_zwnj(text: str) -> str:
+    text = re.sub(f"{ZWNJ}+", ZWNJ, text)
+    # A ZWNJ next to a space or at a word edge joins nothing
+    text = re.sub(rf"{ZWNJ}(?=\s|$)|(?<=\s){ZWNJ}|^{ZWNJ}", "", text)
+    text = PREFIX_MI.sub(rf"\1{ZWNJ}", text)
+    return SUFFIXES.sub(rf"{ZWNJ}\1", text)
+
+
+def normalize_fa(text: str) -> str:
+    """
+    Persian text as the VITS front end expects it: Arabic letter forms and
+    digits unified, abbreviations and units expanded, dates, times, ratios,
+    percentages, decimals and numbers spelled out (not inside Latin tokens or
+    version-like dotted sequences), ZWNJ fixed for the mi- prefix and
+    plural/superlative suffixes, and Persian punctuation.
+    """
+    text = text.translate(CHARACTERS)
+    text = _expand_abbreviations(text)
+    text = DATE.sub(_read_date, text)
+    text = TIME.sub(_read_time, text)
+    text = RATIO.sub(
+        lambda match: f"{_read_number(match.group(1))} به "
+        f"{_read_number(match.group(2))}",
+        text,
+    )
+    text = GROUPED_NUMBER.sub(lambda match: match.group(0).replace(",", ""), text)
+    text = PERCENT.sub(lambda match: f"{match.group(1)} درصد", text)
+    text = DECIMAL.sub(_read_decimal, text)
+    text = NUMBER.sub(lambda match: _read_number(match.group(0)), text)
+    text = _fix_zwnj(text)
+    text = text.replace("?", "؟").replace(";", "؛")
+    text = re.sub(rf"(?<=[{PERSIAN_LETTER}])\s*,\s*", "، ", text)
+    return re.sub(r"[ \t]+", " ", text).strip()
+
@@ -0,0 +1,253 @@
+from config.config_handler import config
+from loguru import logger
+from typing import Awaitable, Callable, Optional, Tuple
+import aiohttp
+import asyncio
+import edge_tts
+import inspect
+import io
+import numpy as np
+import soundfile as sf
+import time
+
+ONLINE_MODEL_ID = "male1-online-fa"
+# Offline VITS model used when edge-tts is down or slow
+FALLBACK_MODEL_ID = "female1-fa"
+VOICE = "fa-IR-FaridNeural"
+CHUNK_SIZE = 64 * 1024
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After failure_threshold failures in a row the circuit opens and allow()
+    returns False for open_s seconds. Then a single trial call is let through
+    (half open): its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, open_s: float):
+        self._failure_threshold = failure_threshold
+        self._open_s = open_s
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self._open_s:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        now = time.monotonic()
+        # A trial that never reported back doesn't block the next one forever
+        if self._trial_at is not None and now - self._trial_at < self._open_s:
+            return False
+        self._trial_at = now
+        return True
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info("Online TTS circuit closed")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_at = None
+
+    def record_failure(self):
+        self._failures += 1
+        if self._trial_at is not None or (
+            self._opened_at is None and self._failures >= self._failure_threshold
+        ):
+            self._opened_at = time.monotonic()
+            self._trial_at = None
+            logger.warning(
+                "Online TTS circuit opened",
+                failures=self._failures,
+                open_s=self._open_s,
+            )
+
+
+class _SharedConnector(aiohttp.TCPConnector):
+    """
+    edge-tts closes the connector of the session it opens for every call;
+    this one stays open until shutdown() so calls share its DNS cache and
+    connection limit.
+    """
+
+    async def close(self, *args, **kwargs):
+        pass
+
+    async def shutdown(self):
+        closed = aiohttp.TCPConnector.close(self)
+        if inspect.isawaitable(closed):
+            await closed
+
+
+def _ignore_result(task: asyncio.Future):
+    # Retrieve the exception of a losing hedge so asyncio doesn't log it
+    if not task.cancelled():
+        task.exception()
+
+
+def decode_mp3(data: bytes) -> Tuple[np.ndarray, int]:
+    audio, sr = sf.read(io.BytesIO(data), dtype="float32")
+    return audio, sr
+
+
+class OnlineTTS:
+    """
+    Async edge-tts (male1-online-fa) with offline fallback.
+
+    - At most ONLINE_TTS_POOL_SIZE sessions are open per process, over one
+      shared connector.
+    - Failures and timeouts feed a CircuitBreaker; while it is open requests
+      go straight to the offline model.
+    - With ONLINE_TTS_HEDGE_MS set, the offline model is started as well when
+      edge-tts hasn't sent audio within that time, and the first result wins.
+    - With ONLINE_TTS_URL set, a stand-in service is called instead of the
+      edge service: it receives {"text", "voice"} as JSON and returns the
+      audio (MP3 or WAV) as the response body.
+    """
+
+    def __init__(self):
+        self._enabled = config.get("ONLINE_TTS_ENABLED", True)
+        self._url = config.get("ONLINE_TTS_URL") or None
+        self._pool_size = config.get("ONLINE_TTS_POOL_SIZE", 4)
+        self._connect_timeout = config.get("ONLINE_TTS_CONNECT_TIMEOUT_S", 5)
+        self._receive_timeout = config.get("ONLINE_TTS_RECEIVE_TIMEOUT_S", 20)
+        self._hedge_s = config.get("ONLINE_TTS_HEDGE_MS", 0) / 1000
+        self._breaker = CircuitBreaker(
+            failure_threshold=config.get("ONLINE_TTS_FAILURE_THRESHOLD", 3),
+            open_s=config.get("ONLINE_TTS_OPEN_S", 30),
+        )
+        # Created on first use, inside the event loop of the worker process
+        self._connector: Optional[_SharedConnector] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_connector(self) -> _SharedConnector:
+        if self._connector is None:
+            self._connector = _SharedConnector(
+                limit=self._pool_size, ttl_dns_cache=300
+            )
+            self._semaphore = asyncio.Semaphore(self._pool_size)
+        return self._connector
+
+    async def _fetch_stand_in(self, text: str, first_audio: asyncio.Event) -> bytes:
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self._connect_timeout, sock_read=self._receive_timeout
+        )
+        async with aiohttp.ClientSession(
+            connector=self._get_connector(), connector_owner=False, timeout=timeout
+        ) as session:
+            async with session.post(
+                self._url, json={"text": text, "voice": VOICE}
+            ) as response:
+                response.raise_for_status()
+                chunks = []
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    chunks.append(chunk)
+                    first_audio.set()
+        return b"".join(chunks)
+
+    async def _fetch(self, text: str, first_audio: asyncio.Event) -> bytes:
+        if self._url:
+            return await self._fetch_stand_in(text, first_audio)
+        communicate = edge_tts.Communicate(
+            text,
+            VOICE,
+            connector=self._get_connector(),
+            connect_timeout=self._connect_timeout,
+            receive_timeout=self._receive_timeout,
+        )
+        chunks = []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                chunks.append(chunk["data"])
+                first_audio.set()
+        return b"".join(chunks)
+
+    async def _online(
+        self, text: str, first_audio: asyncio.Event
+    ) -> Tuple[np.ndarray, int]:
+        try:
+            self._get_connector()
+            async with self._semaphore:
+                data = await self._fetch(text, first_audio)
+            audio, sr = await asyncio.to_thread(decode_mp3, data)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._breaker.record_failure()
+            raise
+        self._breaker.record_success()
+        return audio, sr
+
+    async def synthesize(
+        self,
+        text: str,
+        offline: Callable[[], Awaitable[Tuple[np.ndarray, int, str]]],
+    ) -> Tuple[np.ndarray, int, str]:
+        """
+        Audio of text, its sample rate and the model that produced it.
+        offline() runs the fallback model and returns the same triple.
+        """
+        if not self._enabled or not self._breaker.allow():
+            return await offline()
+        first_audio = asyncio.Event()
+        online = asyncio.ensure_future(self._online(text, first_audio))
+        if self._hedge_s:
+            waiter = asyncio.ensure_future(first_audio.wait())
+            await asyncio.wait(
+                {online, waiter},
+                timeout=self._hedge_s,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            waiter.cancel()
+            if not first_audio.is_set() and not online.done():
+                logger.info("Online TTS slow, hedging with offline model")
+                return await self._race(online, asyncio.ensure_future(offline()))
+        try:
+            audio, sr = await online
+        except Exception:
+            logger.opt(exception=True).warning(
+                f"{ONLINE_MODEL_ID} not worked: using {FALLBACK_MODEL_ID} instead"
+            )
+            return await offline()
+        return audio, sr, ONLINE_MODEL_ID
+
+    async def _race(
+        self, online: asyncio.Future, offline: asyncio.Future
+    ) -> Tuple[np.ndarray, int, str]:
+        await asyncio.wait({online, offline}, return_when=asyncio.FIRST_COMPLETED)
+        if online.done() and online.exception() is None:
+            # The offline model still holds its executor slot until it returns
+            offline.add_done_callback(_ignore_result)
+            audio, sr = online.result()
+            return audio, sr, ONLINE_MODEL_ID
+        if offline.done() and offline.exception() is None:
+            online.cancel()
+            # Losing the hedge counts as a failure of the online path
+            self._breaker.record_failure()
+            return offline.result()
+        # The first one to finish failed, the other one decides
+        if online.done():
+            return await offline
+        offline.add_done_callback(_ignore_result)
+        audio, sr = await online
+        return audio, sr, ONLINE_MODEL_ID
+
+    async def close(self):
+        if self._connector is not None:
+            await self._connector.shutdown()
+            self._connector = None
+
+
+online_tts = OnlineTTS()
@@ -0,0 +1,64 @@
+from config.config_handler import config
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+import functools
+import threading
+
+
+class PhonemeCache:
+    """
+    Least recently used token ids of the sentences a model was asked to say.
+
+    The Coqui front end (cleaners, phonemizer, tokenizer) runs once per
+    sentence and dominates the cost of short requests, so its output is
+    kept per (model, language, normalized sentence) and repeated phrases
+    go straight to the acoustic model. Shared by the inference threads.
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._ids: OrderedDict[Tuple[str, Optional[str], str], Tuple[int, ...]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def wrap(
+        self, model_id: str, text_to_ids: Callable[..., List[int]]
+    ) -> Callable[..., List[int]]:
+        """Cached version of a tokenizer's text_to_ids(text, language)."""
+        if self._max_size <= 0:
+            return text_to_ids
+
+        @functools.wraps(text_to_ids)
+        def cached(text: str, language: Optional[str] = None) -> List[int]:
+            key = (model_id, language, text)
+            with self._lock:
+                ids = self._ids.get(key)
+                if ids is not None:
+                    self._ids.move_to_end(key)
+                    self._hits += 1
+                    return list(ids)
+                self._misses += 1
+            ids = tuple(text_to_ids(text, language))
+            with self._lock:
+                self._ids[key] = ids
+                while len(self._ids) > self._max_size:
+                    self._ids.popitem(last=False)
+            return list(ids)
+
+        return cached
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._ids),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else None,
+            }
+
+
+phoneme_cache = PhonemeCache(config.get("TTS_PHONEME_CACHE_SIZE", 10000))
@@ -1,7 +1,19 @@
-from generators import TTSGenerator
+from generators import BATCHED_MODEL_IDS, TTSGenerator
+from core.audio import StreamingWavWriter
+from core.batcher import TTSBatcher
+from core.encoding import FORMATS, encoder
+from core.executor import executor
+from core.online_tts import FALLBACK_MODEL_ID, ONLINE_MODEL_ID, online_tts
+from config.config_handler import config
+from core.text import split_segments, split_sentences
+from core.tts_cache import cache_key, file_sha256, phrase_cache
 import aio_pika
+import asyncio
+import collections
 import json
 from loguru import logger
+from typing import Tuple
+import numpy as np
 import os
 
 if os.environ.get("MODE", "dev") == "prod":
@@ -15,6 +27,7 @@ async def process_message(
     message: aio_pika.IncomingMessage,
     result_channel: aio_pika.Channel,
     tts_generator: TTSGenerator,
+    batcher: TTSBatcher,
 ):
     async with message.process():
         try:
@@ -24,6 +37,10 @@ async def process_message(
             model = message_body.get("model", None)
             request_id = message_body["request_id"]
             lang = message_body.get("lang", None)
+            audio_format = message_body.get("format") or "wav"
+            bitrate = message_body.get("bitrate")
+            if audio_format not in FORMATS:
+                raise ValueError(f"Format {audio_format} not supported")
 
             logger.info("Processing task", request_id=request_id)
             result = {
@@ -37,15 +54,61 @@ async def process_message(
                 routing_key="result_queue",
             )
 
-            output_path = f"{output_dir}/{request_id}.wav"
-            await tts_generator.do_tts(
-                text=text, model_id=model, tmp_path=output_path, lang=lang
-            )
+            wav_path = f"{output_dir}/{request_id}.wav"
+            output_path = f"{output_dir}/{request_id}.{audio_format}"
+            model_id = tts_generator.get_model_id(model_id=model, lang=lang)
+            key = None
+            if phrase_cache.cacheable(text):
+                key = cache_key(
+                    model_id, text, audio_format=audio_format, bitrate=bitrate
+                )
+            # Same phrase synthesized since the backend looked it up
+            etag = None
+            if key:
+                etag = await asyncio.to_thread(phrase_cache.copy_to, key, output_path)
+            if etag is not None:
+                logger.info("Served from TTS cache", request_id=request_id)
+            else:
+                # A retried request starts from fresh files
+                for path in {wav_path, output_path}:
+                    if os.path.exists(path):
+                        os.remove(path)
+                if message_body.get("stream"):
+                    used_model_id = await synthesize_stream(
+                        result_channel,
+                        tts_generator,
+                        batcher,
+                        request_id=request_id,
+                        text=text,
+                        model_id=model_id,
+                        output_path=wav_path,
+                    )
+                else:
+                    used_model_id = await synthesize_segments(
+                        result_channel,
+                        tts_generator,
+                        batcher,
+                        request_id=request_id,
+                        text=text,
+                        model_id=model_id,
+                        output_path=wav_path,
+                    )
+                output_path = await encoder.encode(wav_path, audio_format, bitrate)
+                # Audio of a fallback model isn't cached under the requested one
+                if key and used_model_id == model_id:
+                    try:
+                        await asyncio.to_thread(phrase_cache.put, key, output_path)
+                    except Exception:
+                        logger.opt(exception=True).warning(
+                            "Failed to cache audio", request_id=request_id
+                        )
+                etag = await asyncio.to_thread(file_sha256, output_path)
 
             result = {
                 "request_id": request_id,
                 "status": "completed",
                 "result_path": str(output_path),
+                "etag": etag,
             }
         except Exception as e:
             logger.exception(e)
@@ -57,3 +120,157 @@ async def process_message(
             ),
             routing_key="result_queue",
         )
+
+
+async def synthesize(
+    tts_generator: TTSGenerator, batcher: TTSBatcher, text: str, model_id: str
+) -> Tuple[np.ndarray, int, str]:
+    """Audio of text, its sample rate and the model that produced it."""
+    if model_id in BATCHED_MODEL_IDS:
+        audio, sr = await batcher.submit(text, model_id)
+        return audio, sr, model_id
+    if model_id == ONLINE_MODEL_ID:
+        # edge-tts is network I/O and runs on the event loop
+        return await online_tts.synthesize(
+            text,
+            offline=lambda: executor.run_in_thread(
+                FALLBACK_MODEL_ID,
+                tts_generator.synthesize,
+                text,
+                model_id=FALLBACK_MODEL_ID,
+            ),
+        )
+    return await executor.run_in_thread(
+        model_id, tts_generator.synthesize, text, model_id=model_id
+    )
+
+
+async def _cancel_all(tasks: collections.deque):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    tasks.clear()
+
+
+async def synthesize_segments(
+    result_channel: aio_pika.Channel,
+    tts_generator: TTSGenerator,
+    batcher: TTSBatcher,
+    request_id: str,
+    text: str,
+    model_id: str,
+    output_path: str,
+) -> str:
+    """
+    Synthesize a long text as segments in parallel into a WAV at output_path,
+    joined with crossfades, returns the model used.
+
+    Up to TTS_SEGMENT_CONCURRENCY segments of a request are in flight (the
+    executor still limits each model). Segments are written in order as they
+    finish, so only those in flight are held in memory, and a "progress"
+    result is published after each one.
+    """
+    segments = split_segments(text)
+    if not segments:
+        raise ValueError("Nothing to synthesize")
+    concurrency = config.get("TTS_SEGMENT_CONCURRENCY", 4)
+    crossfade_ms = config.get("TTS_CROSSFADE_MS", 30)
+    writer = None
+    pending = collections.deque()
+    try:
+        index = 0
+        while index < len(segments):
+            # Keep the next segments in flight, in order
+            while len(pending) < concurrency and index + len(pending) < len(segments):
+                segment = segments[index + len(pending)]
+                pending.append(
+                    asyncio.ensure_future(
+                        synthesize(tts_generator, batcher, segment, model_id)
+                    )
+                )
+            audio, sr, used_model_id = await pending.popleft()
+            if used_model_id != model_id:
+                # edge-tts fell back: start over with one voice for the whole
+                # text, this segment included
+                logger.info("Fallback in a segment, redoing the text")
+                model_id = used_model_id
+                await _cancel_all(pending)
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                index = 0
+                continue
+            if writer is None:
+                writer = StreamingWavWriter(
+                    output_path, sr, crossfade=int(sr * crossfade_ms / 1000)
+                )
+            await asyncio.to_thread(writer.write, audio, sr)
+            index += 1
+            if len(segments) > 1:
+                result = {
+                    "request_id": request_id,
+                    "status": "progress",
+                    "segment": index,
+                    "segments": len(segments),
+                }
+                await result_channel.default_exchange.publish(
+                    aio_pika.Message(
+                        body=json.dumps(result).encode(),
+                        headers={"request_id": request_id},
+                    ),
+                    routing_key="result_queue",
+                )
+    finally:
+        await _cancel_all(pending)
+        if writer is not None:
+            writer.close()
+    return model_id
+
+
+async def synthesize_stream(
+    result_channel: aio_pika.Channel,
+    tts_generator: TTSGenerator,
+    batcher: TTSBatcher,
+    request_id: str,
+    text: str,
+    model_id: str,
+    output_path: str,
+) -> str:
+    """
+    Synthesize sentence by sentence into a WAV that grows as it is written,
+    returns the model used last.
+
+    A "partial" result is published after every sentence, so the backend can
+    relay the audio while the rest of the text is still being synthesized.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        raise ValueError("Nothing to synthesize")
+    writer = None
+    try:
+        for index, sentence in enumerate(sentences):
+            # The model can change once, when edge-tts falls back
+            audio, sr, model_id = await synthesize(
+                tts_generator, batcher, sentence, model_id
+            )
+            if writer is None:
+                writer = StreamingWavWriter(output_path, sr)
+            await asyncio.to_thread(writer.write, audio, sr)
+            result = {
+                "request_id": request_id,
+                "status": "partial",
+                "result_path": str(output_path),
+                "segment": index + 1,
+                "segments": len(sentences),
+            }
+            await result_channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=json.dumps(result).encode(), headers={"request_id": request_id}
+                ),
+                routing_key="result_queue",
+            )
+            logger.debug("Segment synthesized", **result)
+    finally:
+        if writer is not None:
+            writer.close()
+    return model_id
@@ -0,0 +1,73 @@
+from config.config_handler import config
+from typing import List
+import re
+
+# Sentence ends in Latin, Persian and Arabic text, and line breaks
+SENTENCE_END = re.compile(r"(?<=[.!?؟۔])\s+|(?<=[;؛])\s+|\n+")
+PARAGRAPH_END = re.compile(r"\n\s*\n")
+# Where an over-long sentence may be cut, best first
+CLAUSE_BREAKS = ["،", ",", ":", " "]
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    pieces = []
+    while len(sentence) > max_chars:
+        cut = -1
+        for mark in CLAUSE_BREAKS:
+            cut = sentence.rfind(mark, 0, max_chars)
+            if cut > 0:
+                break
+        if cut <= 0:
+            cut = max_chars - 1
+        pieces.append(sentence[: cut + 1].strip())
+        sentence = sentence[cut + 1 :].strip()
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text into the units synthesized one at a time.
+
+    Pieces shorter than TTS_SENTENCE_MIN_CHARS are joined to the next one (a
+    lone "Hi." sounds clipped) and pieces longer than TTS_SENTENCE_MAX_CHARS
+    are cut at a clause break or space.
+    """
+    min_chars = config.get("TTS_SENTENCE_MIN_CHARS", 20)
+    max_chars = config.get("TTS_SENTENCE_MAX_CHARS", 300)
+    sentences = []
+    pending = ""
+    for piece in SENTENCE_END.split(text):
+        piece = piece.strip()
+        if not piece:
+            continue
+        pending = f"{pending} {piece}" if pending else piece
+        if len(pending) >= min_chars:
+            sentences.extend(_split_long(pending, max_chars))
+            pending = ""
+    if pending:
+        if sentences and len(sentences[-1]) + len(pending) < max_chars:
+            sentences[-1] = f"{sentences[-1]} {pending}"
+        else:
+            sentences.append(pending)
+    return sentences
+
+
+def split_segments(text: str) -> List[str]:
+    """
+    Split a long text into segments synthesized in parallel: whole sentences
+    packed up to TTS_SEGMENT_MAX_CHARS, never across a paragraph break.
+    """
+    max_chars = config.get("TTS_SEGMENT_MAX_CHARS", 400)
+    segments = []
+    for paragraph in PARAGRAPH_END.split(text):
+        segment = ""
+        for sentence in split_sentences(paragraph):
+            if segment and len(segment) + len(sentence) + 1 > max_chars:
+                segments.append(segment)
+                segment = ""
+            segment = f"{segment} {sentence}" if segment else sentence
+        if segment:
+            segments.append(segment)
+    return segments
@@ -1,10 +1,14 @@
 from loguru import logger
-import edge_tts
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from config.config_handler import config
+from core.tts_cache import DEFAULT_MODEL_IDS
+from core.normalizer import normalize_fa
+from core.phoneme_cache import phoneme_cache
+import numpy as np
 import torch
-import soundfile as sf
+import statistics
+import time
 from transformers import SpeechT5Processor, SpeechT5ForTextToSpeech, SpeechT5HifiGan
 
 logger.info("Loading synthesizer...")
@@ -42,14 +46,25 @@ models = {
 }
 
 
+# Models whose requests are synthesized in batches (see core/batcher.py)
+BATCHED_MODEL_IDS = ["male1-ar"]
+
+# Representative text per language synthesized at warm-up
+WARMUP_TEXTS = {
+    "fa": "سلام، به سامانه‌ی تبدیل متن به گفتار خوش آمدید. لطفا منتظر بمانید.",
+    "en": "Hello, welcome to the text to speech service. Please hold on.",
+    "ar": "مرحبا بكم في خدمة تحويل النص إلى كلام. يرجى الانتظار.",
+}
+
+
 class TTSGenerator:
     def __init__(self):
+        self._device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        logger.info(f"Device: {self._device}")
         self.load_models(config.MODEL_IDs.split(","))
-        self._default_model_ids = {
-            "fa": "male1-online-fa",
-            "en": "female1-en",
-            "ar": "male1-ar",
-        }
+        self._default_model_ids = DEFAULT_MODEL_IDS
+        # Vocoders replaced by a compiled or traced version, by model id
+        self._eager_vocoders = {}
 
     def delete_file_after_response(self, file_path: str):
         if os.path.exists(file_path):
@@ -72,6 +87,10 @@ class TTSGenerator:
                 if os.path.exists(config_path) and os.path.exists(model_path):
                     logger.info("Loading model...", model_id=model_id)
                     self._synthesizers[model_id] = Synthesizer(model_path, config_path)
+                    tokenizer = self._synthesizers[model_id].tts_model.tokenizer
+                    tokenizer.text_to_ids = phoneme_cache.wrap(
+                        model_id, tokenizer.text_to_ids
+                    )
                     logger.info(
                         "Model loaded", model_id=model_id, model_path=model_path
                     )
@@ -91,10 +110,11 @@ class TTSGenerator:
                 logger.info("Model loaded", model_id=model_id)
             elif models[model_id]["type"] == "transformers":
                 # https://huggingface.co/MBZUAI/speecht5_tts_clartts_ar
+                # Model, vocoder and speaker embedding stay on the device
                 self._synthesizers[model_id] = {}
                 self._synthesizers[model_id]["speaker_embedding"] = models[model_id][
                     "speaker_embedding"
-                ]
+                ].to(self._device)
                 self._synthesizers[model_id]["processor"] = (
                     SpeechT5Processor.from_pretrained(models[model_id]["model_dir"])
                 )
@@ -102,55 +122,178 @@ class TTSGenerator:
                     SpeechT5ForTextToSpeech.from_pretrained(
                         models[model_id]["model_dir"]
                     )
+                    .to(self._device)
+                    .eval()
                 )
                 self._synthesizers[model_id]["vocoder"] = (
                     SpeechT5HifiGan.from_pretrained(models[model_id]["vocoder_dir"])
+                    .to(self._device)
+                    .eval()
                 )
                 logger.info("Model loaded", model_id=model_id)
 
-    async def do_tts(
-        self, text: str, tmp_path: str, model_id: str = None, lang: str = "fa"
-    ):
+    def get_model_id(self, model_id: str = None, lang: str = "fa") -> str:
         if lang is None:
             lang = "fa"
         if model_id is None:
             model_id = self._default_model_ids[lang]
-        if model_id == "male1-online-fa":
-            try:
-                voice = "fa-IR-FaridNeural"
-                communicate = edge_tts.Communicate(text, voice)
-                communicate.save_sync(tmp_path)
-                return
-            except Exception:
-                logger.opt(exception=True).warning(
-                    "male1-online-fa not worked: using female1-fa instead"
-                )
-                model_id = "female1-fa"
-            # return FileResponse(path=tmp_path, media_type="audio/wav")
+        return model_id
+
+    def _synthesize(self, text: str, model_id: str) -> Tuple[np.ndarray, int]:
+        """Mono float32 audio of text and its sample rate."""
         if model_id in ["female1-fa", "male1-fa"]:
-            wavs = self._synthesizers[model_id].tts(text)
-            self._synthesizers[model_id].save_wav(wavs, tmp_path)
-            # return FileResponse(path=tmp_path, media_type="audio/wav")
-        elif model_id == "female1-en":
+            synthesizer = self._synthesizers[model_id]
+            wavs = synthesizer.tts(normalize_fa(text))
+            return np.asarray(wavs, dtype=np.float32), synthesizer.output_sample_rate
+        if model_id == "female1-en":
             generator = self._synthesizers[model_id](
                 text, voice=self._kokoro_voice_tensor, speed=1, split_pattern=None
             )
-            gs, ps, audio = next(generator)
-            logger.debug("TTS output", graphemes=gs, phonemes=ps)
-            sf.write(tmp_path, audio, 24000)  # save each audio file
-        elif model_id == "male1-ar":
-            inputs = self._synthesizers[model_id]["processor"](
-                text=text, return_tensors="pt"
+            # Kokoro yields one result per chunk it splits the text into
+            chunks = []
+            for gs, ps, audio in generator:
+                logger.debug("TTS output", graphemes=gs, phonemes=ps)
+                chunks.append(np.asarray(audio, dtype=np.float32))
+            if not chunks:
+                return np.zeros(0, dtype=np.float32), 24000
+            return np.concatenate(chunks), 24000
+        if model_id in BATCHED_MODEL_IDS:
+            return self.synthesize_batch([text], model_id)[0]
+        raise ValueError(f"Model {model_id} not found")
+
+    def synthesize_batch(
+        self, texts: List[str], model_id: str
+    ) -> List[Tuple[np.ndarray, int]]:
+        """
+        SpeechT5 synthesis of several texts at once: the texts are padded
+        into one batch, decoded together and vocoded by HiFi-GAN in one pass.
+        Returns (audio, sample rate) per text, in the order of texts.
+        """
+        synthesizer = self._synthesizers[model_id]
+        # Similar lengths side by side waste less of the batch on padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        inputs = synthesizer["processor"](
+            text=[texts[i] for i in order], padding=True, return_tensors="pt"
+        )
+        with torch.inference_mode():
+            waveforms, lengths = synthesizer["model"].generate_speech(
+                inputs["input_ids"].to(self._device),
+                synthesizer["speaker_embedding"],
+                attention_mask=inputs["attention_mask"].to(self._device),
+                vocoder=synthesizer["vocoder"],
+                return_output_lengths=True,
             )
-            speech = self._synthesizers[model_id]["model"].generate_speech(
-                inputs["input_ids"],
-                self._synthesizers[model_id]["speaker_embedding"],
-                vocoder=self._synthesizers[model_id]["vocoder"],
+        waveforms = waveforms.cpu().numpy()
+        results = [None] * len(texts)
+        for row, (index, length) in enumerate(zip(order, lengths)):
+            results[index] = (waveforms[row, :length], 16000)
+        return results
+
+    def synthesize(
+        self, text: str, model_id: str = None, lang: str = "fa"
+    ) -> Tuple[np.ndarray, int, str]:
+        """
+        Audio of text, its sample rate and the model that produced it. The
+        online model (male1-online-fa) is async, see core/online_tts.py.
+        """
+        model_id = self.get_model_id(model_id=model_id, lang=lang)
+        audio, sr = self._synthesize(text, model_id)
+        return audio, sr, model_id
+
+    def _get_vocoder(self, model_id: str) -> Optional[torch.nn.Module]:
+        synthesizer = self._synthesizers[model_id]
+        model_type = models[model_id]["type"]
+        if model_type == "TTS":
+            return getattr(synthesizer.tts_model, "waveform_decoder", None)
+        if model_type == "kokoro":
+            return getattr(synthesizer.model, "decoder", None)
+        if model_type == "transformers":
+            return synthesizer["vocoder"]
+        return None
+
+    def _set_vocoder(self, model_id: str, vocoder: torch.nn.Module):
+        synthesizer = self._synthesizers[model_id]
+        model_type = models[model_id]["type"]
+        if model_type == "TTS":
+            synthesizer.tts_model.waveform_decoder = vocoder
+        elif model_type == "kokoro":
+            synthesizer.model.decoder = vocoder
+        elif model_type == "transformers":
+            synthesizer["vocoder"] = vocoder
+
+    def _compile_vocoder(self, model_id: str, mode: str):
+        """
+        Replace the vocoder of a model by its torch.compile'd ("compile") or
+        TorchScript-traced ("trace") version. Only the SpeechT5 HiFi-GAN has a
+        single-tensor signature that can be traced.
+        """
+        vocoder = self._get_vocoder(model_id)
+        if vocoder is None or mode == "none":
+            return
+        if mode == "compile":
+            optimized = torch.compile(vocoder, dynamic=True)
+        elif mode == "trace":
+            if models[model_id]["type"] != "transformers":
+                logger.info("Vocoder can't be traced, kept eager", model_id=model_id)
+                return
+            example = torch.randn(
+                1, 100, vocoder.config.model_in_dim, device=self._device
             )
-            sf.write(tmp_path, speech.numpy(), samplerate=16000)
+            with torch.inference_mode():
+                optimized = torch.jit.trace(vocoder, example, check_trace=False)
         else:
-            raise ValueError(f"Model {model_id} not found")
-            # return JSONResponse(
-            #     status_code=status_code.HTTP_412_PRECONDITION_FAILED,
-            #     content={"details": "Model not found"},
-            # )
+            raise ValueError(f"TTS_VOCODER_COMPILE {mode} not supported")
+        self._eager_vocoders[model_id] = vocoder
+        self._set_vocoder(model_id, optimized)
+        logger.info("Vocoder optimized", model_id=model_id, mode=mode)
+
+    def _time_model(self, model_id: str, text: str, runs: int) -> Dict:
+        start = time.perf_counter()
+        self._synthesize(text, model_id)
+        cold = time.perf_counter() - start
+        warm = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            self._synthesize(text, model_id)
+            warm.append(time.perf_counter() - start)
+        if model_id in BATCHED_MODEL_IDS:
+            # Grow the allocator to a full batch once
+            self.synthesize_batch(
+                [text] * config.get("TTS_BATCH_MAX_SIZE", 1), model_id=model_id
+            )
+        return {
+            "cold_ms": round(cold * 1000),
+            "warm_ms": round(statistics.median(warm) * 1000) if warm else None,
+        }
+
+    def warm_up(self) -> Dict[str, Dict]:
+        """
+        Synthesize a representative text with every loaded model, so lazy
+        initialization, phonemizer setup and allocator growth (and the
+        compilation of TTS_VOCODER_COMPILE vocoders) happen before the first
+        request. Returns the cold and warm latency per model. A compiled
+        vocoder that fails falls back to its eager version.
+        """
+        mode = config.get("TTS_VOCODER_COMPILE", "none")
+        runs = config.get("TTS_WARMUP_RUNS", 2)
+        report = {}
+        for model_id in list(self._synthesizers):
+            text = WARMUP_TEXTS[models[model_id]["lang"]]
+            try:
+                self._compile_vocoder(model_id, mode)
+            except Exception:
+                logger.opt(exception=True).warning(
+                    "Failed to optimize vocoder", model_id=model_id, mode=mode
+                )
+            try:
+                report[model_id] = self._time_model(model_id, text, runs)
+            except Exception:
+                if model_id not in self._eager_vocoders:
+                    raise
+                logger.opt(exception=True).warning(
+                    "Optimized vocoder failed, using eager", model_id=model_id
+                )
+                self._set_vocoder(model_id, self._eager_vocoders.pop(model_id))
+                report[model_id] = self._time_model(model_id, text, runs)
+            logger.info("Model warmed up", model_id=model_id, **report[model_id])
+        return report
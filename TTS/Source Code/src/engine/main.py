@@ -7,6 +7,11 @@ from generators import TTSGenerator
 import aio_pika
 import asyncio
 from core.queue_utils import process_message
+from core.batcher import TTSBatcher
+from core.executor import executor
+from core.online_tts import online_tts
+from core.launcher import notify_ready, run_workers
+import torch
 
 if os.environ.get("MODE", "dev") == "prod":
     log_dir = "/approot/data"
@@ -40,28 +45,59 @@ logger.add(
 logger.info("Starting service...", version=__version__)
 
 
-async def main():
-    tts_generator = TTSGenerator()
+async def main(tts_generator: TTSGenerator):
+    batcher = TTSBatcher(
+        tts_generator,
+        max_batch_size=config.get("TTS_BATCH_MAX_SIZE", 1),
+        max_wait_ms=config.get("TTS_BATCH_MAX_WAIT_MS", 0),
+    )
     connection = await aio_pika.connect_robust(config["QUEUE_CONNECTION"])
 
     # Create separate channels for consuming and publishing
     task_channel = await connection.channel()
     result_channel = await connection.channel()
 
+    # Unacked messages RabbitMQ delivers to this process
+    await task_channel.set_qos(prefetch_count=config.get("PREFETCH_COUNT", 1))
+    # Handlers running at the same time in this process
+    semaphore = asyncio.Semaphore(config.get("CONSUMER_CONCURRENCY", 1))
+
     # Configure task queue
     task_queue = await task_channel.declare_queue("task_queue", durable=True)
 
+    async def on_message(message: aio_pika.IncomingMessage):
+        async with semaphore:
+            await process_message(message, result_channel, tts_generator, batcher)
+
     # Start consuming tasks
-    await task_queue.consume(
-        lambda message: process_message(message, result_channel, tts_generator)
-    )
+    await task_queue.consume(on_message)
+    notify_ready()
 
     # Keep connection alive
     try:
         await asyncio.Future()
     finally:
         await connection.close()
+        await online_tts.close()
+        executor.shutdown()
+
+
+def run_worker(tts_generator: TTSGenerator):
+    if config.get("TORCH_NUM_THREADS"):
+        torch.set_num_threads(config["TORCH_NUM_THREADS"])
+    # After the fork: OpenMP thread pools started by inference before a fork
+    # can hang the children
+    if config.get("TTS_WARMUP_ENABLED", True):
+        tts_generator.warm_up()
+    asyncio.run(main(tts_generator))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # Models are loaded before forking so workers share them
+    tts_generator = TTSGenerator()
+    run_workers(
+        lambda: run_worker(tts_generator),
+        num_workers=config.get("WORKER_PROCESSES", 1),
+        # Exists while every worker is warmed up and consuming (healthcheck)
+        ready_file=config.get("READY_FILE", "/tmp/tts-engine.ready"),
+    )
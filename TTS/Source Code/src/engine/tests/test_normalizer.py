@@ -0,0 +1,45 @@
+"""
+Readings of core/normalizer.py.
+
+Run from the engine directory, the config is read relative to it:
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+ENGINE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ENGINE_DIR)
+os.chdir(ENGINE_DIR)
+
+import pytest  # noqa: E402
+from core.normalizer import normalize_fa  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("3.5", "سه ممیز پنج"),
+        ("3.05", "سه ممیز صفر پنج"),
+        ("۱۲٫۰۵", "دوازده ممیز صفر پنج"),
+        ("10:30", "ده و سی دقیقه"),
+        ("08:00", "هشت"),
+        ("23:15:07", "بیست و سه و پانزده دقیقه و هفت ثانیه"),
+        ("1:5", "یک به پنج"),
+        ("نتیجه 3:2 شد", "نتیجه سه به دو شد"),
+        ("25:30", "بیست و پنج به سی"),
+        ("نسخه 2.0.1", "نسخه 2.0.1"),
+        ("5a", "5a"),
+        ("فایل mp3", "فایل mp3"),
+        ("۱۵٪", "پانزده درصد"),
+        ("۲۵۰٬۰۰۰", "دویست و پنجاه هزار"),
+        ("۰۲۱۸۸", "صفر دو یک هشت هشت"),
+        ("۱۴۰۲/۰۵/۱۲", "دوازدهم مرداد هزار و چهارصد و دو"),
+        ("5 km2", "پنج کیلومتر مربع"),
+        ("5km", "پنج کیلومتر"),
+        ("12 cm2", "دوازده سانتی‌متر مربع"),
+        ("دما ۲۳.۵ درجه است.", "دما بیست و سه ممیز پنج درجه است."),
+    ],
+)
+def test_normalize_fa(text, expected):
+    assert normalize_fa(text) == expected